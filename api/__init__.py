@@ -5,6 +5,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask import Flask, render_template, request, jsonify
 from werkzeug.exceptions import HTTPException
 from api.auth.auth import requires_auth, AuthError
+from api.cache import reset_all
 from config import config
 
 db = SQLAlchemy()
@@ -57,6 +58,7 @@ def create_app(config_name='default'):
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     db.init_app(app)
+    reset_all()
     CORS(app, resources={r"/*": {"origins": "*"}})
     api = ExtendedAPI(app)
 
@@ -130,12 +132,20 @@ def create_app(config_name='default'):
         return render_template('index.html', link=login_link)
 
     from api.resources.forecast import ForecastResource
-    from api.resources.cities import CitiesResource
+    from api.resources.cities import CitiesResource, CitiesBatchResource, \
+        CitiesNearbyResource, CitiesSuggestResource, CitiesReachableResource
     from api.resources.roadtrips import RoadtripsResource, RoadtripResource
+    from api.resources.metrics import MetricsResource
 
     api.add_resource(ForecastResource, '/api/forecast')
     api.add_resource(RoadtripResource, '/api/roadtrips/<roadtrip_id>')
     api.add_resource(RoadtripsResource, '/api/roadtrips')
     api.add_resource(CitiesResource, '/api/cities')
+    api.add_resource(CitiesBatchResource, '/api/cities/batch')
+    api.add_resource(CitiesNearbyResource, '/api/cities/nearby')
+    api.add_resource(CitiesSuggestResource, '/api/cities/suggest')
+    api.add_resource(CitiesReachableResource,
+                     '/api/cities/<int:city_id>/reachable')
+    api.add_resource(MetricsResource, '/api/metrics')
 
     return app
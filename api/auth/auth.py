@@ -1,9 +1,15 @@
-import json
+import hashlib
+import os
+import time
 from functools import wraps
-from urllib.request import urlopen
 from flask import abort, request
 from jose import jwt
 
+from api import metrics
+from api.auth.jwks import JWKSStore
+from api.auth.revocation import RevocationList
+from api.cache import LRUCache, on_reset
+
 AUTH0_DOMAIN = 'wildapps.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'fsnd-capstone'
@@ -12,6 +18,37 @@ REDIRECT_URL = 'http://localhost:5000/callback'
 AUTH0_AUTHORIZE_URL = f'https://{AUTH0_DOMAIN}/authorize?audience=' \
                       f'{API_AUDIENCE}&response_type=token&client_id=' \
                       f'{AUTH0_CLIENT_ID}&redirect_uri={REDIRECT_URL}'
+JWKS_URL = os.getenv(
+    'AUTH0_JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+
+jwks_store = JWKSStore(
+    JWKS_URL,
+    ttl=int(os.getenv('AUTH0_JWKS_TTL', 3600)),
+    refresh_margin=int(os.getenv('AUTH0_JWKS_REFRESH_MARGIN', 300)),
+    min_refresh_interval=int(os.getenv('AUTH0_JWKS_MIN_REFRESH', 30)),
+    shared_path=os.getenv('AUTH0_JWKS_SHARED_PATH'),
+)
+
+# internal callers can skip Auth0 with short-lived HS256 tokens signed
+# with this secret; leaving it unset disables service tokens entirely
+SERVICE_TOKEN_SECRET = os.getenv('SERVICE_TOKEN_SECRET')
+SERVICE_TOKEN_ALGORITHMS = ['HS256']
+SERVICE_TOKEN_ISSUER = 'roadtrip-service'
+SERVICE_TOKEN_MAX_TTL = int(os.getenv('SERVICE_TOKEN_MAX_TTL', 3600))
+
+# verified payloads keyed by a digest of the raw token, each entry expires
+# at the token's own 'exp' claim
+token_cache = LRUCache(maxsize=int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 4096)))
+metrics.register('verified_tokens', token_cache.stats)
+
+revocations = RevocationList(
+    capacity=int(os.getenv('REVOCATION_FILTER_CAPACITY', 10000)),
+    refresh_interval=int(os.getenv('REVOCATION_REFRESH_INTERVAL', 30)),
+    sync_overlap=int(os.getenv('REVOCATION_SYNC_OVERLAP', 1000)),
+    rebuild_interval=int(os.getenv('REVOCATION_REBUILD_INTERVAL', 3600)),
+)
+on_reset(revocations.reset)
+metrics.register('revocations', revocations.stats)
 
 
 # AuthError Exception
@@ -84,27 +121,16 @@ def check_permissions(permission, payload):
 def verify_decode_jwt(token):   # pragma: no cover
     """
     source: Udacity-provided sample code
+    signing keys come from jwks_store instead of a fresh JWKS download
     """
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-
+    rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -141,6 +167,123 @@ def verify_decode_jwt(token):   # pragma: no cover
     }, 403)
 
 
+def issue_service_token(permissions, subject='service', ttl=900):
+    """
+    signs a short-lived HS256 token for internal callers carrying the same
+    'permissions' array Auth0 puts in its access tokens
+    """
+    if not SERVICE_TOKEN_SECRET:
+        raise ValueError('SERVICE_TOKEN_SECRET is not set')
+    if ttl > SERVICE_TOKEN_MAX_TTL:
+        raise ValueError(f'ttl may not exceed {SERVICE_TOKEN_MAX_TTL}s')
+    now = int(time.time())
+    return jwt.encode({
+        'iss': SERVICE_TOKEN_ISSUER,
+        'sub': subject,
+        'aud': API_AUDIENCE,
+        'iat': now,
+        'exp': now + ttl,
+        'permissions': list(permissions),
+    }, SERVICE_TOKEN_SECRET, algorithm=SERVICE_TOKEN_ALGORITHMS[0])
+
+
+def is_service_token(token):
+    try:
+        header = jwt.get_unverified_header(token)
+    except Exception:
+        return False
+    return header.get('alg') in SERVICE_TOKEN_ALGORITHMS
+
+
+def verify_service_token(token):
+    """
+    verifies an HS256 service token; only ever accepts HS256 with our own
+    secret, so an Auth0 token can't be replayed down this path or vice versa
+    """
+    if not SERVICE_TOKEN_SECRET:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Service tokens are not accepted.'
+        }, 401)
+    try:
+        payload = jwt.decode(
+            token,
+            SERVICE_TOKEN_SECRET,
+            algorithms=SERVICE_TOKEN_ALGORITHMS,
+            audience=API_AUDIENCE,
+            issuer=SERVICE_TOKEN_ISSUER,
+            options={'require_iat': True, 'require_exp': True}
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthError({
+            'code': 'token_expired',
+            'description': 'Token expired.'
+        }, 401)
+    except jwt.JWTClaimsError:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience '
+                           'and issuer.'
+        }, 401)
+    except Exception:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+
+    if payload['exp'] - payload['iat'] > SERVICE_TOKEN_MAX_TTL:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Service token lifetime is too long.'
+        }, 401)
+    return payload
+
+
+def _token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+def get_verified_payload(token):
+    """
+    returns the decoded payload for `token`, skipping signature and claims
+    verification when the same token was already verified and hasn't
+    reached its 'exp' yet; revoked tokens are refused either way
+    """
+    digest = _token_digest(token)
+    if revocations.is_revoked(digest):
+        raise AuthError({
+            'code': 'token_revoked',
+            'description': 'Token has been revoked.'
+        }, 401)
+
+    payload = token_cache.get(digest)
+    if payload is None:
+        if is_service_token(token):
+            payload = verify_service_token(token)
+        else:
+            payload = verify_decode_jwt(token)
+        if isinstance(payload, dict) and 'exp' in payload:
+            token_cache.set(digest, payload, expires_at=payload['exp'])
+    return payload
+
+
+def revoke_token(token, expires_at=None):
+    """
+    refuses `token` from now on, even while it is still cached as verified;
+    the revocation expires with the token's own 'exp' unless `expires_at`
+    says otherwise
+    """
+    if expires_at is None:
+        try:
+            expires_at = jwt.get_unverified_claims(token).get('exp')
+        except jwt.JWTError:
+            # not a JWT we can read, keep refusing it for good
+            pass
+    digest = _token_digest(token)
+    token_cache.pop(digest)
+    revocations.revoke(digest, expires_at)
+
+
 def requires_auth(permission=''):
     """
     it should use the get_token_auth_header method to get the token
@@ -158,7 +301,7 @@ def requires_auth(permission=''):
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
             try:
-                payload = verify_decode_jwt(token)
+                payload = get_verified_payload(token)
                 check_permissions(permission, payload)
             except AuthError as e:
                 abort(e.status_code)
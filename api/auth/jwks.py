@@ -0,0 +1,172 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.request import urlopen
+
+
+class JWKSStore:
+    """
+    in-process cache of the signing keys published at a JWKS url
+
+    keys are fetched once and kept for `ttl` seconds; once they are within
+    `refresh_margin` seconds (at most half the ttl) of expiring, the next
+    lookup kicks off a background refresh and keeps serving the current
+    keys meanwhile. a token carrying a `kid` we haven't seen triggers an
+    immediate re-fetch; no fetch of either kind starts more often than
+    every `min_refresh_interval` seconds
+
+    the url can be anything urlopen understands, so a file:// url or a
+    local stub server can stand in for Auth0
+
+    with `shared_path` set (e.g. a file under /dev/shm), the decoded keys
+    are also kept in that file so every worker process on the box shares
+    one copy: a worker that needs keys reads the file first, and only the
+    worker holding the file lock goes upstream when it is stale
+    """
+    def __init__(self, url, ttl=3600, refresh_margin=300,
+                 min_refresh_interval=30, timeout=5, shared_path=None):
+        self.url = url
+        self.shared_path = shared_path
+        self.ttl = ttl
+        self.refresh_margin = min(refresh_margin, ttl // 2)
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def _download(self):
+        with urlopen(self.url, timeout=self.timeout) as res:
+            jwks = json.loads(res.read())
+        return {
+            key['kid']: {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            } for key in jwks['keys'] if 'kid' in key
+        }
+
+    def _store(self, keys, age=0):
+        self._keys = keys
+        self._fetched_at = time.monotonic() - age
+
+    @contextmanager
+    def _shared_lock(self):
+        with open(f'{self.shared_path}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_shared(self):
+        try:
+            with open(self.shared_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_shared(self, keys):
+        tmp = f'{self.shared_path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'fetched_at': time.time(), 'keys': keys}, f)
+        os.replace(tmp, self.shared_path)
+
+    def _refresh_shared(self, force):
+        with self._shared_lock():
+            shared = self._read_shared()
+            if shared is not None:
+                age = max(time.time() - shared['fetched_at'], 0)
+                # another worker already did the work, or re-fetched so
+                # recently that we shouldn't hit the url again
+                usable = age < self.min_refresh_interval if force else \
+                    age < self.ttl - self.refresh_margin
+                if usable or (force and shared['keys'] != self._keys):
+                    self._store(shared['keys'], age)
+                    return shared['keys']
+            keys = self._download()
+            self.fetches += 1
+            self._write_shared(keys)
+        self._store(keys)
+        return keys
+
+    def refresh(self, force=False):
+        """
+        fetches the JWKS document and replaces the cached keys
+
+        in shared mode a fresh enough copy left by another worker is used
+        instead; `force` (an unknown kid) only accepts a copy that differs
+        from ours or was fetched within `min_refresh_interval`
+        """
+        self._last_attempt = time.monotonic()
+        if self.shared_path is not None:
+            return self._refresh_shared(force)
+        keys = self._download()
+        self.fetches += 1
+        self._store(keys)
+        return keys
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:  # pragma: no cover
+            # keep serving the keys we have, the next lookup will retry
+            pass
+        finally:
+            self._refreshing = False
+
+    def _may_refetch(self, now):
+        return self._last_attempt is None or \
+            now - self._last_attempt >= self.min_refresh_interval
+
+    def get_key(self, kid):
+        """
+        returns the RSA key dict for `kid`, or None if the JWKS doesn't have
+        one even after a (rate-limited) re-fetch
+        """
+        now = time.monotonic()
+        age = None if self._fetched_at is None else now - self._fetched_at
+
+        if age is None or (age >= self.ttl and self._may_refetch(now)):
+            with self._lock:
+                if self._fetched_at is None or \
+                        time.monotonic() - self._fetched_at >= self.ttl:
+                    try:
+                        self.refresh()
+                    except Exception:
+                        # Auth0 is unreachable; stale keys beat no keys
+                        if not self._keys:
+                            raise
+        elif age >= self.ttl - self.refresh_margin and \
+                not self._refreshing and self._may_refetch(now):
+            with self._lock:
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(
+                        target=self._refresh_in_background, daemon=True
+                    ).start()
+
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        # unknown kid, Auth0 may have rotated its signing keys
+        with self._lock:
+            key = self._keys.get(kid)
+            if key is None and self._may_refetch(time.monotonic()):
+                key = self.refresh(force=True).get(kid)
+        return key
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._last_attempt = None
@@ -0,0 +1,170 @@
+import math
+import threading
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+
+class BloomFilter:
+    """
+    fixed-size Bloom filter over SHA-256 digests
+
+    the digest is already uniformly distributed, so the k bit positions
+    come from double hashing two 64-bit slices of it instead of hashing
+    the key again
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) /
+                            math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / self.capacity *
+                                    math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, digest):
+        bits = self.bits
+        for pos in self._positions(digest):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """
+    in-process view of the revoked_tokens table
+
+    every worker keeps a Bloom filter of revoked token digests and pulls
+    rows newer than its high-water mark at most once per
+    `refresh_interval` seconds. a token that misses the filter is
+    definitely not revoked, so the common path needs no query; only
+    filter positives are confirmed against the database
+
+    ids are handed out before commit, so a row can become visible after
+    rows with higher ids; each sync re-reads the `sync_overlap` ids below
+    the mark to pick those up, and the filter is rebuilt from the whole
+    table every `rebuild_interval` seconds for anything committed later
+    still
+    """
+    def __init__(self, capacity=10000, error_rate=0.001,
+                 refresh_interval=30, sync_overlap=1000,
+                 rebuild_interval=3600):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.sync_overlap = sync_overlap
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        self.high_water = 0
+        self._synced_at = None
+        self._rebuilt_at = None
+        self.positives = 0
+        self.confirmed = 0
+
+    def _rebuild(self, rows):
+        # a fresh filter from the whole table, grown to fit and without
+        # expired rows
+        now = int(time.time())
+        live = [r for r in rows if r.expires_at is None or r.expires_at > now]
+        self.capacity = max(self.capacity, 2 * len(live))
+        self.bloom = BloomFilter(self.capacity, self.error_rate)
+        for row in live:
+            self.bloom.add(bytes.fromhex(row.token_digest))
+
+    def sync(self, force=False):
+        """
+        adds revocations newer than the high-water mark, and any that
+        committed late within `sync_overlap` ids below it, to the filter
+        """
+        from api.database.models import RevokedToken
+
+        now = time.monotonic()
+        if not force and self._synced_at is not None and \
+                now - self._synced_at < self.refresh_interval:
+            return
+        with self._lock:
+            # another thread may have synced while we waited for the lock
+            now = time.monotonic()
+            if not force and self._synced_at is not None and \
+                    now - self._synced_at < self.refresh_interval:
+                return
+            rows = None
+            if self._rebuilt_at is not None and \
+                    now - self._rebuilt_at < self.rebuild_interval:
+                rows = RevokedToken.query.filter(
+                    RevokedToken.id > self.high_water - self.sync_overlap
+                ).all()
+                new = [bytes.fromhex(row.token_digest) for row in rows]
+                # rows in the overlap are mostly in the filter already
+                new = [digest for digest in new if digest not in self.bloom]
+                if self.bloom.count + len(new) > self.bloom.capacity:
+                    rows = None
+                else:
+                    for digest in new:
+                        self.bloom.add(digest)
+            if rows is None:
+                rows = RevokedToken.query.all()
+                self._rebuild(rows)
+                self._rebuilt_at = now
+            if rows:
+                self.high_water = max(self.high_water,
+                                      max(row.id for row in rows))
+            self._synced_at = now
+
+    def is_revoked(self, digest):
+        """
+        `digest` is the raw SHA-256 digest of the bearer token
+        """
+        self.sync()
+        if digest not in self.bloom:
+            return False
+
+        from api.database.models import RevokedToken
+
+        self.positives += 1
+        found = RevokedToken.query.filter_by(
+            token_digest=digest.hex()
+        ).first() is not None
+        if found:
+            self.confirmed += 1
+        return found
+
+    def revoke(self, digest, expires_at=None):
+        """
+        records a revocation; this worker sees it immediately, the others
+        on their next sync. revoking a token twice is fine
+        """
+        from api import db
+        from api.database.models import RevokedToken
+
+        try:
+            RevokedToken(digest.hex(), expires_at).insert()
+        except IntegrityError:
+            # already revoked
+            db.session.rollback()
+        with self._lock:
+            self.bloom.add(digest)
+
+    def stats(self):
+        return {
+            'filter_entries': self.bloom.count,
+            'filter_bits': self.bloom.size,
+            'high_water': self.high_water,
+            'positives': self.positives,
+            'confirmed': self.confirmed,
+        }
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+_resets = []
+
+
+def on_reset(fn):
+    """
+    registers `fn` to run whenever the app is (re)created, for process-wide
+    state that mirrors database rows and would go stale against a new db
+    """
+    _resets.append(fn)
+    return fn
+
+
+def reset_all():
+    for fn in _resets:
+        fn()
+
+
+class LRUCache:
+    """
+    bounded, thread-safe least-recently-used cache
+
+    entries can carry their own expiry (a time.time() epoch); expired
+    entries are dropped on lookup. `default_ttl`, when set, is used for
+    entries stored without an explicit expiry
+    """
+    def __init__(self, maxsize=1024, default_ttl=None):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.time():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.default_ttl is not None:
+            expires_at = time.time() + self.default_ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
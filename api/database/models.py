@@ -1,7 +1,12 @@
+import time
+
 import bleach
 from sqlalchemy import Column, String, Integer, Float
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
 import json
 from api import db
+from api.database.registry import city_key, city_registry
 
 
 class EmptyClass(object):
@@ -60,6 +65,8 @@ class City(db.Model):
     state = Column(String(2), nullable=False)
     lat = Column(Float, nullable=False)
     lng = Column(Float, nullable=False)
+    # canonical lowercase 'city,state', one row per city
+    key = Column(String(84), nullable=False, unique=True, index=True)
 
     def __init__(self, name, state, lat, lng, city_id=None):
         if name is not None:
@@ -75,6 +82,8 @@ class City(db.Model):
             self.name = name.title()
         if state:
             self.state = state.upper()
+        if name and state:
+            self.key = city_key(name, state)
         self.lat = lat
         self.lng = lng
         if city_id is not None:
@@ -89,6 +98,31 @@ class City(db.Model):
         db.session.add(self)
         db.session.commit()
 
+    @classmethod
+    def upsert(cls, name, state, lat, lng):
+        """
+        inserts the city unless a row with the same canonical key exists,
+        and returns whichever row ends up stored; safe against concurrent
+        requests geocoding the same city
+        """
+        city = cls(name=name, state=state, lat=lat, lng=lng)
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(
+                postgresql.insert(cls.__table__).values(
+                    name=city.name, state=city.state, key=city.key,
+                    lat=city.lat, lng=city.lng
+                ).on_conflict_do_nothing(index_elements=['key'])
+            )
+            db.session.commit()
+            return cls.query.filter_by(key=city.key).one()
+
+        try:
+            city.insert()
+            return city
+        except IntegrityError:
+            db.session.rollback()
+            return cls.query.filter_by(key=city.key).one()
+
     def city_state(self):
         return f'{self.name}, {self.state}'
 
@@ -112,6 +146,16 @@ class RoadTrip(db.Model):
         db.ForeignKey('cities.id'),
         nullable=False
     )
+    # drive time between the cities, stored whenever they are written;
+    # null until the route could be looked up
+    travel_seconds = Column(Integer, nullable=True)
+    travel_time = Column(String(40), nullable=True)
+    # epoch seconds when the drive time was stored
+    route_updated_at = Column(Integer, nullable=True)
+
+    # waypoints between the start and end city, in driving order
+    stops = db.relationship('RoadTripStop', order_by='RoadTripStop.position',
+                            cascade='all, delete-orphan')
 
     def __init__(self, name, start_city_id, end_city_id):
         if name is not None:
@@ -124,14 +168,55 @@ class RoadTrip(db.Model):
         self.end_city_id = end_city_id
 
     def start_city(self):
-        chk = db.session.query(City).get(self.start_city_id)
-        if chk:
-            return chk
+        return city_registry.get(self.start_city_id)
 
     def end_city(self):
-        chk = db.session.query(City).get(self.end_city_id)
-        if chk:
-            return chk
+        return city_registry.get(self.end_city_id)
+
+    def stop_ids(self):
+        return [stop.city_id for stop in self.stops]
+
+    def set_stops(self, city_ids):
+        """
+        replaces the trip's waypoints with `city_ids`, in that order
+        """
+        self.stops = [RoadTripStop(position, city_id)
+                      for position, city_id in enumerate(city_ids)]
+
+    def cities(self):
+        """
+        CityRecords for the start city, each stop and the end city
+        """
+        return [city_registry.get(city_id) for city_id in
+                [self.start_city_id] + self.stop_ids() + [self.end_city_id]]
+
+    def set_route(self, eta):
+        """
+        stores a route_distance_time result on the trip
+        """
+        self.travel_time = eta['string']
+        self.travel_seconds = eta.get('seconds')
+        self.route_updated_at = int(time.time())
+
+    def clear_route(self):
+        """
+        forgets the stored drive time, e.g. once the trip's cities change
+        and the new route could not be looked up
+        """
+        self.travel_time = None
+        self.travel_seconds = None
+        self.route_updated_at = None
+
+    def stored_eta(self):
+        """
+        the stored drive time shaped like a route_distance_time result, or
+        None if it was never stored
+        """
+        if self.travel_time is None:
+            return None
+        if self.travel_seconds is None:
+            return {'string': self.travel_time}
+        return {'string': self.travel_time, 'seconds': self.travel_seconds}
 
     def insert(self):
         """
@@ -156,3 +241,125 @@ class RoadTrip(db.Model):
         """
         db.session.delete(self)
         db.session.commit()
+
+
+class RoadTripStop(db.Model):
+    """
+    RoadTripStop Model
+    one waypoint of a road trip; `position` orders the stops
+    """
+    __tablename__ = 'roadtrip_stops'
+
+    # surrogate key, so reordering a trip's stops never collides with the
+    # rows it replaces
+    id = Column(Integer, primary_key=True)
+    roadtrip_id = Column(Integer, db.ForeignKey('roadtrips.id'),
+                         nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    city_id = Column(Integer, db.ForeignKey('cities.id'), nullable=False)
+
+    def __init__(self, position, city_id):
+        self.position = position
+        self.city_id = city_id
+
+
+class RevokedToken(db.Model):
+    """
+    RevokedToken Model
+    bearer tokens that must be refused before their own 'exp'
+    """
+    __tablename__ = 'revoked_tokens'
+
+    # Auto-incrementing, unique primary key; also the high-water mark the
+    # in-process revocation filter syncs from
+    id = Column(Integer, primary_key=True)
+    # hex SHA-256 digest of the raw token
+    token_digest = Column(String(64), unique=True, nullable=False)
+    # the token's 'exp', once it passes the row can be pruned
+    expires_at = Column(Integer, nullable=True)
+
+    def __init__(self, token_digest, expires_at=None):
+        self.token_digest = token_digest
+        self.expires_at = expires_at
+
+    def insert(self):
+        """
+        inserts a new model into a database
+        the model must have a unique token digest
+        """
+        db.session.add(self)
+        db.session.commit()
+
+
+class Route(db.Model):
+    """
+    Route Model
+    drive distance and time between two cities, as last fetched from
+    MapQuest directions; rows older than the route TTL are refetched
+    """
+    __tablename__ = 'routes'
+
+    start_city_id = Column(Integer, db.ForeignKey('cities.id'),
+                           primary_key=True)
+    end_city_id = Column(Integer, db.ForeignKey('cities.id'),
+                         primary_key=True)
+    # drive time and miles, null when there is no route
+    seconds = Column(Integer, nullable=True)
+    distance = Column(Float, nullable=True)
+    # human readable drive time, e.g. '1 hour, 23 minutes'
+    travel_time = Column(String(40), nullable=False)
+    # epoch seconds when MapQuest was asked; workers read in new routes by it
+    fetched_at = Column(Integer, nullable=False, index=True)
+
+    def __init__(self, start_city_id, end_city_id, travel_time, fetched_at,
+                 seconds=None, distance=None):
+        self.start_city_id = start_city_id
+        self.end_city_id = end_city_id
+        self.travel_time = travel_time
+        self.fetched_at = fetched_at
+        self.seconds = seconds
+        self.distance = distance
+
+    def as_eta(self):
+        """
+        the route shaped like LocationService.route_distance_time's result
+        """
+        if self.seconds is None:
+            return {'string': self.travel_time}
+        return {
+            'string': self.travel_time,
+            'seconds': self.seconds,
+            'distance': self.distance,
+        }
+
+    @classmethod
+    def save(cls, route):
+        """
+        inserts or refreshes the row for the route's city pair
+        """
+        cls.save_all([route])
+
+    @classmethod
+    def save_all(cls, routes):
+        """
+        inserts or refreshes the rows for many city pairs in one
+        transaction
+        """
+        if db.engine.dialect.name == 'postgresql':
+            stmt = postgresql.insert(cls.__table__).values([{
+                'start_city_id': route.start_city_id,
+                'end_city_id': route.end_city_id,
+                'seconds': route.seconds,
+                'distance': route.distance,
+                'travel_time': route.travel_time,
+                'fetched_at': route.fetched_at,
+            } for route in routes])
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['start_city_id', 'end_city_id'],
+                set_={k: stmt.excluded[k] for k in
+                      ('seconds', 'distance', 'travel_time', 'fetched_at')}
+            ))
+        else:
+            for route in routes:
+                db.session.merge(route)
+        db.session.commit()
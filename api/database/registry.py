@@ -0,0 +1,158 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+from api import metrics
+from api.cache import on_reset
+
+
+def city_key(name, state):
+    """
+    normalized 'city,state' lookup key, e.g. ' arvada ', 'co' -> 'arvada,co'
+    """
+    return f"{' '.join(name.split()).lower()},{state.strip().lower()}"
+
+
+class CityRecord(namedtuple('CityRecord', 'id name state lat lng')):
+    """
+    compact, immutable copy of a City row
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_city(cls, city):
+        return cls(city.id, city.name, city.state, city.lat, city.lng)
+
+    def city_state(self):
+        return f'{self.name}, {self.state}'
+
+
+class CityRegistry:
+    """
+    process-wide, bounded cache of City rows indexed by id and by
+    normalized 'city,state'
+
+    city rows never change once inserted, so records are kept until they
+    fall out of the LRU; lookups that miss are filled from the database
+    """
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._by_id = OrderedDict()
+        self._by_key = {}
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self.hits = 0
+        self.misses = 0
+
+    def subscribe(self, fn):
+        """
+        calls `fn(record)` for every city passing through add(), which
+        includes every city the app inserts; lets in-memory indexes over
+        cities grow incrementally
+        """
+        self._subscribers.append(fn)
+
+    def add(self, city):
+        """
+        stores a City (or CityRecord) and returns its CityRecord
+        """
+        record = city if isinstance(city, CityRecord) else \
+            CityRecord.from_city(city)
+        for fn in self._subscribers:
+            fn(record)
+        with self._lock:
+            self._by_id[record.id] = record
+            self._by_id.move_to_end(record.id)
+            self._by_key[city_key(record.name, record.state)] = record.id
+            while len(self._by_id) > self.maxsize:
+                _, evicted = self._by_id.popitem(last=False)
+                self._by_key.pop(city_key(evicted.name, evicted.state), None)
+        return record
+
+    def _cached(self, city_id):
+        with self._lock:
+            record = self._by_id.get(city_id)
+            if record is not None:
+                self._by_id.move_to_end(city_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return record
+
+    def get(self, city_id):
+        """
+        returns the CityRecord for `city_id`, or None if there is no such row
+        """
+        if city_id is None:
+            return None
+        record = self._cached(city_id)
+        if record is not None:
+            return record
+
+        from api.database.models import City
+
+        city = City.query.get(city_id)
+        return None if city is None else self.add(city)
+
+    def find_cached(self, key):
+        """
+        returns the CityRecord for a normalized key if it is in memory,
+        without going to the database
+        """
+        city_id = self._by_key.get(key)
+        return None if city_id is None else self._cached(city_id)
+
+    def find(self, name, state):
+        """
+        returns the CityRecord matching `name` and `state` regardless of
+        case or extra whitespace, or None if we don't know the city
+        """
+        key = city_key(name, state)
+        city_id = self._by_key.get(key)
+        if city_id is not None:
+            record = self._cached(city_id)
+            if record is not None:
+                return record
+        else:
+            with self._lock:
+                self.misses += 1
+
+        from api.database.models import City
+
+        city = City.query.filter_by(key=key).one_or_none()
+        return None if city is None else self.add(city)
+
+    def discard(self, city_id):
+        """
+        forgets `city_id`, e.g. an id that was never stored after all
+        """
+        with self._lock:
+            record = self._by_id.pop(city_id, None)
+            if record is not None:
+                key = city_key(record.name, record.state)
+                if self._by_key.get(key) == city_id:
+                    del self._by_key[key]
+
+    def clear(self):
+        with self._lock:
+            self._by_id.clear()
+            self._by_key.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def stats(self):
+        return {
+            'size': len(self._by_id),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+city_registry = CityRegistry(
+    maxsize=int(os.getenv('CITY_REGISTRY_SIZE', 10000)))
+on_reset(city_registry.clear)
+metrics.register('city_registry', city_registry.stats)
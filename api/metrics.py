@@ -0,0 +1,12 @@
+_sources = {}
+
+
+def register(name, source):
+    """
+    registers a callable returning a dict of counters under `name`
+    """
+    _sources[name] = source
+
+
+def snapshot():
+    return {name: source() for name, source in sorted(_sources.items())}
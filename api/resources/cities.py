@@ -9,6 +9,32 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from api import requires_auth, db
 from api.database.models import City, RoadTrip
+from api.database.registry import city_registry
+from api.services.location import LocationService, format_seconds
+from api.services.spatial import city_grid
+from api.services.suggest import city_suggester
+from api.services.traveltimes import travel_times
+
+# most locations a single batch request may resolve
+MAX_BATCH_LOCATIONS = 1000
+MAX_NEARBY_RADIUS = 3000
+MAX_NEARBY_LIMIT = 100
+MAX_SUGGEST_LIMIT = 25
+MAX_REACHABLE_HOURS = 48
+MAX_REACHABLE_LIMIT = 500
+
+
+def _float_arg(name, default, low, high, errors):
+    value = request.args.get(name, default)
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        errors.append(f"required '{name}' parameter must be a number")
+        return None
+    if not low <= value <= high:
+        errors.append(f"'{name}' must be between {low} and {high}")
+        return None
+    return value
 
 
 class CitiesResource(Resource):
@@ -34,3 +60,135 @@ class CitiesResource(Resource):
             'starting_cities': starting_cities,
             'ending_cities': ending_cities,
         }, 200
+
+
+class CitiesBatchResource(Resource):
+    method_decorators = {
+        'post': [requires_auth('create:roadtrips')]
+    }
+
+    def post(self, *args, **kwargs):
+        data = json.loads(request.data or '{}')
+        locations = data.get('locations') if isinstance(data, dict) else None
+        errors = []
+        if not isinstance(locations, list) or len(locations) == 0:
+            errors.append("required 'locations' parameter must be a "
+                          "non-empty list")
+        elif len(locations) > MAX_BATCH_LOCATIONS:
+            errors.append(f"'locations' may hold at most "
+                          f"{MAX_BATCH_LOCATIONS} entries")
+        if errors:
+            return {
+                'success': False,
+                'error': 400,
+                'errors': errors
+            }, 400
+
+        return {
+            'success': True,
+            'results': LocationService.get_latlng_batch(locations),
+        }, 200
+
+
+class CitiesNearbyResource(Resource):
+    method_decorators = {
+        'get': [requires_auth('get:roadtrips')]
+    }
+
+    def get(self, *args, **kwargs):
+        errors = []
+        lat = _float_arg('lat', None, -90, 90, errors)
+        lng = _float_arg('lng', None, -180, 180, errors)
+        radius = _float_arg('radius', 50, 0, MAX_NEARBY_RADIUS, errors)
+        limit = _float_arg('limit', 10, 1, MAX_NEARBY_LIMIT, errors)
+        if errors:
+            return {
+                'success': False,
+                'error': 400,
+                'errors': errors
+            }, 400
+
+        results = []
+        for city_id, miles in city_grid.nearby(lat, lng, radius, int(limit)):
+            city = city_registry.get(city_id)
+            if city is not None:
+                results.append({
+                    'id': city.id,
+                    'city': city.city_state(),
+                    'lat': city.lat,
+                    'lng': city.lng,
+                    'distance_miles': round(miles, 1),
+                })
+        return {
+            'success': True,
+            'results': results,
+        }, 200
+
+
+class CitiesSuggestResource(Resource):
+    method_decorators = {
+        'get': [requires_auth('get:roadtrips')]
+    }
+
+    def get(self, *args, **kwargs):
+        errors = []
+        q = request.args.get('q', '')
+        if not q.strip():
+            errors.append("required 'q' parameter is missing")
+        limit = _float_arg('limit', 10, 1, MAX_SUGGEST_LIMIT, errors)
+        if errors:
+            return {
+                'success': False,
+                'error': 400,
+                'errors': errors
+            }, 400
+
+        return {
+            'success': True,
+            'results': [
+                {'id': city_id, 'city': city, 'trips': trips}
+                for city_id, city, trips in
+                city_suggester.suggest(q, int(limit))
+            ],
+        }, 200
+
+
+class CitiesReachableResource(Resource):
+    method_decorators = {
+        'get': [requires_auth('get:roadtrips')]
+    }
+
+    def get(self, *args, **kwargs):
+        city = city_registry.get(kwargs['city_id'])
+        if city is None:
+            return abort(404)
+
+        errors = []
+        max_hours = _float_arg('max_hours', None, 0, MAX_REACHABLE_HOURS,
+                               errors)
+        limit = _float_arg('limit', 100, 1, MAX_REACHABLE_LIMIT, errors)
+        if errors:
+            return {
+                'success': False,
+                'error': 400,
+                'errors': errors
+            }, 400
+
+        known, reachable = travel_times.reachable(
+            city.id, max_hours * 3600, int(limit))
+        results = []
+        for city_id, seconds in reachable:
+            destination = city_registry.get(city_id)
+            if destination is not None:
+                results.append({
+                    'id': destination.id,
+                    'city': destination.city_state(),
+                    'travel_time': format_seconds(seconds),
+                    'seconds': int(seconds),
+                })
+        return {
+            'success': True,
+            'city': city.city_state(),
+            'known_destinations': known,
+            'results': results,
+        }, 200
@@ -8,7 +8,16 @@ class ForecastResource(Resource):
         parser = reqparse.RequestParser()
         parser.add_argument('location', type=str, help='Location is required')
         args = parser.parse_args()
-        city, state = [x.strip() for x in args['location'].split(',')]
+        parts = [x.strip() for x in (args['location'] or '').split(',')]
+        if len(parts) != 2:
+            return {
+                'success': False,
+                'location': args['location'] or '',
+                'current_temp': '',
+                'conditions': '',
+                'message': "location must look like 'City, ST'"
+            }, 400
+        city, state = parts
 
         latlng = LocationService.get_latlng(city, state)
         if latlng['success']:
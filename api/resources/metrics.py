@@ -0,0 +1,15 @@
+from flask_restful import Resource
+
+from api import metrics, requires_auth
+
+
+class MetricsResource(Resource):
+    method_decorators = {
+        'get': [requires_auth('get:metrics')]
+    }
+
+    def get(self, *args, **kwargs):
+        return {
+            'success': True,
+            'metrics': metrics.snapshot(),
+        }, 200
@@ -2,14 +2,23 @@ import datetime
 import json
 
 import bleach
+import requests
 from flask import request
 from flask_restful import Resource, abort
 from sqlalchemy.orm.exc import NoResultFound
 
 from api import requires_auth, db
-from api.database.models import RoadTrip
+from api.database.models import RoadTrip, RoadTripStop
+from api.database.registry import city_registry
 from api.services.forecast import ForecastService
-from api.services.location import LocationService
+from api.services.location import LocationService, \
+    ROUTE_MATRIX_ALL_TO_ALL_SIZE
+from api.services.tour import optimize_stops
+from api.services.writebehind import city_writer
+
+# waypoints a trip may have, so ordering them takes a single all-to-all
+# MapQuest routematrix call
+MAX_TRIP_STOPS = ROUTE_MATRIX_ALL_TO_ALL_SIZE - 2
 
 
 def _validate_name(data, field, proceed, errors, missing_okay=False):
@@ -31,17 +40,106 @@ def _validate_city(data, field, proceed, errors, missing_okay=False):
     if not missing_okay and field not in data:
         proceed = False
         errors.append(f"required '{field}' parameter is missing")
-    else:
+    elif field in data:
         data[field] = bleach.clean(data[field].strip())
         if len(data[field]) == 0:
             proceed = False
             errors.append(f"required '{field}' parameter is blank")
         else:
-            city, state = [x.strip() for x in data[field].split(',')]
-            city_payload = LocationService.get_latlng(city, state)
+            parts = [x.strip() for x in data[field].split(',')]
+            if len(parts) != 2:
+                proceed = False
+                errors.append(f"'{field}' must look like 'City, ST'")
+            else:
+                city_payload = LocationService.get_latlng(*parts)
+                if not city_payload['success']:
+                    proceed = False
+                    errors.append(f"'{field}' {city_payload['error']}")
+                else:
+                    # the trip needs the city row, not just its staged id
+                    city_payload['id'] = city_writer.persist(
+                        city_payload['id'])
     return proceed, city_payload, errors
 
 
+def _validate_stops(data, proceed, errors):
+    """
+    validates the optional 'stops' list of 'City, ST' waypoints and
+    returns their city ids in the order given
+    """
+    stops = data.get('stops', [])
+    if not isinstance(stops, list) or \
+            not all(isinstance(stop, str) for stop in stops):
+        errors.append("'stops' must be a list of 'City, ST' strings")
+        return False, [], errors
+    if len(stops) > MAX_TRIP_STOPS:
+        errors.append(f"'stops' may hold at most {MAX_TRIP_STOPS} cities")
+        return False, [], errors
+    stop_ids = []
+    for i, stop in enumerate(stops):
+        field = f'stops[{i}]'
+        proceed, city_payload, errors = _validate_city(
+            {field: stop}, field, proceed, errors)
+        stop_ids.append(city_payload.get('id'))
+    return proceed, stop_ids, errors
+
+
+def _optimize_mode():
+    """
+    whether the request asks to reorder the stops for the quickest drive
+    (?optimize=true); returns (optimize, errors)
+    """
+    mode = request.args.get('optimize', 'false').lower()
+    if mode in ('true', 'false'):
+        return mode == 'true', []
+    return False, ["'optimize' parameter must be 'true' or 'false'"]
+
+
+def _plan_stops(roadtrip, stop_ids, optimize):
+    """
+    sets the trip's stops, reordered for the quickest drive when asked
+    """
+    if optimize and len(stop_ids) > 1:
+        cities = [city_registry.get(city_id) for city_id in
+                  [roadtrip.start_city_id] + stop_ids +
+                  [roadtrip.end_city_id]]
+        order = optimize_stops(LocationService.drive_matrix(cities))
+        stop_ids = [cities[i].id for i in order[1:-1]]
+    roadtrip.set_stops(stop_ids)
+
+
+def _stop_names(roadtrip):
+    return [city_registry.get(city_id).city_state()
+            for city_id in roadtrip.stop_ids()]
+
+
+def _eta_mode():
+    """
+    whether the request asks for estimated travel times (?eta=estimate);
+    returns (estimate, errors)
+    """
+    mode = request.args.get('eta')
+    if mode is None or mode == 'estimate':
+        return mode == 'estimate', []
+    return False, ["'eta' parameter must be 'estimate' when given"]
+
+
+def _store_route(roadtrip):
+    """
+    looks up the trip's drive time and stores it on the row; if MapQuest
+    is unreachable it stays empty until a read or recompute_routes fills
+    it in, rather than keeping the time of the route the trip had before
+    """
+    try:
+        eta = LocationService.route_legs(roadtrip.cities())
+    except requests.RequestException:
+        eta = None
+    if eta is not None:
+        roadtrip.set_route(eta)
+    else:
+        roadtrip.clear_route()
+
+
 class RoadtripsResource(Resource):
     method_decorators = {
         'post': [requires_auth('create:roadtrips')],
@@ -60,6 +158,11 @@ class RoadtripsResource(Resource):
             data, 'start_city', proceed, errors)
         proceed, city_2, errors = _validate_city(
             data, 'end_city', proceed, errors)
+        proceed, stop_ids, errors = _validate_stops(data, proceed, errors)
+        optimize, mode_errors = _optimize_mode()
+        if mode_errors:
+            proceed = False
+            errors += mode_errors
 
         if proceed:
             roadtrip = RoadTrip(
@@ -67,6 +170,8 @@ class RoadtripsResource(Resource):
                 start_city_id=city_1['id'],
                 end_city_id=city_2['id'],
             )
+            _plan_stops(roadtrip, stop_ids, optimize)
+            _store_route(roadtrip)
             db.session.add(roadtrip)
             db.session.commit()
             return roadtrip, errors
@@ -82,6 +187,7 @@ class RoadtripsResource(Resource):
                 'name': roadtrip.name,
                 'start_city': roadtrip.start_city().city_state(),
                 'end_city': roadtrip.end_city().city_state(),
+                'stops': _stop_names(roadtrip),
                 'links': {
                     'get': f'/api/roadtrips/{roadtrip.id}',
                     'patch': f'/api/roadtrips/{roadtrip.id}',
@@ -97,16 +203,53 @@ class RoadtripsResource(Resource):
             }, 400
 
     def get(self, *args, **kwargs):
-        trips = RoadTrip.query.order_by(
-            RoadTrip.name.asc()
-        ).all()
-        results = [{
-            'name': rt.name,
-            'start_city': rt.start_city().city_state(),
-            'end_city': rt.end_city().city_state(),
-            'travel_time': LocationService.route_distance_time(
-                rt.start_city(), rt.end_city())['string']
-            } for rt in trips]
+        estimate, errors = _eta_mode()
+        if errors:
+            return {
+                'success': False,
+                'error': 400,
+                'errors': errors
+            }, 400
+
+        # plain rows, so storing fetched routes can't expire them
+        stops = {}
+        for roadtrip_id, city_id in RoadTripStop.query.with_entities(
+                RoadTripStop.roadtrip_id, RoadTripStop.city_id
+        ).order_by(RoadTripStop.roadtrip_id, RoadTripStop.position):
+            stops.setdefault(roadtrip_id, []).append(city_id)
+        trips = [
+            (name, [city_registry.get(city_id) for city_id in
+                    [start_id] + stops.get(roadtrip_id, []) + [end_id]],
+             None if estimate else stored)
+            for roadtrip_id, name, start_id, end_id, stored in
+            RoadTrip.query.with_entities(
+                RoadTrip.id, RoadTrip.name, RoadTrip.start_city_id,
+                RoadTrip.end_city_id, RoadTrip.travel_time
+            ).order_by(RoadTrip.name.asc())
+        ]
+        # trips written before drive times were stored still need a route;
+        # the legs of all of them share one batch
+        pairs = list({
+            (start.id, end.id): (start, end)
+            for _, cities, stored in trips if stored is None
+            for start, end in zip(cities, cities[1:])
+        }.values())
+        if estimate:
+            etas = LocationService.estimate_distance_times(pairs)
+        else:
+            etas = LocationService.route_distance_times(pairs)
+        results = []
+        for name, cities, stored in trips:
+            if stored is None:
+                eta = LocationService.sum_legs(cities, etas)
+                # like _store_route, a trip without a full route stays empty
+                stored = eta['string'] if eta is not None else None
+            results.append({
+                'name': name,
+                'start_city': cities[0].city_state(),
+                'end_city': cities[-1].city_state(),
+                'travel_time': stored
+            })
         return {
             'success': True,
             'results': results
@@ -131,22 +274,41 @@ class RoadtripResource(Resource):
         sc = rt.start_city()
         ec = rt.end_city()
 
-        travel_time = LocationService.route_distance_time(sc, ec)
-        forecast = ForecastService.get_forecast(
-            {'success': True, 'lat': ec.lat, 'lng': ec.lng}, hourly=True
-        )
-        hrs = max(round(travel_time['seconds']//3600) - 1, 0)
-        forecast = forecast['hourly'][hrs]
+        estimate, errors = _eta_mode()
+        if errors:
+            return {
+                'success': False,
+                'error': 400,
+                'errors': errors
+            }, 400
+        if estimate:
+            travel_time = LocationService.route_legs(
+                rt.cities(), estimate=True)
+        else:
+            travel_time = rt.stored_eta() or \
+                LocationService.route_legs(rt.cities())
+        travel_time = travel_time or {'string': None}
+        forecast_at_eta = {}
+        # no forecast for an arrival that never happens ('impossible route')
+        if travel_time.get('seconds') is not None:
+            forecast = ForecastService.get_forecast(
+                {'success': True, 'lat': ec.lat, 'lng': ec.lng}, hourly=True
+            )
+            hourly = forecast['hourly']
+            hrs = min(max(round(travel_time['seconds']//3600) - 1, 0),
+                      len(hourly) - 1)
+            forecast_at_eta = {
+                'temp': hourly.temp(hrs),
+                'conditions': hourly.conditions(hrs)
+            }
         return {
             'success': True,
             'name': rt.name,
             'start_city': sc.city_state(),
             'end_city': ec.city_state(),
+            'stops': _stop_names(rt),
             'travel_time': travel_time['string'],
-            'forecast_at_eta': {
-                'temp': f'{forecast["temp"]}F',
-                'conditions': forecast['weather'][0]['description']
-            }
+            'forecast_at_eta': forecast_at_eta
         }, 200
 
     def patch(self, *args, **kwargs):
@@ -166,6 +328,15 @@ class RoadtripResource(Resource):
             data, 'start_city', proceed, errors, missing_okay=True)
         proceed, end_city, errors = _validate_city(
             data, 'end_city', proceed, errors, missing_okay=True)
+        if 'stops' in data:
+            proceed, stop_ids, errors = _validate_stops(
+                data, proceed, errors)
+        else:
+            stop_ids = None
+        optimize, mode_errors = _optimize_mode()
+        if mode_errors:
+            proceed = False
+            errors += mode_errors
         if not proceed:
             return {
                 'success': False,
@@ -179,6 +350,11 @@ class RoadtripResource(Resource):
             rt.start_city_id = start_city['id']
         if end_city:
             rt.end_city_id = end_city['id']
+        if stop_ids is not None or optimize:
+            _plan_stops(rt, rt.stop_ids() if stop_ids is None else stop_ids,
+                        optimize)
+        if start_city or end_city or stop_ids is not None or optimize:
+            _store_route(rt)
         rt.update()
 
         return {
@@ -186,6 +362,7 @@ class RoadtripResource(Resource):
             'name': rt.name,
             'start_city': rt.start_city().city_state(),
             'end_city': rt.end_city().city_state(),
+            'stops': _stop_names(rt),
         }, 200
 
     def delete(self, *args, **kwargs):
@@ -1,8 +1,252 @@
 import os
+import threading
+import time
+
+import numpy as np
 import requests
 
+from api import metrics
+from api.cache import LRUCache, on_reset
+from api.services.singleflight import SingleFlight
+
+forecast_flight = SingleFlight('forecast')
+
+# forecasts are cached per grid cell this many degrees wide (0.1 is about
+# 7 miles), fetched for the middle of the cell
+FORECAST_GRID_DEG = float(os.getenv('FORECAST_GRID_DEG', 0.1))
+# OpenWeather refreshes current conditions about every 10 minutes and the
+# hourly forecast about every hour
+FORECAST_CURRENT_TTL = int(os.getenv('FORECAST_CURRENT_TTL', 600))
+FORECAST_HOURLY_TTL = int(os.getenv('FORECAST_HOURLY_TTL', 3600))
+# past its TTL a forecast is still served, while one refresh runs in the
+# background, until it is this old
+FORECAST_STALE_TTL = int(os.getenv('FORECAST_STALE_TTL', 3 * 3600))
+
+
+class ConditionTable:
+    """
+    interned weather descriptions: each distinct description ('clear sky',
+    'light rain', ...) is stored once and referred to by a small code;
+    OpenWeather uses a few dozen of them
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = {}
+        self._descriptions = []
+
+    def code(self, description):
+        code = self._codes.get(description)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(description)
+                if code is None:
+                    code = len(self._descriptions)
+                    self._descriptions.append(description)
+                    self._codes[description] = code
+        return code
+
+    def description(self, code):
+        return self._descriptions[code]
+
+    def __len__(self):
+        return len(self._descriptions)
+
+    def stats(self):
+        return {'descriptions': len(self._descriptions)}
+
+
+conditions = ConditionTable()
+
+
+def _description(entry):
+    weather = entry.get('weather') or [{}]
+    return weather[0].get('description', '')
+
+
+class HourlyForecast:
+    """
+    the hourly part of a onecall response as parallel arrays: start of the
+    hour (epoch seconds), temperature and condition code, one slot per hour
+    """
+    __slots__ = ('epochs', 'temps', 'codes')
+
+    def __init__(self, epochs, temps, codes):
+        self.epochs = epochs
+        self.temps = temps
+        self.codes = codes
+
+    @classmethod
+    def from_onecall(cls, hours):
+        return cls(
+            np.array([hour.get('dt', 0) for hour in hours], dtype=np.int64),
+            np.array([hour['temp'] for hour in hours], dtype=np.float32),
+            np.array([conditions.code(_description(hour)) for hour in hours],
+                     dtype=np.uint16))
+
+    def since(self, now):
+        """
+        the hours from the one under way at `now` on, without copying; the
+        last hour if they have all gone by
+        """
+        start = int(np.searchsorted(self.epochs, now - 3600, side='right'))
+        start = min(start, max(len(self.epochs) - 1, 0))
+        return HourlyForecast(self.epochs[start:], self.temps[start:],
+                              self.codes[start:])
+
+    def temp(self, i):
+        return f'{self.temps[i]:g}F'
+
+    def conditions(self, i):
+        return conditions.description(int(self.codes[i]))
+
+    def __len__(self):
+        return len(self.epochs)
+
+
+class Forecast:
+    """
+    the fields of a onecall response the app uses, kept per cache entry
+    instead of the parsed JSON
+    """
+    __slots__ = ('current_temp', 'current_code', 'hourly')
+
+    def __init__(self, current_temp, current_code, hourly):
+        self.current_temp = current_temp
+        self.current_code = current_code
+        self.hourly = hourly
+
+    @classmethod
+    def from_onecall(cls, data):
+        current = data['current']
+        return cls(current['temp'], conditions.code(_description(current)),
+                   HourlyForecast.from_onecall(data.get('hourly', [])))
+
+
+class ForecastCache:
+    """
+    forecasts per grid cell
+
+    an entry is fresh for current conditions for `current_ttl` seconds and
+    for the hourly forecast for `hourly_ttl`. once past that, requests are
+    answered from the stale entry while a single background refresh runs;
+    only a cell with nothing cached, or nothing younger than `stale_ttl`,
+    makes the request wait for OpenWeather
+    """
+    def __init__(self, fetch, grid_deg=0.1, current_ttl=600,
+                 hourly_ttl=3600, stale_ttl=3 * 3600, maxsize=5000):
+        self.fetch = fetch
+        self.grid_deg = grid_deg
+        self.current_ttl = current_ttl
+        self.hourly_ttl = hourly_ttl
+        self.stale_ttl = stale_ttl
+        self._entries = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.clear()
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.stale_seconds = 0.0
+        self.max_stale_seconds = 0.0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def cell(self, lat, lng):
+        """
+        the grid cell holding lat/lng and the coordinates of its middle
+        """
+        key = (round(lat / self.grid_deg), round(lng / self.grid_deg))
+        return key, (round(key[0] * self.grid_deg, 6),
+                     round(key[1] * self.grid_deg, 6))
+
+    def _store(self, key, data):
+        fetched_at = time.time()
+        self._entries.set(key, (fetched_at, data),
+                          expires_at=fetched_at + self.stale_ttl)
+
+    def _load(self, key, center):
+        data = self.fetch(*center)
+        self._store(key, data)
+        return data
+
+    def _refresh(self, key, center):
+        try:
+            forecast_flight.do(center, lambda: self._load(key, center))
+            self.refreshes += 1
+        except Exception:
+            # the stale entry keeps being served until it expires
+            self.refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _refresh_in_background(self, key, center):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, center),
+                         name='forecast-refresh', daemon=True).start()
+
+    def get(self, lat, lng, hourly=False):
+        """
+        the forecast for the cell holding lat/lng
+        """
+        key, center = self.cell(lat, lng)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            # concurrent requests for the same cell share one onecall
+            return forecast_flight.do(center,
+                                      lambda: self._load(key, center))
+
+        fetched_at, data = entry
+        age = time.time() - fetched_at
+        ttl = self.hourly_ttl if hourly else self.current_ttl
+        if age < ttl:
+            self.hits += 1
+        else:
+            self.stale += 1
+            self.stale_seconds += age - ttl
+            self.max_stale_seconds = max(self.max_stale_seconds, age - ttl)
+            self._refresh_in_background(key, center)
+        return data
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'avg_stale_seconds': round(
+                self.stale_seconds / self.stale, 1) if self.stale else 0.0,
+            'max_stale_seconds': round(self.max_stale_seconds, 1),
+            'refreshing': len(self._refreshing),
+            'refreshes': self.refreshes,
+            'refresh_errors': self.refresh_errors,
+        }
+
 
 class ForecastService:
+    @classmethod
+    def _fetch_onecall(cls, lat, lng):
+        res = requests.get(
+            'https://api.openweathermap.org'
+            '/data/2.5/onecall'
+            f"?appid={os.getenv('OPENWEATHER_API', 'bad openweather api key')}"
+            f"&lat={lat}"
+            f"&lon={lng}"
+            f"&exclude=minutely,alerts,daily"
+            f"&units=imperial"
+        )
+        if res.status_code == 200:
+            return res.json()
+        else:
+            raise requests.RequestException  # pragma: no cover
+
     @classmethod
     def get_forecast(cls, latlng, hourly=False):
         payload = {
@@ -11,25 +255,28 @@ class ForecastService:
             'success': True,
         }
         if latlng and 'success' in latlng and latlng['success']:
-            res = requests.get(
-                'https://api.openweathermap.org'
-                '/data/2.5/onecall'
-                f"?appid={os.getenv('OPENWEATHER_API', 'bad openweather api key')}"
-                f"&lat={latlng['lat']}"
-                f"&lon={latlng['lng']}"
-                f"&exclude=minutely,alerts,daily"
-                f"&units=imperial"
-            )
-            if res.status_code == 200:
-                data = res.json()
-                forecast = data['current']
-                payload['current_temp'] = f"{forecast['temp']}F"
-                payload['conditions'] = forecast['weather'][0]['description']
-                if hourly:
-                    payload['hourly'] = data['hourly']
-            else:
-                raise requests.RequestException  # pragma: no cover
+            forecast = forecast_cache.get(
+                latlng['lat'], latlng['lng'], hourly)
+            payload['current_temp'] = f'{forecast.current_temp}F'
+            payload['conditions'] = conditions.description(
+                forecast.current_code)
+            if hourly:
+                # a cached forecast starts at the hour it was fetched
+                payload['hourly'] = forecast.hourly.since(time.time())
         else:
             payload['success'] = False
 
         return payload
+
+
+forecast_cache = ForecastCache(
+    lambda lat, lng: Forecast.from_onecall(
+        ForecastService._fetch_onecall(lat, lng)),
+    grid_deg=FORECAST_GRID_DEG,
+    current_ttl=FORECAST_CURRENT_TTL,
+    hourly_ttl=FORECAST_HOURLY_TTL,
+    stale_ttl=FORECAST_STALE_TTL,
+    maxsize=int(os.getenv('FORECAST_CACHE_SIZE', 5000)))
+on_reset(forecast_cache.clear)
+metrics.register('forecast_cache', forecast_cache.stats)
+metrics.register('forecast_conditions', conditions.stats)
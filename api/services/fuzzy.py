@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+
+from api import metrics
+from api.cache import on_reset
+from api.database.models import City
+from api.database.registry import city_registry
+
+
+def trigrams(name):
+    """
+    set of character trigrams of a lowercased name, padded like pg_trgm so
+    word starts and ends count: 'arvda' -> {'  a', ' ar', 'arv', ...}
+    """
+    grams = set()
+    for word in name.lower().split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def edit_distance(a, b):
+    """
+    Levenshtein distance between two lowercased names
+    """
+    a, b = ' '.join(a.lower().split()), ' '.join(b.lower().split())
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+class _StateIndex:
+    __slots__ = ('ids', 'names', 'sizes', 'postings')
+
+    def __init__(self):
+        self.ids = []
+        self.names = []
+        self.sizes = []
+        self.postings = {}
+
+
+class TrigramIndex:
+    """
+    in-memory trigram index over known city names, one per state
+
+    a lookup scores every city in the state that shares a trigram with the
+    query by Jaccard similarity (shared / union of trigram sets) and
+    returns the best one at or above `threshold` that is also at most
+    `max_edits` single-character edits away, so a different real city
+    with a similar name ('Bristow' and 'Bristol') is not taken for a typo
+
+    like CityGrid, with `refresh_interval` set the cities stored since the
+    last load are read in every that many seconds
+    """
+    def __init__(self, threshold=0.75, max_edits=2, refresh_interval=None,
+                 sync_overlap=1000):
+        self.threshold = threshold
+        self.max_edits = max_edits
+        self.refresh_interval = refresh_interval
+        self.sync_overlap = sync_overlap
+        self._lock = threading.Lock()
+        self.matches = 0
+        self.misses = 0
+        self.clear()
+
+    def clear(self):
+        self._states = {}
+        self._ids = set()
+        self._loaded = False
+        self._high_water = 0
+        self._synced_at = None
+
+    def _insert(self, city_id, name, state):
+        if city_id in self._ids:
+            return
+        self._ids.add(city_id)
+        index = self._states.setdefault(state.upper(), _StateIndex())
+        grams = trigrams(name)
+        pos = len(index.ids)
+        index.ids.append(city_id)
+        index.names.append(name)
+        index.sizes.append(len(grams))
+        for gram in grams:
+            index.postings.setdefault(gram, []).append(pos)
+
+    def add(self, city_id, name, state):
+        """
+        indexes a city the app just stored or looked up; before the first
+        load the load will pick it up instead
+        """
+        with self._lock:
+            if self._loaded:
+                self._insert(city_id, name, state)
+
+    def load(self, rows=None):
+        """
+        builds the index from (id, name, state) rows, by default every row
+        in the cities table, then keeps reading in new rows
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and (self.refresh_interval is None or
+                                 now - self._synced_at <
+                                 self.refresh_interval):
+                return
+            if rows is None:
+                rows = City.query.with_entities(
+                    City.id, City.name, City.state
+                ).filter(City.id > self._high_water - self.sync_overlap)
+            for city_id, name, state in rows:
+                self._insert(city_id, name, state)
+                self._high_water = max(self._high_water, city_id)
+            self._loaded = True
+            self._synced_at = now
+
+    def match(self, name, state):
+        """
+        returns (city_id, similarity) for the closest known city in
+        `state`, or None when nothing reaches the threshold
+        """
+        if self.threshold <= 0:
+            return None
+        self.load()
+        index = self._states.get(state.strip().upper())
+        grams = trigrams(name)
+        scored = []
+        if index is not None and grams:
+            shared = {}
+            for gram in grams:
+                for pos in index.postings.get(gram, ()):
+                    shared[pos] = shared.get(pos, 0) + 1
+            query_size = len(grams)
+            sizes = index.sizes
+            for pos, count in shared.items():
+                score = count / (query_size + sizes[pos] - count)
+                if score >= self.threshold:
+                    scored.append((score, pos))
+
+        for score, pos in sorted(scored, reverse=True):
+            if abs(len(index.names[pos]) - len(name)) <= self.max_edits and \
+                    edit_distance(index.names[pos], name) <= self.max_edits:
+                self.matches += 1
+                return index.ids[pos], score
+        self.misses += 1
+        return None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def stats(self):
+        return {
+            'cities': len(self._ids),
+            'threshold': self.threshold,
+            'max_edits': self.max_edits,
+            'matches': self.matches,
+            'misses': self.misses,
+        }
+
+
+# set FUZZY_MATCH_THRESHOLD to 0 to turn typo matching off
+city_trigrams = TrigramIndex(
+    threshold=float(os.getenv('FUZZY_MATCH_THRESHOLD', 0.75)),
+    max_edits=int(os.getenv('FUZZY_MAX_EDITS', 2)),
+    refresh_interval=int(os.getenv('INDEX_REFRESH_INTERVAL', 60)))
+on_reset(city_trigrams.clear)
+metrics.register('city_trigrams', city_trigrams.stats)
+city_registry.subscribe(
+    lambda record: city_trigrams.add(record.id, record.name, record.state))
@@ -0,0 +1,197 @@
+import csv
+import mmap
+import os
+import re
+import struct
+import threading
+
+from api import metrics
+from api.database.registry import city_key
+
+MAGIC = b'RTGZ'
+VERSION = 1
+# magic, version, place count, key blob length
+HEADER = struct.Struct('<4sIII')
+
+# trailing legal/statistical area descriptions on Census place names,
+# e.g. 'Arvada city', 'Aspen Park CDP', 'Nashville-Davidson metropolitan
+# government (balance)'
+_PLACE_SUFFIX = re.compile(
+    r'\s+(\(balance\)|city and borough|unified government|consolidated '
+    r'government|metropolitan government|metro government|urban county|'
+    r'city|town|township|village|borough|municipality|CDP|comunidad|'
+    r'zona urbana)$'
+)
+_COLUMNS = {
+    'name': ('name', 'city', 'place'),
+    'state': ('usps', 'state', 'st'),
+    'lat': ('intptlat', 'lat', 'latitude'),
+    'lng': ('intptlong', 'lng', 'lon', 'long', 'longitude'),
+}
+
+
+def place_name(name):
+    """
+    strips Census area descriptions: 'Arvada city' -> 'Arvada'
+    """
+    name = name.strip()
+    while True:
+        stripped = _PLACE_SUFFIX.sub('', name)
+        if stripped == name:
+            return name
+        name = stripped
+
+
+def read_places(source):
+    """
+    yields (key, lat, lng, incorporated) from a Census gazetteer places
+    file (tab separated) or any CSV with name/state/lat/lng style columns
+    """
+    with open(source, newline='', encoding='utf-8-sig') as f:
+        header = f.readline()
+        delimiter = '\t' if '\t' in header else ','
+        columns = [c.strip().lower() for c in header.split(delimiter)]
+        index = {}
+        for field, names in _COLUMNS.items():
+            for name in names:
+                if name in columns:
+                    index[field] = columns.index(name)
+                    break
+            else:
+                raise ValueError(f'{source} has no {field} column')
+
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) <= max(index.values()):
+                continue
+            raw_name = row[index['name']].strip()
+            name = place_name(raw_name)
+            state = row[index['state']].strip()
+            if not name or len(state) != 2:
+                continue
+            try:
+                lat = float(row[index['lat']])
+                lng = float(row[index['lng']])
+            except ValueError:
+                continue
+            yield city_key(name, state), lat, lng, \
+                not raw_name.endswith(' CDP')
+
+
+def build(source, output):
+    """
+    builds the on-disk index from `source` and returns the place count
+
+    layout, little-endian: header, count float64 latitudes, count float64
+    longitudes, count + 1 uint32 offsets into the key blob, then the
+    sorted utf-8 keys back to back
+    """
+    places = {}
+    for key, lat, lng, incorporated in read_places(source):
+        # an incorporated place wins over a CDP sharing its name
+        if key not in places or (incorporated and not places[key][2]):
+            places[key] = (lat, lng, incorporated)
+
+    keys = sorted(k.encode('utf-8') for k in places)
+    offsets = [0]
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    blob = b''.join(keys)
+    count = len(keys)
+    lats = [places[k.decode('utf-8')][0] for k in keys]
+    lngs = [places[k.decode('utf-8')][1] for k in keys]
+
+    tmp = f'{output}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, count, len(blob)))
+        f.write(struct.pack(f'<{count}d', *lats))
+        f.write(struct.pack(f'<{count}d', *lngs))
+        f.write(struct.pack(f'<{count + 1}I', *offsets))
+        f.write(blob)
+    os.replace(tmp, output)
+    return count
+
+
+class Gazetteer:
+    """
+    read-only, memory-mapped view of an index written by build()
+
+    the file is mapped rather than read, so every worker on the box shares
+    the same pages; lookups are a binary search over the sorted keys
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, blob_len = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a gazetteer index')
+        view = memoryview(self._map)
+        start = HEADER.size
+        size = self.count * 8
+        self._lats = view[start:start + size].cast('d')
+        self._lngs = view[start + size:start + 2 * size].cast('d')
+        start += 2 * size
+        self._offsets = view[start:start + (self.count + 1) * 4].cast('I')
+        self._blob_start = start + (self.count + 1) * 4
+
+    def _key(self, i):
+        base = self._blob_start
+        return self._map[base + self._offsets[i]:base + self._offsets[i + 1]]
+
+    def lookup(self, key):
+        """
+        returns (lat, lng) for a normalized 'city,state' key, or None
+        """
+        target = key.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key(lo) == target:
+            return self._lats[lo], self._lngs[lo]
+        return None
+
+    def __len__(self):
+        return self.count
+
+
+class _LazyGazetteer:
+    """
+    opens GAZETTEER_PATH on first use; without one every lookup misses
+    """
+    def __init__(self, path):
+        self.path = path
+        self._index = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self):
+        if self._index is None and self.path and os.path.exists(self.path):
+            with self._lock:
+                if self._index is None:
+                    self._index = Gazetteer(self.path)
+        return self._index
+
+    def lookup(self, key):
+        index = self._open()
+        found = None if index is None else index.lookup(key)
+        if found is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return found
+
+    def stats(self):
+        return {
+            'places': 0 if self._index is None else len(self._index),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+gazetteer = _LazyGazetteer(os.getenv('GAZETTEER_PATH'))
+metrics.register('gazetteer', gazetteer.stats)
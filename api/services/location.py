@@ -1,12 +1,130 @@
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import bleach
 import inflect
+import numpy as np
 import requests
 
-from api import db
-from api.database.models import City
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from api import db, metrics
+from api.cache import LRUCache, on_reset
+from api.database.models import City, RoadTrip, Route
+from api.database.registry import city_key, city_registry
+from api.services.fuzzy import city_trigrams
+from api.services.gazetteer import gazetteer
+from api.services.roadgraph import road_graph
+from api.services.singleflight import SingleFlight, advisory_lock
+from api.services.spatial import estimate_drive
+from api.services.traveltimes import travel_times
+from api.services.writebehind import city_writer
+
+MAPQUEST_URL = os.getenv('MAPQUEST_URL', 'http://www.mapquestapi.com')
+# MapQuest accepts at most 100 locations per batch geocoding call
+BATCH_GEOCODE_SIZE = 100
+# and per one-to-many route matrix, or 25 for an all-to-all matrix
+ROUTE_MATRIX_SIZE = 100
+ROUTE_MATRIX_ALL_TO_ALL_SIZE = 25
+
+# MapQuest answers input it cannot place with the middle of the state or
+# the country rather than an error
+VAGUE_GEOCODE_QUALITIES = ('COUNTRY', 'STATE', 'COUNTY')
+NOT_FOUND = 'location not found'
+
+# how long a stored drive time is trusted before MapQuest is asked again
+ROUTE_TTL = int(os.getenv('ROUTE_CACHE_TTL', 7 * 24 * 3600))
+
+# with a road graph at ROAD_GRAPH_PATH, 'fallback' answers from it when
+# MapQuest fails and 'local' answers from it first, asking MapQuest only
+# about cities the graph does not connect
+ROUTING_MODE = os.getenv('ROUTING_MODE', 'fallback')
+
+geocode_flight = SingleFlight('geocode')
+route_flight = SingleFlight('route')
+
+# locations the geocoder could not place, so repeats skip MapQuest until
+# the entry expires
+unresolved = LRUCache(
+    maxsize=int(os.getenv('UNRESOLVED_CACHE_SIZE', 10000)),
+    default_ttl=int(os.getenv('UNRESOLVED_CACHE_TTL', 3600)))
+on_reset(unresolved.clear)
+metrics.register('unresolved_locations', unresolved.stats)
+city_registry.subscribe(
+    lambda record: unresolved.pop(city_key(record.name, record.state)))
+
+
+class LocationNotFound(Exception):
+    pass
+
+
+def format_travel_time(formatted):
+    """
+    MapQuest's 'hh:mm:ss' as words: '01:23:00' -> '1 hour, 23 minutes'
+    """
+    p = inflect.engine()
+    bits = [int(b) for b in formatted.split(':')]
+    eta = []
+    if bits[0] > 0:
+        eta.append(f'{bits[0]} {p.plural("hour", bits[0])}')
+    if bits[1] > 0:
+        eta.append(f'{bits[1]} {p.plural("minute", bits[1])}')
+    return ', '.join(eta)
+
+
+def format_seconds(seconds):
+    """
+    a drive time in seconds in the same words as format_travel_time
+    """
+    seconds = int(seconds)
+    return format_travel_time(
+        f'{seconds // 3600:02}:{seconds % 3600 // 60:02}:{seconds % 60:02}')
+
+
+def _route_matrix_calls(pairs):
+    """
+    splits (start_id, end_id) pairs into as few routematrix requests as
+    possible; returns (city ids, all_to_all) per request, where a
+    one-to-many request routes from its first city to each of the others
+    """
+    ids = sorted({city_id for pair in pairs for city_id in pair})
+    if not ids:
+        return []
+    if len(ids) <= ROUTE_MATRIX_ALL_TO_ALL_SIZE:
+        return [(ids, True)]
+    ends = {}
+    for start, end in pairs:
+        ends.setdefault(start, []).append(end)
+    calls = []
+    for start, targets in sorted(ends.items()):
+        targets.sort()
+        for i in range(0, len(targets), ROUTE_MATRIX_SIZE - 1):
+            calls.append(
+                ([start] + targets[i:i + ROUTE_MATRIX_SIZE - 1], False))
+    return calls
+
+
+def _useful_location(locations):
+    """
+    the first MapQuest geocoding result if it names a place rather than a
+    whole state or country
+    """
+    if not locations:
+        return None
+    location = locations[0]
+    if location.get('geocodeQuality') in VAGUE_GEOCODE_QUALITIES:
+        return None
+    return location
+
+
+def _place_name(location, city):
+    """
+    the city name MapQuest placed a location in, so a misspelt or
+    differently written name is stored the way MapQuest spells it
+    """
+    return (location.get('adminArea5') or '').strip() or city
 
 
 class LocationService:
@@ -37,8 +155,7 @@ class LocationService:
             payload['success'] = False
             return payload
 
-        city_chk = db.session.query(City).filter_by(
-            name=good_city, state=good_state).one_or_none()
+        city_chk = city_registry.find(good_city, good_state)
 
         if city_chk is not None:
             payload['lat'] = city_chk.lat
@@ -46,51 +163,576 @@ class LocationService:
             payload['id'] = city_chk.id
             return payload
 
-        res = requests.get(
-            'http://www.mapquestapi.com'
-            '/geocoding/v1/address'
-            f"?key={os.getenv('MAPQUEST_API', 'bad mapquest api key')}"
-            f'&location={city},{state}'
-        )
-        if res.status_code == 200:
-            latlng = res.json()['results'][0]['locations'][0]['displayLatLng']
-            payload['lat'] = latlng['lat']
-            payload['lng'] = latlng['lng']
+        key = city_key(good_city, good_state)
+        if unresolved.get(key) is not None:
+            payload['error'] = NOT_FOUND
+            payload['success'] = False
+            return payload
+        try:
+            city_chk = geocode_flight.do(
+                key, lambda: cls._geocode(key, good_city, good_state))
+        except LocationNotFound:
+            payload['error'] = NOT_FOUND
+            payload['success'] = False
+            return payload
+        payload['lat'] = city_chk.lat
+        payload['lng'] = city_chk.lng
+        payload['id'] = city_chk.id
+        return payload
 
-            city_chk = City(
-                name=good_city, state=good_state,
-                lat=latlng['lat'], lng=latlng['lng']
+    @classmethod
+    def _geocode(cls, key, city, state):
+        """
+        looks a city up in the offline gazetteer, then among known cities
+        with a near-identical name (a typo), then on MapQuest. MapQuest's
+        spelling of the place is what gets stored, and when that is a city
+        we already know, the known city answers instead. only one caller
+        per key runs this at a time, in this worker and (with advisory
+        locks on) across workers
+        """
+        with advisory_lock(key) as locked:
+            if locked:
+                # another worker may have stored it while we waited
+                city_chk = City.query.filter_by(key=key).one_or_none()
+                if city_chk is not None:
+                    return city_registry.add(city_chk)
+
+            offline = gazetteer.lookup(key)
+            if offline is not None:
+                return cls._store(city, state, *offline, durable=locked)
+
+            # not a real place as far as the gazetteer knows
+            similar = city_trigrams.match(city, state)
+            if similar is not None:
+                return city_registry.get(similar[0])
+
+            res = requests.get(
+                MAPQUEST_URL +
+                '/geocoding/v1/address'
+                f"?key={os.getenv('MAPQUEST_API', 'bad mapquest api key')}"
+                f'&location={city},{state}'
             )
-            city_chk.insert()
-            payload['id'] = city_chk.id
+            if res.status_code == 400:
+                return cls._not_found(key, city, state)
+            if res.status_code == 200:
+                location = _useful_location(
+                    res.json()['results'][0]['locations'])
+                if location is None:
+                    return cls._not_found(key, city, state)
+                name = _place_name(location, city)
+                if city_key(name, state) != key:
+                    known = city_registry.find(name, state)
+                    if known is not None:
+                        return known
+                latlng = location['displayLatLng']
+                return cls._store(name, state, latlng['lat'], latlng['lng'],
+                                  durable=locked)
 
-            return payload
+            else:
+                raise requests.RequestException  # pragma: no cover
 
-        else:
-            raise requests.RequestException  # pragma: no cover
+    @classmethod
+    def _not_found(cls, key, city, state):
+        """
+        the known city a name MapQuest could not place is a typo of, or
+        LocationNotFound when there is none
+        """
+        similar = city_trigrams.match(city, state)
+        if similar is not None:
+            return city_registry.get(similar[0])
+        unresolved.set(key, True)
+        raise LocationNotFound(key)
+
+    @classmethod
+    def _store(cls, city, state, lat, lng, durable=False):
+        """
+        stores a newly geocoded city, in the background when write-behind
+        is on, and returns its CityRecord; `durable` writes a staged city
+        straight away, for when other workers wait to read it from the
+        table
+        """
+        if city_writer.active():
+            record = city_writer.stage(city, state, lat, lng)
+            if durable:
+                record = city_registry.get(city_writer.persist(record.id))
+            return record
+        return city_registry.add(City.upsert(
+            name=city, state=state, lat=lat, lng=lng
+        ))
+
+    @classmethod
+    def get_latlng_batch(cls, locations):
+        """
+        resolves a list of 'City, ST' strings in as few round trips as
+        possible: known cities come from one IN query, then the offline
+        gazetteer, then typo matches against known cities, the rest go to
+        MapQuest's batch geocoder, and new cities are inserted in one
+        transaction under MapQuest's spelling
+
+        returns one payload per input location, in input order, shaped
+        like get_latlng's plus the original 'location'
+        """
+        results = []
+        wanted = {}
+        for location in locations:
+            payload = {
+                'location': location,
+                'lat': float(-90),
+                'lng': float(-180),
+                'success': True,
+                'id': 0
+            }
+            results.append(payload)
+            parts = [bleach.clean(x.strip())
+                     for x in str(location).rsplit(',', 1)]
+            if len(parts) != 2 or not parts[0]:
+                payload['error'] = 'city is required'
+            elif not parts[1]:
+                payload['error'] = 'state is required'
+            elif len(parts[1]) != 2:
+                payload['error'] = 'state length must be 2 characters'
+            else:
+                wanted.setdefault(city_key(*parts), (parts, []))[1].append(
+                    payload)
+                continue
+            payload['success'] = False
+
+        found = {}
+        unknown = []
+        for key in wanted:
+            record = city_registry.find_cached(key)
+            if record is None:
+                unknown.append(key)
+            else:
+                found[key] = record
+        if unknown:
+            for city in City.query.filter(City.key.in_(unknown)):
+                found[city.key] = city_registry.add(city)
+
+        misses = []
+        new_cities = []
+        renamed = {}
+        for key in unknown:
+            if key in found:
+                continue
+            (city, state), payloads = wanted[key]
+            if unresolved.get(key) is not None:
+                for payload in payloads:
+                    payload['success'] = False
+                    payload['error'] = NOT_FOUND
+                continue
+            offline = gazetteer.lookup(key)
+            if offline is not None:
+                new_cities.append(City(
+                    name=city, state=state, lat=offline[0], lng=offline[1]
+                ))
+                continue
+            similar = city_trigrams.match(city, state)
+            if similar is not None:
+                found[key] = city_registry.get(similar[0])
+                continue
+            misses.append(key)
+        for start in range(0, len(misses), BATCH_GEOCODE_SIZE):
+            chunk = misses[start:start + BATCH_GEOCODE_SIZE]
+            res = requests.post(
+                MAPQUEST_URL +
+                '/geocoding/v1/batch'
+                f"?key={os.getenv('MAPQUEST_API', 'bad mapquest api key')}",
+                json={
+                    'locations': [
+                        '{}, {}'.format(*wanted[key][0]) for key in chunk
+                    ],
+                    'options': {'maxResults': 1, 'thumbMaps': False}
+                }
+            )
+            if res.status_code != 200:
+                raise requests.RequestException  # pragma: no cover
+            for key, result in zip(chunk, res.json()['results']):
+                location = _useful_location(result['locations'])
+                if location is None:
+                    similar = city_trigrams.match(*wanted[key][0])
+                    if similar is not None:
+                        found[key] = city_registry.get(similar[0])
+                        continue
+                    unresolved.set(key, True)
+                    for payload in wanted[key][1]:
+                        payload['success'] = False
+                        payload['error'] = NOT_FOUND
+                    continue
+                (city, state), _ = wanted[key]
+                name = _place_name(location, city)
+                if city_key(name, state) != key:
+                    renamed[key] = city_key(name, state)
+                    known = city_registry.find(name, state)
+                    if known is not None:
+                        found[key] = known
+                        continue
+                latlng = location['displayLatLng']
+                new_cities.append(City(
+                    name=name, state=state,
+                    lat=latlng['lat'], lng=latlng['lng']
+                ))
+
+        if new_cities:
+            try:
+                db.session.add_all(new_cities)
+                db.session.commit()
+            except IntegrityError:
+                # someone else stored some of these meanwhile
+                db.session.rollback()
+                new_cities = [
+                    City.upsert(c.name, c.state, c.lat, c.lng)
+                    for c in new_cities
+                ]
+            for city in new_cities:
+                found[city.key] = city_registry.add(city)
+        for key, stored_as in renamed.items():
+            if key not in found:
+                found[key] = found[stored_as]
+
+        for key, record in found.items():
+            for payload in wanted[key][1]:
+                payload['lat'] = record.lat
+                payload['lng'] = record.lng
+                payload['id'] = record.id
+
+        return results
 
     @classmethod
     def route_distance_time(cls, start_city, end_city):
+        """
+        drive time between two cities, from the routes table while the
+        stored answer is younger than ROUTE_CACHE_TTL, otherwise from
+        MapQuest directions, written through to the table; the local road
+        graph answers first or when MapQuest fails, per ROUTING_MODE
+        """
+        eta = cls._route_eta(start_city, end_city)
+        travel_times.record({(start_city.id, end_city.id): eta})
+        return eta
+
+    @classmethod
+    def _route_eta(cls, start_city, end_city):
+        if ROUTING_MODE == 'local':
+            eta = cls.local_route(start_city, end_city)
+            if eta is not None:
+                return eta
+
+        pair = (start_city.id, end_city.id)
+        route = Route.query.get(pair)
+        if route is not None and route.fetched_at > time.time() - ROUTE_TTL:
+            return route.as_eta()
+
+        try:
+            eta = route_flight.do(
+                pair, lambda: cls._fetch_route(start_city, end_city))
+        except requests.RequestException:
+            eta = cls.local_route(start_city, end_city)
+            if eta is None:
+                raise
+        if eta is None:
+            # MapQuest refused, e.g. over quota
+            eta = cls.local_route(start_city, end_city)
+        return eta
+
+    @classmethod
+    def local_route(cls, start_city, end_city):
+        """
+        drive time between two cities from the local road graph, shaped
+        like route_distance_time's, or None when the graph cannot answer
+        """
+        found = road_graph.route(start_city, end_city)
+        if found is None:
+            return None
+        seconds, miles = found
+        return {
+            'string': format_seconds(seconds),
+            'seconds': int(seconds),
+            'distance': round(miles, 1),
+        }
+
+    @classmethod
+    def _stored_routes(cls, pairs):
+        """
+        {(start_id, end_id): eta} for the pairs with a route younger than
+        ROUTE_CACHE_TTL in the routes table, in one query
+        """
+        etas = {}
+        if not pairs:
+            return etas
+        fresh_after = time.time() - ROUTE_TTL
+        for route in Route.query.filter(
+                Route.start_city_id.in_({s for s, _ in pairs}),
+                Route.end_city_id.in_({e for _, e in pairs})):
+            pair = (route.start_city_id, route.end_city_id)
+            if pair in pairs and route.fetched_at > fresh_after:
+                etas[pair] = route.as_eta()
+        return etas
+
+    @classmethod
+    def route_distance_times(cls, pairs):
+        """
+        drive times for many (start, end) city pairs at once: stored routes
+        come from one query, the rest from as few MapQuest routematrix
+        calls as possible, written through in one transaction
+
+        returns {(start_id, end_id): eta}, each eta shaped like
+        route_distance_time's
+        """
+        cities = {}
+        for start, end in pairs:
+            cities[start.id] = start
+            cities[end.id] = end
+        wanted = {(start.id, end.id) for start, end in pairs}
+        etas = {}
+        if ROUTING_MODE == 'local':
+            for start, end in wanted:
+                eta = cls.local_route(cities[start], cities[end])
+                if eta is not None:
+                    etas[(start, end)] = eta
+        etas.update(cls._stored_routes(wanted - etas.keys()))
+        missing = wanted - etas.keys()
+        routes = []
+        for ids, all_to_all in _route_matrix_calls(missing):
+            try:
+                matrix = cls._route_matrix(
+                    [cities[i] for i in ids], all_to_all)
+            except requests.RequestException:
+                if not road_graph.available():
+                    raise
+                matrix = None
+            if all_to_all:
+                position = {city_id: i for i, city_id in enumerate(ids)}
+                covered = sorted(missing)
+            else:
+                position = {city_id: i for i, city_id in enumerate(ids)
+                            if i > 0}
+                covered = [(ids[0], end) for end in ids[1:]]
+            for start, end in covered:
+                if matrix is None:
+                    # MapQuest refused the matrix, try the road graph and
+                    # then ask for this one alone
+                    eta = cls.local_route(cities[start], cities[end])
+                    etas[(start, end)] = eta if eta is not None else \
+                        cls.route_distance_time(cities[start], cities[end])
+                    continue
+                if all_to_all:
+                    seconds = matrix['time'][position[start]][position[end]]
+                    miles = matrix['distance'][position[start]][
+                        position[end]]
+                else:
+                    seconds = matrix['time'][position[end]]
+                    miles = matrix['distance'][position[end]]
+                if seconds or start == end:
+                    route = Route(start, end,
+                                  travel_time=format_seconds(seconds),
+                                  seconds=int(seconds), distance=miles,
+                                  fetched_at=int(time.time()))
+                else:
+                    route = Route(start, end,
+                                  travel_time='impossible route',
+                                  fetched_at=int(time.time()))
+                routes.append(route)
+                etas[(start, end)] = route.as_eta()
+
+        if routes:
+            Route.save_all(routes)
+        travel_times.record(etas)
+        return etas
+
+    @classmethod
+    def route_legs(cls, cities, estimate=False):
+        """
+        drive time for a trip through `cities` in order, the sum of its
+        legs fetched in one batch (or estimated), shaped like
+        route_distance_time's
+        """
+        legs = list(zip(cities, cities[1:]))
+        if estimate:
+            etas = cls.estimate_distance_times(legs)
+        elif len(legs) == 1:
+            return cls.route_distance_time(*cities)
+        else:
+            etas = cls.route_distance_times(legs)
+        return cls.sum_legs(cities, etas)
+
+    @classmethod
+    def sum_legs(cls, cities, etas):
+        """
+        drive time through `cities` in order from the {(start_id, end_id):
+        eta} of a batched lookup that covered every leg; None if one is
+        missing
+        """
+        legs = list(zip(cities, cities[1:]))
+        if len(legs) == 1:
+            return etas.get((cities[0].id, cities[1].id))
+        seconds = 0
+        distance = 0.0
+        for start, end in legs:
+            eta = etas.get((start.id, end.id))
+            if eta is None:
+                return None
+            if 'seconds' not in eta:
+                return {'string': eta['string']}
+            seconds += eta['seconds']
+            distance += eta.get('distance') or 0.0
+        return {
+            'string': format_seconds(seconds),
+            'seconds': seconds,
+            'distance': round(distance, 1),
+        }
+
+    @classmethod
+    def drive_matrix(cls, cities):
+        """
+        NumPy matrix of drive seconds between every two of `cities`, inf
+        where there is no road, from one route_distance_times call (a
+        single MapQuest routematrix for up to 25 cities); estimated from
+        coordinates when MapQuest cannot be reached
+        """
+        pairs = {(start.id, end.id): (start, end)
+                 for start in cities for end in cities if start.id != end.id}
+        try:
+            etas = cls.route_distance_times(list(pairs.values()))
+        except requests.RequestException:
+            etas = cls.estimate_distance_times(list(pairs.values()))
+        seconds = np.zeros((len(cities), len(cities)))
+        for a, start in enumerate(cities):
+            for b, end in enumerate(cities):
+                if start.id != end.id:
+                    eta = etas.get((start.id, end.id)) or {}
+                    seconds[a, b] = eta.get('seconds', np.inf)
+        return seconds
+
+    @classmethod
+    def estimate_distance_times(cls, pairs):
+        """
+        rough drive times for (start, end) city pairs from their
+        coordinates alone, all pairs in one vectorized pass; same result
+        shape as route_distance_times, no network calls
+        """
+        if not pairs:
+            return {}
+        coords = np.array([(start.lat, start.lng, end.lat, end.lng)
+                           for start, end in pairs], dtype=np.float64)
+        miles, seconds = estimate_drive(*coords.T)
+        etas = {}
+        for (start, end), m, t in zip(pairs, miles.tolist(),
+                                      seconds.tolist()):
+            etas[(start.id, end.id)] = {
+                'string': format_seconds(t),
+                'seconds': int(t),
+                'distance': round(m, 1),
+            }
+        return etas
+
+    @classmethod
+    def _route_matrix(cls, cities, all_to_all):
+        res = requests.post(
+            MAPQUEST_URL +
+            '/directions/v2/routematrix'
+            f"?key={os.getenv('MAPQUEST_API', 'bad mapquest api key')}",
+            json={
+                'locations': [city.city_state() for city in cities],
+                'options': {'allToAll': all_to_all, 'manyToOne': False}
+            }
+        )
+        if res.status_code != 200:
+            return None
+        matrix = res.json()
+        if matrix.get('info', {}).get('statuscode', 0) != 0 or \
+                'time' not in matrix:
+            return None
+        return matrix
+
+    @classmethod
+    def _fetch_route(cls, start_city, end_city):
+        route = cls._request_route(start_city, end_city)
+        if route is not None:
+            Route.save(route)
+            return route.as_eta()
+
+    @classmethod
+    def _request_route(cls, start_city, end_city):
+        """
+        asks MapQuest directions for one route and returns it as an unsaved
+        Route, or None when MapQuest fails; touches no database session
+        """
         res = requests.get(
-            'http://www.mapquestapi.com'
+            MAPQUEST_URL +
             '/directions/v2/route'
             f"?key={os.getenv('MAPQUEST_API', 'bad mapquest api key')}"
             f'&from={start_city.city_state()}'
             f'&to={end_city.city_state()}'
         )
         if res.status_code == 200:
-            p = inflect.engine()
             route = res.json()['route']
             if 'formattedTime' in route:
-                bits = [int(b) for b in route['formattedTime'].split(':')]
-                eta = []
-                if bits[0] > 0:
-                    eta.append(f'{bits[0]} {p.plural("hour", bits[0])}')
-                if bits[1] > 0:
-                    eta.append(f'{bits[1]} {p.plural("minute", bits[1])}')
-                return {
-                    'string': ', '.join(eta),
-                    'seconds': route['time']
-                }
+                return Route(
+                    start_city.id, end_city.id,
+                    travel_time=format_travel_time(route['formattedTime']),
+                    seconds=route['time'],
+                    distance=route.get('distance'),
+                    fetched_at=int(time.time())
+                )
+            return Route(start_city.id, end_city.id,
+                         travel_time='impossible route',
+                         fetched_at=int(time.time()))
+
+    @classmethod
+    def recompute_trip_routes(cls, concurrency=8, max_age=ROUTE_TTL):
+        """
+        refreshes the drive time stored on every road trip that has none or
+        stored it more than `max_age` seconds ago; routes younger than
+        ROUTE_CACHE_TTL are reused, the rest are fetched from MapQuest with
+        up to `concurrency` requests in flight. trips with stops are summed
+        leg by leg with route_legs, one trip at a time
+
+        returns how many trips were updated
+        """
+        stale = or_(RoadTrip.route_updated_at.is_(None),
+                    RoadTrip.route_updated_at < time.time() - max_age)
+        direct = ~RoadTrip.stops.any()
+        pairs = {
+            (start_id, end_id): (city_registry.get(start_id),
+                                 city_registry.get(end_id))
+            for start_id, end_id in RoadTrip.query.with_entities(
+                RoadTrip.start_city_id, RoadTrip.end_city_id
+            ).filter(stale, direct).distinct()
+        }
+        etas = cls._stored_routes(pairs)
+        missing = [pair for pair in pairs if pair not in etas]
+        if missing:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                routes = [route for route in pool.map(
+                    lambda pair: cls._request_route(*pairs[pair]), missing)
+                    if route is not None]
+            if routes:
+                Route.save_all(routes)
+            for route in routes:
+                etas[(route.start_city_id, route.end_city_id)] = \
+                    route.as_eta()
+
+        updated = 0
+        now = int(time.time())
+        for (start_id, end_id), eta in etas.items():
+            updated += RoadTrip.query.filter(
+                RoadTrip.start_city_id == start_id,
+                RoadTrip.end_city_id == end_id,
+                stale,
+                direct
+            ).update({
+                'travel_time': eta['string'],
+                'travel_seconds': eta.get('seconds'),
+                'route_updated_at': now,
+            }, synchronize_session=False)
 
-            return {'string': 'impossible route'}
+        for trip in RoadTrip.query.filter(stale, RoadTrip.stops.any()):
+            try:
+                eta = cls.route_legs(trip.cities())
+            except requests.RequestException:
+                continue
+            if eta is not None:
+                trip.set_route(eta)
+                updated += 1
+        db.session.commit()
+        return updated
@@ -0,0 +1,294 @@
+import csv
+import heapq
+import os
+import struct
+import threading
+
+import numpy as np
+
+from api import metrics
+from api.cache import LRUCache, on_reset
+from api.database.registry import city_key
+from api.services.gazetteer import read_places
+from api.services.spatial import haversine_miles
+
+MAGIC = b'RTRG'
+VERSION = 1
+# magic, version, node count, arc count, key blob length
+HEADER = struct.Struct('<4sIIII')
+
+
+def _node_key(label):
+    name, _, state = label.rpartition(',')
+    return city_key(name, state)
+
+
+def read_roads(source):
+    """
+    yields (from key, to key, miles, seconds) from a CSV with from, to,
+    miles and seconds columns, the cities written 'City, ST'
+    """
+    with open(source, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [c.strip().lower() for c in reader.fieldnames]
+        for column in ('from', 'to', 'miles', 'seconds'):
+            if column not in reader.fieldnames:
+                raise ValueError(f'{source} has no {column} column')
+        for row in reader:
+            try:
+                miles = float(row['miles'])
+                seconds = float(row['seconds'])
+            except (TypeError, ValueError):
+                continue
+            if seconds <= 0:
+                continue
+            yield _node_key(row['from']), _node_key(row['to']), miles, \
+                seconds
+
+
+def build(places, roads, output):
+    """
+    builds the road graph file from a places file (anything the gazetteer
+    reads) and a roads CSV, and returns (node count, arc count); every road
+    is drivable both ways and only places some road touches become nodes
+
+    layout, little-endian: header, count float64 latitudes, count float64
+    longitudes, count + 1 uint32 arc offsets per node, then per arc a
+    uint32 target node, float32 seconds and float32 miles, then count + 1
+    uint32 offsets into the key blob and the sorted utf-8 keys back to back
+    """
+    coords = {key: (lat, lng) for key, lat, lng, _ in read_places(places)}
+    arcs = {}
+    for start, end, miles, seconds in read_roads(roads):
+        if start not in coords or end not in coords or start == end:
+            continue
+        for a, b in ((start, end), (end, start)):
+            best = arcs.get((a, b))
+            if best is None or seconds < best[1]:
+                arcs[(a, b)] = (miles, seconds)
+
+    keys = sorted({key for pair in arcs for key in pair})
+    node = {key: i for i, key in enumerate(keys)}
+    count = len(keys)
+    adjacency = [[] for _ in range(count)]
+    for (a, b), (miles, seconds) in arcs.items():
+        adjacency[node[a]].append((node[b], seconds, miles))
+
+    offsets, targets, seconds, miles = [0], [], [], []
+    for edges in adjacency:
+        for target, s, m in sorted(edges):
+            targets.append(target)
+            seconds.append(s)
+            miles.append(m)
+        offsets.append(len(targets))
+    encoded = [key.encode('utf-8') for key in keys]
+    key_offsets = [0]
+    for key in encoded:
+        key_offsets.append(key_offsets[-1] + len(key))
+    blob = b''.join(encoded)
+    arc_count = len(targets)
+
+    tmp = f'{output}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, count, arc_count, len(blob)))
+        f.write(struct.pack(f'<{count}d', *(coords[k][0] for k in keys)))
+        f.write(struct.pack(f'<{count}d', *(coords[k][1] for k in keys)))
+        f.write(struct.pack(f'<{count + 1}I', *offsets))
+        f.write(struct.pack(f'<{arc_count}I', *targets))
+        f.write(struct.pack(f'<{arc_count}f', *seconds))
+        f.write(struct.pack(f'<{arc_count}f', *miles))
+        f.write(struct.pack(f'<{count + 1}I', *key_offsets))
+        f.write(blob)
+    os.replace(tmp, output)
+    return count, arc_count
+
+
+class RoadGraph:
+    """
+    city-to-city road graph loaded from a file written by build()
+
+    arcs sit in compressed adjacency arrays: the arcs leaving node i are
+    offsets[i]:offsets[i + 1] of the target, seconds and miles arrays.
+    fastest routes come from A* guided by the great-circle distance at the
+    fastest speed any road allows, which never overestimates, so every node
+    a search settles has its exact fastest time. those times are memoized
+    per source, so later queries from the same city to anywhere an earlier
+    search settled skip the search
+    """
+    def __init__(self, path, memo_size=256):
+        self.path = path
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.count, self.arc_count, blob_len = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a road graph')
+
+        def section(dtype, length):
+            nonlocal start
+            array = np.frombuffer(data, dtype=dtype, count=length,
+                                  offset=start)
+            start += array.nbytes
+            return array
+
+        start = HEADER.size
+        self.lats = section('<f8', self.count)
+        self.lngs = section('<f8', self.count)
+        self.offsets = section('<u4', self.count + 1)
+        self.targets = section('<u4', self.arc_count)
+        self.seconds = section('<f4', self.arc_count)
+        self.miles = section('<f4', self.arc_count)
+        key_offsets = section('<u4', self.count + 1).tolist()
+        blob = data[start:start + blob_len]
+        self._nodes = {
+            blob[key_offsets[i]:key_offsets[i + 1]].decode('utf-8'): i
+            for i in range(self.count)
+        }
+
+        # plain lists walk faster than NumPy scalars in the search loop
+        self._offsets = self.offsets.tolist()
+        self._targets = self.targets.tolist()
+        self._seconds = self.seconds.tolist()
+        self._miles = self.miles.tolist()
+
+        sources = np.repeat(np.arange(self.count), np.diff(self.offsets))
+        crow = haversine_miles(self.lats[sources], self.lngs[sources],
+                               self.lats[self.targets],
+                               self.lngs[self.targets])
+        self.top_mph = float((crow / self.seconds * 3600).max()) \
+            if self.arc_count else 1.0
+
+        self._memo = LRUCache(maxsize=memo_size)
+        self.queries = 0
+        self.searches = 0
+        self.settled = 0
+
+    def node(self, name, state):
+        return self._nodes.get(city_key(name, state))
+
+    def _heuristic(self, target):
+        miles = haversine_miles(self.lats[target], self.lngs[target],
+                                self.lats, self.lngs)
+        return (miles / self.top_mph * 3600).tolist()
+
+    def _search(self, source, target, memo):
+        """
+        A* from source until target is settled or nothing is left; returns
+        the memo for source with every node settled on the way
+        """
+        offsets, targets = self._offsets, self._targets
+        seconds, miles = self._seconds, self._miles
+        h = self._heuristic(target)
+        best = {source: 0.0}
+        distance = {source: 0.0}
+        settled = {}
+        heap = [(h[source], 0.0, source)]
+        exhausted = True
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled[node] = (cost, distance[node])
+            if node == target:
+                exhausted = False
+                break
+            for arc in range(offsets[node], offsets[node + 1]):
+                nxt = targets[arc]
+                if nxt in settled:
+                    continue
+                time_to = cost + seconds[arc]
+                if time_to < best.get(nxt, float('inf')):
+                    best[nxt] = time_to
+                    distance[nxt] = distance[node] + miles[arc]
+                    heapq.heappush(heap, (time_to + h[nxt], time_to, nxt))
+
+        self.searches += 1
+        self.settled += len(settled)
+        times = dict(memo[0]) if memo else {}
+        times.update(settled)
+        # an exhausted search has settled everything reachable
+        memo = (times, exhausted or (memo is not None and memo[1]))
+        self._memo.set(source, memo)
+        return memo
+
+    def fastest(self, source, target):
+        """
+        (seconds, miles) of the fastest route between two nodes, or None
+        when no road connects them
+        """
+        self.queries += 1
+        memo = self._memo.get(source)
+        if memo is None or (target not in memo[0] and not memo[1]):
+            memo = self._search(source, target, memo)
+        return memo[0].get(target)
+
+    def __len__(self):
+        return self.count
+
+    def stats(self):
+        return {
+            'nodes': self.count,
+            'arcs': self.arc_count,
+            'queries': self.queries,
+            'searches': self.searches,
+            'settled': self.settled,
+            'memo': self._memo.stats(),
+        }
+
+
+class _LazyRoadGraph:
+    """
+    opens ROAD_GRAPH_PATH on first use; without one every route misses
+    """
+    def __init__(self, path, memo_size=256):
+        self.path = path
+        self.memo_size = memo_size
+        self._graph = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self):
+        if self._graph is None and self.path and os.path.exists(self.path):
+            with self._lock:
+                if self._graph is None:
+                    self._graph = RoadGraph(self.path, self.memo_size)
+        return self._graph
+
+    def available(self):
+        return self._open() is not None
+
+    def route(self, start_city, end_city):
+        """
+        (seconds, miles) of the fastest drive between two cities, or None
+        when either city is not in the graph or no road joins them
+        """
+        graph = self._open()
+        found = None
+        if graph is not None:
+            source = graph.node(start_city.name, start_city.state)
+            target = graph.node(end_city.name, end_city.state)
+            if source is not None and target is not None:
+                found = graph.fastest(source, target)
+        if found is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return found
+
+    def clear(self):
+        if self._graph is not None:
+            self._graph._memo.clear()
+
+    def stats(self):
+        stats = {'hits': self.hits, 'misses': self.misses}
+        if self._graph is not None:
+            stats.update(self._graph.stats())
+        return stats
+
+
+road_graph = _LazyRoadGraph(
+    os.getenv('ROAD_GRAPH_PATH'),
+    memo_size=int(os.getenv('ROAD_GRAPH_MEMO_SOURCES', 256)))
+on_reset(road_graph.clear)
+metrics.register('road_graph', road_graph.stats)
@@ -0,0 +1,99 @@
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+from api import db, metrics
+
+# serialize identical upstream lookups across worker processes too, using
+# PostgreSQL advisory locks
+ADVISORY_LOCKS = os.getenv('SINGLEFLIGHT_ADVISORY_LOCKS', '') in \
+    ('1', 'true', 'yes')
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    collapses concurrent calls for the same key into one: the first caller
+    runs the function, everyone arriving while it is in flight waits for
+    and shares its result (or its exception)
+    """
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        metrics.register(f'singleflight.{name}', self.stats)
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._calls),
+        }
+
+
+@contextmanager
+def advisory_lock(key):
+    """
+    holds a PostgreSQL advisory lock on `key` for the duration of the
+    block, so workers in other processes wait for the one already
+    fetching. the lock is session-level and taken on a connection of its
+    own: it is released as soon as the block exits, whether or not the
+    request's transaction ever commits, and nothing done inside the block
+    is rolled back on its behalf. does nothing unless enabled or on other
+    databases
+    """
+    if ADVISORY_LOCKS and db.engine.dialect.name == 'postgresql':
+        lock_id = zlib.crc32(key.encode('utf-8'))
+        with db.engine.connect() as conn:
+            conn.execute(text('SELECT pg_advisory_lock(:id)'),
+                         {'id': lock_id})
+            try:
+                yield True
+            finally:
+                conn.execute(text('SELECT pg_advisory_unlock(:id)'),
+                             {'id': lock_id})
+    else:
+        yield False
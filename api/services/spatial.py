@@ -0,0 +1,188 @@
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from api import metrics
+from api.cache import on_reset
+from api.database.models import City
+from api.database.registry import city_registry
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+# drive time estimates: roads run this much longer than the great circle,
+# and the average speed climbs from town driving towards highway cruising
+# as trips get longer
+ROAD_FACTOR = float(os.getenv('ETA_ROAD_FACTOR', 1.25))
+TOWN_MPH = float(os.getenv('ETA_TOWN_MPH', 30))
+HIGHWAY_MPH = float(os.getenv('ETA_HIGHWAY_MPH', 62))
+HIGHWAY_MILES = float(os.getenv('ETA_HIGHWAY_MILES', 40))
+
+# how often the in-memory city indexes pick up cities other workers stored
+INDEX_REFRESH_INTERVAL = int(os.getenv('INDEX_REFRESH_INTERVAL', 60))
+
+
+def haversine_miles(lat, lng, lats, lngs):
+    """
+    great-circle distance in miles from one point to arrays of points, or
+    pairwise between equal-length arrays of points
+    """
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlng = np.radians(lngs) - np.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def estimate_drive(lats1, lngs1, lats2, lngs2):
+    """
+    estimated road miles and drive seconds between arrays of start and
+    end points, without asking a routing service
+    """
+    miles = haversine_miles(lats1, lngs1, lats2, lngs2) * ROAD_FACTOR
+    mph = HIGHWAY_MPH - (HIGHWAY_MPH - TOWN_MPH) * \
+        np.exp(-miles / HIGHWAY_MILES)
+    return miles, miles / mph * 3600
+
+
+class CityGrid:
+    """
+    in-memory spatial index over City coordinates
+
+    ids and coordinates live in parallel NumPy arrays that grow as cities
+    are inserted; positions are also bucketed into `cell_deg` degree grid
+    cells so a radius query only ranks cities in the cells it overlaps
+
+    with `refresh_interval` set, cities stored since the last load (by any
+    worker) are read in every that many seconds; ids are handed out
+    before commit, so the `sync_overlap` ids below the highest one loaded
+    are read again
+    """
+    def __init__(self, cell_deg=1.0, capacity=1024, refresh_interval=None,
+                 sync_overlap=1000):
+        self.cell_deg = cell_deg
+        self.lng_cells = int(math.ceil(360 / cell_deg))
+        self._capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.sync_overlap = sync_overlap
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.clear()
+
+    def clear(self):
+        self._ids = np.zeros(self._capacity, dtype=np.int64)
+        self._lats = np.zeros(self._capacity, dtype=np.float64)
+        self._lngs = np.zeros(self._capacity, dtype=np.float64)
+        self._size = 0
+        self._buckets = {}
+        self._positions = {}
+        self._loaded = False
+        self._high_water = 0
+        self._synced_at = None
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_deg)),
+                int(math.floor((lng + 180) / self.cell_deg)) % self.lng_cells)
+
+    def _append(self, city_id, lat, lng):
+        if city_id in self._positions:
+            return
+        if self._size == len(self._ids):
+            grow = max(len(self._ids), 1)
+            self._ids = np.concatenate([self._ids, np.zeros(grow, np.int64)])
+            self._lats = np.concatenate([self._lats, np.zeros(grow)])
+            self._lngs = np.concatenate([self._lngs, np.zeros(grow)])
+        pos = self._size
+        self._ids[pos] = city_id
+        self._lats[pos] = lat
+        self._lngs[pos] = lng
+        self._size += 1
+        self._positions[city_id] = pos
+        self._buckets.setdefault(self._cell(lat, lng), []).append(pos)
+
+    def add(self, city_id, lat, lng):
+        """
+        indexes a city the app just stored or looked up; before the first
+        load there is nothing to keep in step, the load will pick it up
+        """
+        with self._lock:
+            if self._loaded:
+                self._append(city_id, lat, lng)
+
+    def load(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and (self.refresh_interval is None or
+                                 now - self._synced_at <
+                                 self.refresh_interval):
+                return
+            for city_id, lat, lng in City.query.with_entities(
+                    City.id, City.lat, City.lng
+            ).filter(City.id > self._high_water - self.sync_overlap):
+                self._append(city_id, lat, lng)
+                self._high_water = max(self._high_water, city_id)
+            self._loaded = True
+            self._synced_at = now
+
+    def _candidates(self, lat, lng, radius):
+        dlat = radius / MILES_PER_DEGREE_LAT
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + dlat, 90))), 1e-6)
+        dlng = radius / (MILES_PER_DEGREE_LAT * cos_lat)
+        lat_lo, lng_lo = self._cell(lat - dlat, lng - dlng)
+        lat_hi, _ = self._cell(lat + dlat, lng)
+        lng_span = int(math.ceil(2 * dlng / self.cell_deg)) + 1
+        cells = (lat_hi - lat_lo + 1) * lng_span
+        if lng_span >= self.lng_cells or cells >= len(self._buckets):
+            return np.arange(self._size)
+
+        found = []
+        for i in range(lat_lo, lat_hi + 1):
+            for step in range(lng_span):
+                found.extend(self._buckets.get(
+                    (i, (lng_lo + step) % self.lng_cells), ()))
+        return np.array(found, dtype=np.int64)
+
+    def nearby(self, lat, lng, radius, limit=10):
+        """
+        returns up to `limit` (city_id, miles) pairs within `radius` miles
+        of lat/lng, nearest first
+        """
+        self.load()
+        with self._lock:
+            self.queries += 1
+            candidates = self._candidates(lat, lng, radius)
+            if len(candidates) == 0:
+                return []
+            miles = haversine_miles(
+                lat, lng, self._lats[candidates], self._lngs[candidates])
+            ids = self._ids[candidates]
+        inside = miles <= radius
+        miles, ids = miles[inside], ids[inside]
+        if len(miles) > limit:
+            top = np.argpartition(miles, limit)[:limit]
+            miles, ids = miles[top], ids[top]
+        order = np.argsort(miles, kind='stable')
+        return [(int(ids[i]), float(miles[i])) for i in order]
+
+    def __len__(self):
+        return self._size
+
+    def stats(self):
+        return {
+            'cities': self._size,
+            'cells': len(self._buckets),
+            'queries': self.queries,
+        }
+
+
+city_grid = CityGrid(cell_deg=float(os.getenv('CITY_GRID_CELL_DEG', 1.0)),
+                     refresh_interval=INDEX_REFRESH_INTERVAL)
+on_reset(city_grid.clear)
+metrics.register('city_grid', city_grid.stats)
+city_registry.subscribe(
+    lambda record: city_grid.add(record.id, record.lat, record.lng))
@@ -0,0 +1,249 @@
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+
+import numpy as np
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session, object_session
+
+from api import db, metrics
+from api.cache import on_reset
+from api.database.models import City, RoadTrip
+from api.database.registry import city_key, city_registry
+
+# sorts after any character a city key can contain
+_PREFIX_END = '\uffff'
+
+
+def normalize_prefix(q):
+    """
+    turns type-ahead input into a prefix of city keys:
+    'Arvada ,  C' -> 'arvada,c'
+    """
+    name, _, state = q.partition(',')
+    name = ' '.join(name.split()).lower()
+    return f'{name},{state.strip().lower()}' if _ else name
+
+
+class CitySuggester:
+    """
+    prefix search over known cities for type-ahead
+
+    every city key sits in one sorted list; the much smaller set of cities
+    used by at least one road trip sits in a second sorted list with their
+    trip counts in a parallel NumPy array. a prefix is two binary searches:
+    the popular cities in range are ranked by a partial sort of their slice
+    of counts and the rest of the page is filled alphabetically from the
+    full range, so no query walks the matching cities in Python
+
+    this worker's trip changes are counted as their transaction commits;
+    with `refresh_interval` set, the counts are taken again from the
+    roadtrips table and cities stored since the last load are read in
+    every that many seconds, which brings in other workers' changes
+    """
+    def __init__(self, refresh_interval=None, sync_overlap=1000):
+        self.refresh_interval = refresh_interval
+        self.sync_overlap = sync_overlap
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.clear()
+
+    def clear(self):
+        self._keys = []
+        self._entries = {}
+        self._key_for = {}
+        self._counts = {}
+        self._popular = []
+        self._popular_counts = np.zeros(0, dtype=np.int64)
+        self._loaded = False
+        self._high_water = 0
+        self._synced_at = None
+
+    def _insert(self, city_id, key, label):
+        if key in self._entries:
+            return
+        self._entries[key] = (city_id, label)
+        self._key_for[city_id] = key
+        insort(self._keys, key)
+
+    def _set_popular(self, key, count):
+        i = bisect_left(self._popular, key)
+        listed = i < len(self._popular) and self._popular[i] == key
+        if listed and count > 0:
+            self._popular_counts[i] = count
+        elif listed:
+            del self._popular[i]
+            self._popular_counts = np.delete(self._popular_counts, i)
+        elif count > 0:
+            self._popular.insert(i, key)
+            self._popular_counts = np.insert(self._popular_counts, i, count)
+
+    def add(self, city_id, name, state):
+        """
+        makes a newly stored city suggestible; before the first load the
+        load will pick it up instead
+        """
+        with self._lock:
+            if self._loaded:
+                self._insert(city_id, city_key(name, state),
+                             f'{name}, {state}')
+                key = self._key_for.get(city_id)
+                if key is not None and self._counts.get(city_id):
+                    self._set_popular(key, self._counts[city_id])
+
+    def count_trip(self, city_id, delta):
+        """
+        adjusts how many road trips start or end at `city_id`
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            count = self._counts.get(city_id, 0) + delta
+            if count > 0:
+                self._counts[city_id] = count
+            else:
+                self._counts.pop(city_id, None)
+            key = self._key_for.get(city_id)
+            if key is not None:
+                self._set_popular(key, count)
+
+    def load(self, rows=None, counts=None):
+        """
+        builds the index from (id, name, state) rows and a {city_id:
+        trip count} dict, by default from the cities and roadtrips tables,
+        then keeps both up to date from the tables
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded and (self.refresh_interval is None or
+                                 now - self._synced_at <
+                                 self.refresh_interval):
+                return
+            if rows is None:
+                rows = City.query.with_entities(
+                    City.id, City.name, City.state
+                ).filter(City.id > self._high_water - self.sync_overlap)
+            if counts is None:
+                counts = {}
+                for column in (RoadTrip.start_city_id, RoadTrip.end_city_id):
+                    for city_id, count in db.session.query(
+                            column, func.count(RoadTrip.id)).group_by(column):
+                        counts[city_id] = counts.get(city_id, 0) + count
+
+            for city_id, name, state in rows:
+                key = city_key(name, state)
+                self._entries.setdefault(key, (city_id, f'{name}, {state}'))
+                self._key_for[city_id] = key
+                self._high_water = max(self._high_water, city_id)
+            self._keys = sorted(self._entries)
+            self._counts = {i: c for i, c in counts.items() if c > 0}
+            self._popular = sorted(
+                self._key_for[i] for i in self._counts if i in self._key_for)
+            self._popular_counts = np.array(
+                [self._counts[self._entries[k][0]] for k in self._popular],
+                dtype=np.int64)
+            self._loaded = True
+            self._synced_at = now
+
+    def _top_popular(self, prefix, end, limit):
+        lo = bisect_left(self._popular, prefix)
+        hi = bisect_left(self._popular, end)
+        counts = self._popular_counts[lo:hi]
+        if len(counts) > limit:
+            # everything tied with the limit-th largest count stays in,
+            # so ties still break alphabetically
+            kth = np.partition(counts, len(counts) - limit)[-limit]
+            picked = np.flatnonzero(counts >= kth)
+        else:
+            picked = np.arange(len(counts))
+        order = picked[np.argsort(-counts[picked], kind='stable')][:limit]
+        return [self._popular[lo + i] for i in order.tolist()]
+
+    def suggest(self, q, limit=10):
+        """
+        returns up to `limit` (city_id, 'City, ST', trip count) tuples whose
+        key starts with `q`, most used first, then alphabetically
+        """
+        self.load()
+        prefix = normalize_prefix(q)
+        self.queries += 1
+        if not prefix:
+            return []
+        end = prefix + _PREFIX_END
+        with self._lock:
+            ranked = self._top_popular(prefix, end, limit)
+            if len(ranked) < limit:
+                keys = self._keys
+                taken = set(ranked)
+                i = bisect_left(keys, prefix)
+                while len(ranked) < limit and i < len(keys) and \
+                        keys[i] < end:
+                    if keys[i] not in taken:
+                        ranked.append(keys[i])
+                    i += 1
+
+            results = []
+            for key in ranked:
+                city_id, label = self._entries[key]
+                results.append((city_id, label, self._counts.get(city_id, 0)))
+        return results
+
+    def stats(self):
+        return {
+            'cities': len(self._keys),
+            'popular': len(self._popular),
+            'queries': self.queries,
+        }
+
+
+city_suggester = CitySuggester(
+    refresh_interval=int(os.getenv('INDEX_REFRESH_INTERVAL', 60)))
+on_reset(city_suggester.clear)
+metrics.register('city_suggester', city_suggester.stats)
+city_registry.subscribe(
+    lambda record: city_suggester.add(record.id, record.name, record.state))
+
+
+def _count_trip(trip, city_id, delta):
+    """
+    holds a trip count change until the trip's transaction commits
+    """
+    session = object_session(trip)
+    if session is None:
+        return
+    pending = session.info.setdefault('trip_counts', {})
+    pending[city_id] = pending.get(city_id, 0) + delta
+
+
+@event.listens_for(RoadTrip, 'after_insert')
+def _count_new_trip(mapper, connection, trip):
+    _count_trip(trip, trip.start_city_id, 1)
+    _count_trip(trip, trip.end_city_id, 1)
+
+
+@event.listens_for(RoadTrip.start_city_id, 'set', active_history=True)
+@event.listens_for(RoadTrip.end_city_id, 'set', active_history=True)
+def _count_moved_trip(trip, value, oldvalue, initiator):
+    # new trips are counted once inserted
+    if inspect(trip).persistent and value != oldvalue:
+        _count_trip(trip, oldvalue, -1)
+        _count_trip(trip, value, 1)
+
+
+@event.listens_for(RoadTrip, 'after_delete')
+def _count_deleted_trip(mapper, connection, trip):
+    _count_trip(trip, trip.start_city_id, -1)
+    _count_trip(trip, trip.end_city_id, -1)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_trip_counts(session):
+    for city_id, delta in session.info.pop('trip_counts', {}).items():
+        if delta:
+            city_suggester.count_trip(city_id, delta)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_trip_counts(session):
+    session.info.pop('trip_counts', None)
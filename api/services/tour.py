@@ -0,0 +1,81 @@
+import numpy as np
+
+# stands in for a leg with no road, big enough that any tour avoiding it
+# wins and small enough to keep the sums finite
+NO_ROUTE_SECONDS = 1e9
+
+
+def tour_seconds(order, seconds):
+    """
+    total drive time visiting the matrix positions in `order`
+    """
+    order = np.asarray(order)
+    return float(seconds[order[:-1], order[1:]].sum())
+
+
+def nearest_neighbour(seconds):
+    """
+    a tour from position 0 to the last position that always drives to the
+    closest stop not visited yet
+    """
+    last = len(seconds) - 1
+    order = [0]
+    left = list(range(1, last))
+    while left:
+        row = seconds[order[-1], left]
+        order.append(left.pop(int(np.argmin(row))))
+    order.append(last)
+    return order
+
+
+def two_opt(order, seconds):
+    """
+    improves a tour by reversing the stretch between two stops while any
+    reversal shortens it, always taking the best one; the first and last
+    positions stay put. drive times may differ by direction, so the
+    reversed stretch is priced with its reverse legs
+
+    every candidate reversal is priced at once from prefix sums of the
+    tour's forward and reverse legs, so a pass is a few NumPy operations
+    """
+    order = np.array(order)
+    n = len(order)
+    if n < 4:
+        return order.tolist()
+    i, j = np.triu_indices(n - 1, k=1)
+    keep = i >= 1
+    i, j = i[keep], j[keep]
+    while True:
+        forward = seconds[order[:-1], order[1:]]
+        backward = seconds[order[1:], order[:-1]]
+        forward_sum = np.concatenate([[0.0], np.cumsum(forward)])
+        backward_sum = np.concatenate([[0.0], np.cumsum(backward)])
+        # reverse order[i..j]: legs i-1 -> i and j -> j+1 are replaced by
+        # i-1 -> j and i -> j+1, and the legs between are driven backwards
+        before = forward[i - 1] + (forward_sum[j] - forward_sum[i]) + \
+            forward[j]
+        after = seconds[order[i - 1], order[j]] + \
+            (backward_sum[j] - backward_sum[i]) + \
+            seconds[order[i], order[j + 1]]
+        gain = before - after
+        best = int(np.argmax(gain))
+        if gain[best] <= 1e-9:
+            return order.tolist()
+        order[i[best]:j[best] + 1] = order[i[best]:j[best] + 1][::-1]
+
+
+def optimize_stops(seconds):
+    """
+    order in which to visit the stops of a drive time matrix whose first
+    position is the start city and last position the end city; returns
+    the positions in driving order, start and end included
+
+    nearest neighbour and the stops as given are both polished with 2-opt
+    and the quicker tour wins, so optimizing never makes a trip slower
+    """
+    seconds = np.where(np.isfinite(seconds), seconds, NO_ROUTE_SECONDS)
+    given = two_opt(list(range(len(seconds))), seconds)
+    greedy = two_opt(nearest_neighbour(seconds), seconds)
+    if tour_seconds(greedy, seconds) < tour_seconds(given, seconds):
+        return greedy
+    return given
@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from api import metrics
+from api.cache import on_reset
+from api.database.models import Route
+
+
+class _Row:
+    """
+    the known drive times from one city: destination ids and seconds in
+    parallel arrays, grown by doubling
+    """
+    __slots__ = ('ends', 'seconds', 'size')
+
+    def __init__(self, capacity):
+        self.ends = np.zeros(capacity, dtype=np.int64)
+        self.seconds = np.empty(capacity, dtype=np.float32)
+        self.size = 0
+
+    def set(self, end_id, seconds):
+        """
+        stores the drive time to `end_id`; True if it was not known yet
+        """
+        found = np.flatnonzero(self.ends[:self.size] == end_id)
+        if len(found):
+            self.seconds[found[0]] = seconds
+            return False
+        if self.size == len(self.ends):
+            self.ends = np.concatenate([self.ends, np.zeros_like(self.ends)])
+            self.seconds = np.concatenate(
+                [self.seconds, np.empty_like(self.seconds)])
+        self.ends[self.size] = end_id
+        self.seconds[self.size] = seconds
+        self.size += 1
+        return True
+
+
+class TravelTimeMatrix:
+    """
+    drive seconds between known cities, kept as a sparse NumPy matrix
+
+    each city that routes start from gets a row holding only the
+    destinations looked up from it, inf where there is no road, so memory
+    follows the routes on record instead of the square of the cities. the
+    rows are loaded from the routes table on first use and every route
+    lookup after that fills in its cell, so "where can I get to from here"
+    is one vectorized comparison over a row
+
+    with `refresh_interval` set, routes fetched since the last load (by
+    other workers or recompute_routes too) are read in every that many
+    seconds, going back `sync_overlap` seconds before the newest one seen
+    for rows that committed late
+    """
+    def __init__(self, capacity=16, refresh_interval=None, sync_overlap=300):
+        self._capacity = capacity
+        self.refresh_interval = refresh_interval
+        self.sync_overlap = sync_overlap
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.clear()
+
+    def clear(self):
+        self._rows = {}
+        self._cities = set()
+        self._known = 0
+        self._loaded = False
+        self._fetched_mark = 0
+        self._synced_at = None
+
+    def _set(self, start_id, end_id, seconds):
+        row = self._rows.get(start_id)
+        if row is None:
+            row = self._rows[start_id] = _Row(self._capacity)
+        if row.set(end_id, np.inf if seconds is None else seconds):
+            self._known += 1
+        self._cities.update((start_id, end_id))
+
+    def record(self, etas):
+        """
+        fills in {(start_id, end_id): eta} as returned by the
+        LocationService route lookups; before the first load there is
+        nothing to keep in step, the load reads the routes table
+        """
+        with self._lock:
+            if self._loaded:
+                for (start_id, end_id), eta in etas.items():
+                    if eta is not None:
+                        self._set(start_id, end_id, eta.get('seconds'))
+
+    def _sync(self):
+        for start_id, end_id, seconds, fetched_at in \
+                Route.query.with_entities(
+                    Route.start_city_id, Route.end_city_id, Route.seconds,
+                    Route.fetched_at
+                ).filter(Route.fetched_at >=
+                         self._fetched_mark - self.sync_overlap):
+            self._set(start_id, end_id, seconds)
+            self._fetched_mark = max(self._fetched_mark, fetched_at)
+
+    def load(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded:
+                if self.refresh_interval is not None and \
+                        now - self._synced_at >= self.refresh_interval:
+                    self._sync()
+                    self._synced_at = now
+                return
+            grouped = {}
+            for start_id, end_id, seconds, fetched_at in \
+                    Route.query.with_entities(
+                        Route.start_city_id, Route.end_city_id,
+                        Route.seconds, Route.fetched_at):
+                grouped.setdefault(start_id, {})[end_id] = \
+                    np.inf if seconds is None else seconds
+                self._fetched_mark = max(self._fetched_mark, fetched_at)
+            # each row built in one go rather than a cell at a time
+            for start_id, ends in grouped.items():
+                row = self._rows[start_id] = _Row(
+                    max(len(ends), self._capacity))
+                row.ends[:len(ends)] = list(ends)
+                row.seconds[:len(ends)] = list(ends.values())
+                row.size = len(ends)
+                self._known += len(ends)
+                self._cities.add(start_id)
+                self._cities.update(ends)
+            self._loaded = True
+            self._synced_at = now
+
+    def reachable(self, city_id, max_seconds, limit=100):
+        """
+        returns (known, [(city_id, seconds), ...]): how many destinations
+        from `city_id` have a drive time on record, and up to `limit` of
+        those within `max_seconds`, quickest first
+        """
+        self.load()
+        with self._lock:
+            self.queries += 1
+            row = self._rows.get(city_id)
+            if row is None:
+                return 0, []
+            keep = row.ends[:row.size] != city_id
+            ends = row.ends[:row.size][keep]
+            seconds = row.seconds[:row.size][keep]
+        inside = np.flatnonzero(seconds <= max_seconds)
+        if len(inside) > limit:
+            inside = inside[np.argpartition(seconds[inside], limit)[:limit]]
+        order = inside[np.argsort(seconds[inside], kind='stable')]
+        return len(ends), [(int(ends[i]), float(seconds[i])) for i in order]
+
+    def __len__(self):
+        return len(self._cities)
+
+    def stats(self):
+        return {
+            'cities': len(self._cities),
+            'rows': len(self._rows),
+            'pairs': self._known,
+            'queries': self.queries,
+        }
+
+
+travel_times = TravelTimeMatrix(
+    refresh_interval=int(os.getenv('INDEX_REFRESH_INTERVAL', 60)))
+on_reset(travel_times.clear)
+metrics.register('travel_time_matrix', travel_times.stats)
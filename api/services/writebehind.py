@@ -0,0 +1,202 @@
+import atexit
+import os
+import threading
+
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
+from api import db, metrics
+from api.cache import on_reset
+from api.database.models import City
+from api.database.registry import CityRecord, city_key, city_registry
+
+# serve newly geocoded cities from memory and insert them in the background
+WRITE_BEHIND = os.getenv('CITY_WRITE_BEHIND', '') in ('1', 'true', 'yes')
+
+
+class CityWriteBehind:
+    """
+    staging area for newly geocoded cities
+
+    a staged city gets its final id straight away, from a block of ids
+    reserved on the cities primary key sequence, and is served from the
+    city registry until a background thread inserts the pending rows in
+    batches. anything about to reference a city (a road trip) calls
+    persist() first, which flushes it if it is still pending
+
+    only PostgreSQL can hand out ids ahead of the insert, so elsewhere
+    cities keep being inserted in the request
+    """
+    def __init__(self, enabled=False, interval=1.0, batch_size=500,
+                 id_block=20):
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.id_block = id_block
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._app = None
+        self.staged = 0
+        self.flushed = 0
+        self.batches = 0
+        self.conflicts = 0
+        self.errors = 0
+        self.clear()
+        atexit.register(self._flush_at_exit)
+
+    def clear(self):
+        with self._lock:
+            self._pending = {}
+            self._by_key = {}
+            self._ids = []
+            self._remapped = {}
+
+    def active(self):
+        return self.enabled and db.engine.dialect.name == 'postgresql'
+
+    def _reserve_ids(self, count):
+        return [row[0] for row in db.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence('cities', 'id')) "
+                 "FROM generate_series(1, :count)"),
+            {'count': count}
+        )]
+
+    def stage(self, name, state, lat, lng):
+        """
+        returns the CityRecord for a new city without inserting it; the
+        row is written by the next flush
+        """
+        city = City(name=name, state=state, lat=lat, lng=lng)
+        with self._lock:
+            city_id = self._by_key.get(city.key)
+            if city_id is not None:
+                return self._pending[city_id]
+            if not self._ids:
+                self._ids = self._reserve_ids(self.id_block)
+            record = CityRecord(self._ids.pop(0), city.name, city.state,
+                                city.lat, city.lng)
+            self._pending[record.id] = record
+            self._by_key[city.key] = record.id
+            self.staged += 1
+            if len(self._pending) >= self.batch_size:
+                self._wake.set()
+        self._start()
+        return city_registry.add(record)
+
+    def _start(self):
+        if self._thread is not None or not self.interval:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._app = current_app._get_current_object()
+                self._thread = threading.Thread(
+                    target=self._run, name='city-write-behind', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self._app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    # rows stay pending and the next tick retries
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+
+    def _flush_at_exit(self):
+        if self._pending and self._app is not None:
+            with self._app.app_context():
+                self.flush()
+
+    def persist(self, city_id):
+        """
+        makes sure `city_id` is stored before something references it and
+        returns the id to reference; that is the same id unless another
+        worker stored the same city first
+        """
+        if city_id in self._pending:
+            self.flush()
+        return self._remapped.get(city_id, city_id)
+
+    def flush(self):
+        """
+        inserts every pending city, `batch_size` rows per statement, and
+        returns how many were written
+        """
+        with self._flush_lock:
+            with self._lock:
+                records = list(self._pending.values())
+            written = 0
+            try:
+                for start in range(0, len(records), self.batch_size):
+                    batch = records[start:start + self.batch_size]
+                    written += self._insert(batch)
+                    with self._lock:
+                        for record in batch:
+                            self._pending.pop(record.id, None)
+                            self._by_key.pop(
+                                city_key(record.name, record.state), None)
+            except Exception:
+                self.errors += 1
+                raise
+            self.flushed += written
+            return written
+
+    def _insert(self, records):
+        rows = [{'id': r.id, 'name': r.name, 'state': r.state,
+                 'key': city_key(r.name, r.state),
+                 'lat': r.lat, 'lng': r.lng} for r in records]
+        if db.engine.dialect.name == 'postgresql':
+            inserted = {row[0] for row in db.session.execute(
+                postgresql.insert(City.__table__).values(rows)
+                .on_conflict_do_nothing(index_elements=['key'])
+                .returning(City.__table__.c.id)
+            )}
+            db.session.commit()
+        else:
+            inserted = set()
+            for row in rows:
+                try:
+                    db.session.execute(City.__table__.insert(), row)
+                    db.session.commit()
+                    inserted.add(row['id'])
+                except IntegrityError:
+                    db.session.rollback()
+        self.batches += 1
+
+        for row in rows:
+            if row['id'] not in inserted:
+                # another worker stored this city under its own id first
+                stored = City.query.filter_by(key=row['key']).one()
+                self._remapped[row['id']] = stored.id
+                city_registry.discard(row['id'])
+                city_registry.add(stored)
+                self.conflicts += 1
+        return len(inserted)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'pending': len(self._pending),
+            'staged': self.staged,
+            'flushed': self.flushed,
+            'batches': self.batches,
+            'conflicts': self.conflicts,
+            'errors': self.errors,
+        }
+
+
+city_writer = CityWriteBehind(
+    enabled=WRITE_BEHIND,
+    interval=float(os.getenv('CITY_WRITE_BEHIND_INTERVAL', 1.0)),
+    batch_size=int(os.getenv('CITY_WRITE_BEHIND_BATCH', 500)),
+)
+on_reset(city_writer.clear)
+metrics.register('city_write_behind', city_writer.stats)
@@ -0,0 +1,223 @@
+"""
+helpers shared by the benchmark scripts
+
+each benchmark is a plain script, run from the project root:
+    python -m benchmarks.auth_cache
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import rsa
+from jose import jwk, jwt
+
+# point the app at a throwaway database unless the caller picked one
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+
+class LocalJWKS:
+    """
+    an RSA keypair plus the matching JWKS document written to disk, so
+    tokens can be signed locally and verified without calling Auth0
+    """
+    def __init__(self, path, kid='bench-key', bits=2048):
+        self.kid = kid
+        self.path = os.path.abspath(path)
+        _, private_key = rsa.newkeys(bits)
+        self.private_pem = private_key.save_pkcs1().decode('utf-8')
+        public = jwk.construct(self.private_pem, 'RS256').public_key()
+        key = public.to_dict()
+        key.update({'kid': kid, 'use': 'sig'})
+        with open(self.path, 'w') as f:
+            json.dump({'keys': [key]}, f)
+
+    @property
+    def url(self):
+        return f'file://{self.path}'
+
+    def sign(self, claims, kid=None):
+        return jwt.encode(
+            claims, self.private_pem, algorithm='RS256',
+            headers={'kid': kid or self.kid}
+        )
+
+
+class LocalMapQuest:
+    """
+    a stand-in for the MapQuest directions API on localhost, answering
+    /directions/v2/route and /directions/v2/routematrix after `latency`
+    seconds with a drive time made up from the location strings; point
+    MAPQUEST_URL at `url` before importing the app
+    """
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.requests = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, body):
+                stand_in.requests += 1
+                time.sleep(stand_in.latency)
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                seconds = stand_in.seconds(self.path, '')
+                self.reply({'route': {
+                    'time': seconds,
+                    'distance': seconds / 60,
+                    'formattedTime': time.strftime(
+                        '%H:%M:%S', time.gmtime(seconds)),
+                }})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(
+                    int(self.headers['Content-Length'])))
+                locations = body['locations']
+                if body['options'].get('allToAll'):
+                    times = [[stand_in.seconds(a, b) for b in locations]
+                             for a in locations]
+                    miles = [[t / 60 for t in row] for row in times]
+                else:
+                    times = [stand_in.seconds(locations[0], b)
+                             for b in locations]
+                    miles = [t / 60 for t in times]
+                self.reply({'info': {'statuscode': 0},
+                            'time': times, 'distance': miles})
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    @staticmethod
+    def seconds(a, b):
+        if a == b:
+            return 0
+        return 600 + sum(map(ord, urlparse(a).query + a + b)) % 7200
+
+
+def local_auth_app(bits=2048):
+    """
+    builds the app with its JWKS pointed at a freshly generated local
+    keypair; returns (app, keys, auth module)
+    """
+    keys = LocalJWKS(os.path.join(tempfile.mkdtemp(), 'jwks.json'),
+                     bits=bits)
+    os.environ['AUTH0_JWKS_URL'] = keys.url
+
+    from api import create_app, db
+    from api.auth import auth
+
+    auth.jwks_store.url = keys.url
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+    return app, keys, auth
+
+
+def claims(audience, issuer, permissions, ttl=3600, **extra):
+    now = int(time.time())
+    payload = {
+        'iss': issuer,
+        'sub': 'auth0|benchmark',
+        'aud': audience,
+        'iat': now,
+        'exp': now + ttl,
+        'permissions': permissions,
+    }
+    payload.update(extra)
+    return payload
+
+
+def measure(fn, iterations=200, setup=None):
+    """
+    calls `fn` `iterations` times and returns latency percentiles in
+    microseconds; `setup` runs before every call, outside the timing
+    """
+    samples = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'iterations': iterations,
+        'mean_us': round(statistics.mean(samples), 1),
+        'p50_us': round(samples[len(samples) // 2], 1),
+        'p99_us': round(samples[min(len(samples) - 1,
+                                    int(len(samples) * 0.99))], 1),
+    }
+
+
+def report(name, results):
+    print(f'== {name}')
+    for case, stats in results.items():
+        print(f'{case:<32} ' + '  '.join(
+            f'{k}={v}' for k, v in stats.items()))
+
+
+def parse_args(name, description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--baseline',
+        default=os.path.join('benchmarks', 'results', f'{name}.json'),
+        help='JSON baseline to compare against and (with --update) write')
+    parser.add_argument(
+        '--update', action='store_true',
+        help='overwrite the baseline with this run')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.5,
+        help='allowed p50 slowdown before a case counts as a regression')
+    parser.add_argument('--iterations', type=int, default=200)
+    return parser.parse_args()
+
+
+def check_baseline(results, args):
+    """
+    compares p50 latencies against the stored baseline, writes the new
+    baseline when asked (or when none exists yet) and exits non-zero on
+    a regression
+    """
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        for case, stats in results.items():
+            old = baseline.get(case)
+            if old and stats['p50_us'] > old['p50_us'] * (1 + args.tolerance):
+                regressions.append(
+                    f"{case}: p50 {old['p50_us']}us -> {stats['p50_us']}us")
+
+    if args.update or not os.path.exists(args.baseline):
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'recorded_at': int(time.time()),
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+        print(f'baseline written to {args.baseline}')
+
+    for line in regressions:
+        print(f'REGRESSION {line}')
+    if regressions:
+        sys.exit(1)
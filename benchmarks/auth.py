@@ -0,0 +1,86 @@
+"""
+per-request cost of the auth decorator path: get_token_auth_header,
+verify_decode_jwt, check_permissions and requires_auth end to end through
+the Flask test client, against a locally generated keypair and JWKS
+
+    python -m benchmarks.auth             # compare with the baseline
+    python -m benchmarks.auth --update    # record a new baseline
+"""
+from benchmarks import check_baseline, claims, local_auth_app, measure, \
+    parse_args, report
+
+LARGE_PERMISSIONS = [f'read:resource-{i}' for i in range(500)] + \
+    ['create:roadtrips']
+
+
+def main():
+    args = parse_args('auth', __doc__)
+    app, keys, auth = local_auth_app()
+    client = app.test_client()
+    issuer = f'https://{auth.AUTH0_DOMAIN}/'
+    n = args.iterations
+
+    tokens = {
+        'valid': keys.sign(claims(
+            auth.API_AUDIENCE, issuer, ['create:roadtrips'])),
+        'expired': keys.sign(claims(
+            auth.API_AUDIENCE, issuer, ['create:roadtrips'], ttl=-60)),
+        'wrong audience': keys.sign(claims(
+            'someone-else', issuer, ['create:roadtrips'])),
+        'large permissions': keys.sign(claims(
+            auth.API_AUDIENCE, issuer, LARGE_PERMISSIONS)),
+    }
+
+    def request(token, status):
+        headers = {'Authorization': f'Bearer {token}'}
+
+        def call():
+            response = client.get('/auth-required', headers=headers)
+            assert response.status_code == status, response.status_code
+        return call
+
+    def reset_all():
+        auth.token_cache.clear()
+        auth.jwks_store.clear()
+
+    results = {}
+    with app.test_request_context(
+            headers={'Authorization': f'Bearer {tokens["valid"]}'}):
+        results['get_token_auth_header'] = measure(
+            auth.get_token_auth_header, n)
+
+    payload = {'permissions': ['create:roadtrips']}
+    large_payload = {'permissions': LARGE_PERMISSIONS}
+    results['check_permissions'] = measure(
+        lambda: auth.check_permissions('create:roadtrips', payload), n)
+    results['check_permissions (501 perms)'] = measure(
+        lambda: auth.check_permissions('create:roadtrips', large_payload), n)
+
+    results['verify_decode_jwt (cold keys)'] = measure(
+        lambda: auth.verify_decode_jwt(tokens['valid']), n,
+        setup=auth.jwks_store.clear)
+    auth.jwks_store.get_key(keys.kid)
+    results['verify_decode_jwt (warm keys)'] = measure(
+        lambda: auth.verify_decode_jwt(tokens['valid']), n)
+
+    with app.app_context():
+        results['request valid (cold keys)'] = measure(
+            request(tokens['valid'], 200), n, setup=reset_all)
+        results['request valid (warm keys)'] = measure(
+            request(tokens['valid'], 200), n, setup=auth.token_cache.clear)
+        results['request valid (cached token)'] = measure(
+            request(tokens['valid'], 200), n)
+        results['request expired'] = measure(
+            request(tokens['expired'], 401), n)
+        results['request wrong audience'] = measure(
+            request(tokens['wrong audience'], 401), n)
+        results['request large permissions'] = measure(
+            request(tokens['large permissions'], 200), n,
+            setup=auth.token_cache.clear)
+
+    report('auth', results)
+    check_baseline(results, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+cold vs warm latency of an authenticated request through the Flask test
+client, with the verified-token cache empty and populated
+"""
+from benchmarks import claims, local_auth_app, measure, report
+
+
+def main():
+    app, keys, auth = local_auth_app()
+    client = app.test_client()
+    token = keys.sign(claims(
+        auth.API_AUDIENCE, f'https://{auth.AUTH0_DOMAIN}/',
+        ['create:roadtrips']
+    ))
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def request():
+        response = client.get('/auth-required', headers=headers)
+        assert response.status_code == 200, response.status_code
+
+    request()  # load the JWKS
+    results = {
+        'cold (verify every call)': measure(
+            request, setup=auth.token_cache.clear),
+    }
+    auth.token_cache.clear()
+    results['warm (cached payload)'] = measure(request)
+    results['warm (cached payload)']['hit_rate'] = \
+        auth.token_cache.stats()['hit_rate']
+    report('auth cache', results)
+
+
+if __name__ == '__main__':
+    main()
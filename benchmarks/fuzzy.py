@@ -0,0 +1,49 @@
+"""
+typo-tolerant city matching with the trigram index over 50k known cities
+
+    python -m benchmarks.fuzzy
+"""
+import random
+
+from benchmarks import check_baseline, measure, parse_args, report
+from benchmarks.gazetteer import STATES
+from api.services.fuzzy import TrigramIndex
+
+CITIES = 50000
+SYLLABLES = ['ar', 'va', 'da', 'den', 'ver', 'es', 'tes', 'park', 'bo', 'ul',
+             'der', 'lake', 'wood', 'spring', 'field', 'mont', 'ton', 'ville']
+
+
+def typo(name, rng):
+    i = rng.randrange(len(name))
+    return name[:i] + name[i] + name[i:]
+
+
+def main():
+    args = parse_args('fuzzy', __doc__)
+    rng = random.Random(1)
+    rows = []
+    for i in range(CITIES):
+        name = ''.join(rng.choice(SYLLABLES)
+                       for _ in range(rng.randint(2, 4))).title()
+        rows.append((i, f'{name} {i}', rng.choice(STATES)))
+
+    index = TrigramIndex()
+    index.load(rows)
+    typos = iter([(typo(name, rng), state)
+                  for _, name, state in rng.choices(
+                      rows, k=args.iterations * 2)])
+    unknown = iter([(f'Nowhere{i}', rng.choice(STATES))
+                    for i in range(args.iterations * 2)])
+    results = {
+        f'match typo ({CITIES} cities)': measure(
+            lambda: index.match(*next(typos)), args.iterations),
+        f'no match ({CITIES} cities)': measure(
+            lambda: index.match(*next(unknown)), args.iterations),
+    }
+    report('fuzzy', results)
+    check_baseline(results, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+lookup latency of the memory-mapped offline gazetteer against a synthetic
+places file about the size of the Census national places gazetteer
+
+    python -m benchmarks.gazetteer
+"""
+import os
+import random
+import tempfile
+
+from benchmarks import check_baseline, measure, parse_args, report
+from api.services.gazetteer import Gazetteer, build
+
+PLACES = 32000
+STATES = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI',
+          'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD', 'MA', 'MI',
+          'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC',
+          'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT',
+          'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
+
+
+def synthetic_places(path, count, rng):
+    syllables = ['ar', 'va', 'da', 'den', 'ver', 'es', 'tes', 'park', 'bo',
+                 'ul', 'der', 'lake', 'wood', 'spring', 'field', 'mont']
+    names = []
+    with open(path, 'w') as f:
+        f.write('USPS\tNAME\tINTPTLAT\tINTPTLONG\n')
+        for i in range(count):
+            name = ''.join(rng.choice(syllables)
+                           for _ in range(rng.randint(2, 4))).title()
+            name = f'{name} {i}'
+            state = rng.choice(STATES)
+            names.append(f'{name.lower()},{state.lower()}')
+            f.write(f'{state}\t{name} city\t{rng.uniform(25, 49):.6f}\t'
+                    f'{rng.uniform(-124, -67):.6f}\n')
+    return names
+
+
+def main():
+    args = parse_args('gazetteer', __doc__)
+    rng = random.Random(1)
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, 'places.txt')
+    output = os.path.join(workdir, 'places.idx')
+    keys = synthetic_places(source, PLACES, rng)
+    build(source, output)
+    index = Gazetteer(output)
+
+    hits = iter(rng.choice(keys) for _ in range(args.iterations * 2))
+    misses = iter(f'nowhere {i},zz' for i in range(args.iterations * 2))
+    results = {
+        f'lookup hit ({PLACES} places)': measure(
+            lambda: index.lookup(next(hits)), args.iterations),
+        f'lookup miss ({PLACES} places)': measure(
+            lambda: index.lookup(next(misses)), args.iterations),
+    }
+    report('gazetteer', results)
+    check_baseline(results, args)
+
+
+if __name__ == '__main__':
+    main()
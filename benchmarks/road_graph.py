@@ -0,0 +1,91 @@
+"""
+fastest-route queries on the local road graph over a synthetic network of
+a few thousand cities: cold A* searches against the per-source memo, and
+plain Dijkstra (no heuristic) for comparison
+
+    python -m benchmarks.road_graph
+"""
+import math
+import os
+import random
+import tempfile
+
+from benchmarks import check_baseline, measure, parse_args, report
+from api.services.roadgraph import RoadGraph, build
+
+# a jittered grid of cities across the lower 48, each joined by road to
+# its grid neighbours and now and then diagonally
+ROWS, COLUMNS = 50, 90
+
+
+def synthetic_network(workdir, rng):
+    places = os.path.join(workdir, 'places.csv')
+    roads = os.path.join(workdir, 'roads.csv')
+    coords = {}
+    with open(places, 'w') as f:
+        f.write('name,state,lat,lng\n')
+        for row in range(ROWS):
+            for column in range(COLUMNS):
+                lat = 25 + 24 * (row + rng.uniform(0.1, 0.9)) / ROWS
+                lng = -124 + 57 * (column + rng.uniform(0.1, 0.9)) / COLUMNS
+                coords[(row, column)] = (lat, lng)
+                f.write(f'Town {row}-{column},ZZ,{lat:.6f},{lng:.6f}\n')
+
+    with open(roads, 'w') as f:
+        f.write('from,to,miles,seconds\n')
+        for (row, column), (lat, lng) in coords.items():
+            for step in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                other = (row + step[0], column + step[1])
+                if other not in coords or \
+                        (step[1] and step[0] and rng.random() > 0.3):
+                    continue
+                olat, olng = coords[other]
+                miles = math.hypot(
+                    (lat - olat) * 69,
+                    (lng - olng) * 69 * math.cos(math.radians(lat))
+                ) * rng.uniform(1.1, 1.5)
+                seconds = miles / rng.uniform(35, 70) * 3600
+                f.write(f'"Town {row}-{column}, ZZ",'
+                        f'"Town {other[0]}-{other[1]}, ZZ",'
+                        f'{miles:.2f},{seconds:.0f}\n')
+    return places, roads
+
+
+def main():
+    args = parse_args('road_graph', __doc__)
+    rng = random.Random(1)
+    workdir = tempfile.mkdtemp()
+    places, roads = synthetic_network(workdir, rng)
+    output = os.path.join(workdir, 'roads.graph')
+    nodes, arcs = build(places, roads, output)
+    graph = RoadGraph(output, memo_size=args.iterations * 2)
+    dijkstra = RoadGraph(output, memo_size=args.iterations * 2)
+    dijkstra.top_mph = float('inf')
+
+    pairs = [(rng.randrange(nodes), rng.randrange(nodes))
+             for _ in range(args.iterations)]
+    # a road trip app asks about the same few start cities over and over
+    sources = [rng.randrange(nodes) for _ in range(10)]
+    repeats = [(rng.choice(sources), rng.randrange(nodes))
+               for _ in range(args.iterations)]
+    for source in sources:
+        graph.fastest(source, rng.randrange(nodes))
+
+    label = f'({nodes} cities, {arcs} arcs)'
+    cold, plain, warm = iter(pairs), iter(pairs), iter(repeats)
+    results = {
+        f'A* cold {label}': measure(
+            lambda: graph.fastest(*next(cold)), args.iterations),
+        f'Dijkstra cold {label}': measure(
+            lambda: dijkstra.fastest(*next(plain)), args.iterations),
+        f'A* memoized source {label}': measure(
+            lambda: graph.fastest(*next(warm)), args.iterations),
+    }
+    report('road_graph', results)
+    print(f"searches: {graph.searches}, nodes settled per search: "
+          f"{graph.settled // max(graph.searches, 1)}")
+    check_baseline(results, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+GET /api/roadtrips with a cold routes table against a local MapQuest
+stand-in answering after 20ms: one directions call per trip versus the
+routematrix batching the listing uses, as the trip count grows
+
+    python -m benchmarks.roadtrip_listing
+"""
+import os
+
+from benchmarks import LocalMapQuest, check_baseline, claims, \
+    local_auth_app, measure, parse_args, report
+
+TRIPS = (10, 50, 200)
+CITIES = 20
+
+
+def main():
+    args = parse_args('roadtrip_listing', __doc__)
+    mapquest = LocalMapQuest(latency=0.02)
+    os.environ['MAPQUEST_URL'] = mapquest.url
+    app, keys, auth = local_auth_app()
+
+    from api import db
+    from api.database.models import City, RoadTrip, Route
+    from api.database.registry import city_registry
+    from api.services.location import LocationService
+
+    client = app.test_client()
+    token = keys.sign(claims(auth.API_AUDIENCE, f'https://{auth.AUTH0_DOMAIN}/',
+                             ['get:roadtrips']))
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def cold_routes():
+        Route.query.delete()
+        db.session.commit()
+
+    def listing():
+        response = client.get('/api/roadtrips', headers=headers)
+        assert response.status_code == 200, response.status_code
+
+    def per_trip():
+        for rt in RoadTrip.query.all():
+            LocationService.route_distance_time(rt.start_city(),
+                                                rt.end_city())
+
+    results = {}
+    with app.app_context():
+        cities = []
+        for i in range(CITIES):
+            city = City(name=f'Town {i}', state='CO', lat=39.0, lng=-105.0)
+            city.insert()
+            cities.append(city.id)
+        added = 0
+        for trips in TRIPS:
+            for i in range(added, trips):
+                RoadTrip(name=f'trip {i}',
+                         start_city_id=cities[i % CITIES],
+                         end_city_id=cities[(i * 7 + 3) % CITIES]).insert()
+            added = trips
+            city_registry.clear()
+
+            mapquest.requests = 0
+            results[f'routematrix ({trips} trips)'] = measure(
+                listing, args.iterations, setup=cold_routes)
+            calls = mapquest.requests / args.iterations
+            print(f'{trips} trips: {calls:.0f} MapQuest call(s) per listing')
+
+            results[f'per trip ({trips} trips)'] = measure(
+                per_trip, max(args.iterations // 40, 3), setup=cold_routes)
+    report('roadtrip_listing', results)
+    check_baseline(results, args)
+
+
+if __name__ == '__main__':
+    main()
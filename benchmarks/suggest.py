@@ -0,0 +1,51 @@
+"""
+type-ahead city suggestions over 100k known cities, a fifth of them used
+by road trips; the p99 budget per suggestion is 1ms
+
+    python -m benchmarks.suggest
+"""
+import random
+
+from benchmarks import check_baseline, measure, parse_args, report
+from benchmarks.gazetteer import STATES
+from api.services.suggest import CitySuggester
+
+CITIES = 100000
+POPULAR = 20000
+SYLLABLES = ['ar', 'va', 'da', 'den', 'ver', 'es', 'tes', 'park', 'bo', 'ul',
+             'der', 'lake', 'wood', 'spring', 'field', 'mont', 'ton', 'ville']
+
+
+def main():
+    args = parse_args('suggest', __doc__)
+    rng = random.Random(1)
+    rows = []
+    for i in range(CITIES):
+        name = ''.join(rng.choice(SYLLABLES)
+                       for _ in range(rng.randint(2, 4))).title()
+        rows.append((i, f'{name} {i}', rng.choice(STATES)))
+    # a few cities see most of the trips
+    counts = {i: int(1000 / (rank + 1)) + 1 for rank, i in
+              enumerate(rng.sample(range(CITIES), POPULAR))}
+
+    suggester = CitySuggester()
+    suggester.load(rows, counts)
+    names = [name.lower() for _, name, _ in rows]
+
+    def prefixes(low, high):
+        return iter([name[:rng.randint(low, high)]
+                     for name in rng.choices(names, k=args.iterations * 2)])
+
+    short, typed = prefixes(1, 1), prefixes(2, 6)
+    results = {
+        f'1 letter ({CITIES} cities)': measure(
+            lambda: suggester.suggest(next(short)), args.iterations),
+        f'2-6 letters ({CITIES} cities)': measure(
+            lambda: suggester.suggest(next(typed)), args.iterations),
+    }
+    report('suggest', results)
+    check_baseline(results, args)
+
+
+if __name__ == '__main__':
+    main()
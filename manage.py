@@ -2,7 +2,10 @@ from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
 from api import create_app, db
+from api.auth.auth import issue_service_token, revoke_token
 from api.database.models import User, City, RoadTrip
+from api.services import gazetteer, roadgraph
+from api.services.location import LocationService, ROUTE_TTL
 from tests import db_drop_everything
 
 app = create_app()
@@ -18,6 +21,64 @@ def routes():
     print(app.url_map)
 
 
+@manager.option('-p', '--permissions', dest='permissions',
+                default='get:roadtrips')
+@manager.option('-s', '--subject', dest='subject', default='service')
+@manager.option('-t', '--ttl', dest='ttl', type=int, default=900)
+def service_token(permissions, subject, ttl):
+    """
+    prints an HS256 service token, e.g.
+    python manage.py service_token -p get:roadtrips,create:roadtrips
+    """
+    print(issue_service_token(permissions.split(','), subject, ttl))
+
+
+@manager.option('token')
+def revoke(token):
+    """
+    refuses a bearer token before its 'exp'
+    """
+    revoke_token(token)
+
+
+@manager.option('output')
+@manager.option('source')
+def build_gazetteer(source, output):
+    """
+    builds the offline geocoding index from a Census gazetteer places file
+    (or a CSV with name, state, lat, lng columns); point GAZETTEER_PATH at
+    the output
+    """
+    count = gazetteer.build(source, output)
+    print(f'indexed {count} places into {output}')
+
+
+@manager.option('output')
+@manager.option('roads')
+@manager.option('places')
+def build_road_graph(places, roads, output):
+    """
+    builds the local routing graph from a places file (like
+    build_gazetteer's) and a CSV of roads with from, to, miles and seconds
+    columns; point ROAD_GRAPH_PATH at the output
+    """
+    nodes, arcs = roadgraph.build(places, roads, output)
+    print(f'indexed {nodes} cities and {arcs} road arcs into {output}')
+
+
+@manager.option('-a', '--max-age', dest='max_age', type=int,
+                default=ROUTE_TTL)
+@manager.option('-c', '--concurrency', dest='concurrency', type=int,
+                default=8)
+def recompute_routes(concurrency, max_age):
+    """
+    refreshes road trip drive times stored more than max_age seconds ago
+    (or never), with up to `concurrency` MapQuest requests at once
+    """
+    updated = LocationService.recompute_trip_routes(concurrency, max_age)
+    print(f'updated {updated} road trips')
+
+
 @manager.command
 def db_setup():
     db_drop_everything(db)
@@ -0,0 +1,48 @@
+"""empty message
+
+Revision ID: 8c2f4b6d1e37
+Revises: 5a1c7e3d9b20
+Create Date: 2026-10-18 10:03:27.519846
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2f4b6d1e37'
+down_revision = '5a1c7e3d9b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('cities', sa.Column('key', sa.String(length=84), nullable=True))
+    op.execute(
+        "UPDATE cities SET key = lower(regexp_replace(trim(name), '\\s+', ' ', 'g'))"
+        " || ',' || lower(trim(state))"
+    )
+    # point road trips at the oldest row for each key, then drop the rest
+    op.execute(
+        "UPDATE roadtrips SET start_city_id = keep.id FROM cities c, "
+        "(SELECT key, min(id) AS id FROM cities GROUP BY key) keep "
+        "WHERE roadtrips.start_city_id = c.id AND c.key = keep.key "
+        "AND c.id <> keep.id"
+    )
+    op.execute(
+        "UPDATE roadtrips SET end_city_id = keep.id FROM cities c, "
+        "(SELECT key, min(id) AS id FROM cities GROUP BY key) keep "
+        "WHERE roadtrips.end_city_id = c.id AND c.key = keep.key "
+        "AND c.id <> keep.id"
+    )
+    op.execute(
+        "DELETE FROM cities WHERE id NOT IN "
+        "(SELECT min(id) FROM cities GROUP BY key)"
+    )
+    op.alter_column('cities', 'key', nullable=False)
+    op.create_index(op.f('ix_cities_key'), 'cities', ['key'], unique=True)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_cities_key'), table_name='cities')
+    op.drop_column('cities', 'key')
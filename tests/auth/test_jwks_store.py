@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from api.auth.jwks import JWKSStore
+
+
+def _jwks(*kids):
+    return {'keys': [
+        {'kty': 'RSA', 'kid': kid, 'use': 'sig', 'n': 'abc', 'e': 'AQAB'}
+        for kid in kids
+    ]}
+
+
+class JWKSFileTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self._write('key-1')
+        self.url = f'file://{self.path}'
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _write(self, *kids):
+        with open(self.path, 'w') as f:
+            json.dump(_jwks(*kids), f)
+
+
+class JWKSStoreTest(JWKSFileTest):
+    def test_fetches_once_while_fresh(self):
+        store = JWKSStore(self.url, ttl=60, refresh_margin=10)
+        self.assertEqual('key-1', store.get_key('key-1')['kid'])
+        self.assertEqual('key-1', store.get_key('key-1')['kid'])
+        self.assertEqual(1, store.fetches)
+
+    def test_refetches_after_ttl(self):
+        store = JWKSStore(self.url, ttl=60, min_refresh_interval=0)
+        store.get_key('key-1')
+        store._fetched_at -= 61
+        store.get_key('key-1')
+        self.assertEqual(2, store.fetches)
+
+    def test_unknown_kid_refetches(self):
+        store = JWKSStore(self.url, ttl=60, min_refresh_interval=0)
+        store.get_key('key-1')
+        self._write('key-1', 'key-2')
+
+        self.assertEqual('key-2', store.get_key('key-2')['kid'])
+        self.assertEqual(2, store.fetches)
+
+    def test_unknown_kid_refetch_is_rate_limited(self):
+        store = JWKSStore(self.url, ttl=60, min_refresh_interval=30)
+        store.get_key('key-1')
+        self._write('key-1', 'key-2')
+
+        self.assertIsNone(store.get_key('key-2'))
+        self.assertEqual(1, store.fetches)
+
+    def test_background_refresh_before_expiry(self):
+        store = JWKSStore(self.url, ttl=60, refresh_margin=10)
+        store.get_key('key-1')
+        self._write('key-1', 'key-2')
+        store._fetched_at -= 55
+        store._last_attempt -= 55
+
+        # served from the current keys while the refresh runs
+        self.assertEqual('key-1', store.get_key('key-1')['kid'])
+        for _ in range(100):
+            if store.fetches == 2:
+                break
+            time.sleep(0.01)  # pragma: no cover
+        self.assertEqual(2, store.fetches)
+        self.assertIsNotNone(store._keys.get('key-2'))
+
+    def test_short_ttl_with_default_margin(self):
+        store = JWKSStore(self.url, ttl=120)
+        self.assertEqual(60, store.refresh_margin)
+        for _ in range(20):
+            self.assertEqual('key-1', store.get_key('key-1')['kid'])
+        self.assertEqual(1, store.fetches)
+
+    def test_background_refresh_is_rate_limited(self):
+        store = JWKSStore(self.url, ttl=60, refresh_margin=10,
+                          min_refresh_interval=30)
+        store.get_key('key-1')
+        store._fetched_at -= 55
+
+        for _ in range(20):
+            store.get_key('key-1')
+        self.assertFalse(store._refreshing)
+        self.assertEqual(1, store.fetches)
+
+
+class SharedJWKSStoreTest(JWKSFileTest):
+    def setUp(self):
+        super().setUp()
+        self.shared_dir = tempfile.mkdtemp()
+        self.shared_path = os.path.join(self.shared_dir, 'jwks.json')
+
+    def tearDown(self):
+        super().tearDown()
+        for name in os.listdir(self.shared_dir):
+            os.remove(os.path.join(self.shared_dir, name))
+        os.rmdir(self.shared_dir)
+
+    def _worker(self, **kwargs):
+        kwargs.setdefault('ttl', 60)
+        kwargs.setdefault('refresh_margin', 10)
+        return JWKSStore(self.url, shared_path=self.shared_path, **kwargs)
+
+    def test_cold_worker_reads_shared_copy(self):
+        first, second = self._worker(), self._worker()
+        first.get_key('key-1')
+        self.assertEqual('key-1', second.get_key('key-1')['kid'])
+        self.assertEqual(1, first.fetches)
+        self.assertEqual(0, second.fetches)
+
+    def test_stale_shared_copy_is_refetched(self):
+        first = self._worker()
+        first.get_key('key-1')
+        with open(self.shared_path) as f:
+            shared = json.load(f)
+        shared['fetched_at'] -= 120
+        with open(self.shared_path, 'w') as f:
+            json.dump(shared, f)
+
+        second = self._worker()
+        second.get_key('key-1')
+        self.assertEqual(1, second.fetches)
+
+    def test_unknown_kid_picks_up_other_workers_refetch(self):
+        first = self._worker(min_refresh_interval=0)
+        second = self._worker(min_refresh_interval=0)
+        first.get_key('key-1')
+        second.get_key('key-1')
+        self._write('key-1', 'key-2')
+
+        self.assertEqual('key-2', first.get_key('key-2')['kid'])
+        self.assertEqual('key-2', second.get_key('key-2')['kid'])
+        self.assertEqual(2, first.fetches)
+        self.assertEqual(0, second.fetches)
@@ -0,0 +1,157 @@
+import hashlib
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from jose import jwt
+
+from api import create_app, db
+from api.auth.auth import revoke_token, revocations, token_cache
+from api.auth.revocation import BloomFilter, RevocationList
+from api.database.models import RevokedToken
+from tests import db_drop_everything
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode('utf-8')).digest()
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        digests = [_digest(f'token-{i}') for i in range(1000)]
+        for d in digests:
+            bloom.add(d)
+        self.assertTrue(all(d in bloom for d in digests))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(_digest(f'token-{i}'))
+        false_positives = sum(
+            _digest(f'other-{i}') in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class RevocationTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        token_cache.clear()
+
+    def tearDown(self):
+        token_cache.clear()
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+    def _get(self):
+        return self.client.get(
+            '/auth-required',
+            headers={'Authorization': 'Bearer token-abc123'}
+        )
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    def test_revoked_token_is_refused(self, mock_verify_decode_jwt):
+        mock_verify_decode_jwt.return_value = {
+            'exp': int(time.time()) + 60,
+            'permissions': ['create:roadtrips']
+        }
+        self.assertEqual(200, self._get().status_code)
+        revoke_token('token-abc123')
+        self.assertEqual(401, self._get().status_code)
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    def test_unrevoked_token_skips_database(self, mock_verify_decode_jwt):
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips']
+        }
+        RevokedToken(_digest('some-other-token').hex()).insert()
+        revocations.sync(force=True)
+
+        self.assertEqual(200, self._get().status_code)
+        self.assertEqual(0, revocations.stats()['positives'])
+
+    def test_other_worker_syncs_from_high_water_mark(self):
+        worker = RevocationList(refresh_interval=0)
+        worker.sync()
+        self.assertEqual(0, worker.high_water)
+
+        revocations.revoke(_digest('token-1'))
+        revocations.revoke(_digest('token-2'))
+        self.assertTrue(worker.is_revoked(_digest('token-1')))
+        self.assertTrue(worker.is_revoked(_digest('token-2')))
+        self.assertFalse(worker.is_revoked(_digest('token-3')))
+        self.assertEqual(2, worker.high_water)
+
+    def test_filter_grows_past_capacity(self):
+        worker = RevocationList(capacity=2, refresh_interval=0)
+        for i in range(5):
+            RevokedToken(_digest(f'token-{i}').hex()).insert()
+        for i in range(5):
+            self.assertTrue(worker.is_revoked(_digest(f'token-{i}')))
+        self.assertGreaterEqual(worker.bloom.capacity, 5)
+
+    def _insert(self, row_id, value):
+        row = RevokedToken(_digest(value).hex())
+        row.id = row_id
+        row.insert()
+
+    def test_sync_picks_up_late_commits_below_high_water(self):
+        worker = RevocationList(refresh_interval=0)
+        self._insert(1, 'token-1')
+        self._insert(3, 'token-3')
+        worker.sync()
+        self.assertEqual(3, worker.high_water)
+
+        # id 2 was handed out before 3 but committed after the sync
+        self._insert(2, 'token-2')
+        self.assertTrue(worker.is_revoked(_digest('token-2')))
+        self.assertEqual(3, worker.high_water)
+        self.assertEqual(3, worker.bloom.count)
+
+    def test_periodic_rebuild_catches_commits_past_the_overlap(self):
+        worker = RevocationList(refresh_interval=0, sync_overlap=0,
+                                rebuild_interval=3600)
+        self._insert(1, 'token-1')
+        self._insert(3, 'token-3')
+        worker.sync()
+        self._insert(2, 'token-2')
+        worker.sync()
+        self.assertNotIn(_digest('token-2'), worker.bloom)
+
+        worker._rebuilt_at -= 3600
+        self.assertTrue(worker.is_revoked(_digest('token-2')))
+
+    def test_revoking_twice_is_fine(self):
+        revoke_token('token-abc123')
+        revoke_token('token-abc123')
+        self.assertEqual(1, RevokedToken.query.count())
+        self.assertTrue(revocations.is_revoked(_digest('token-abc123')))
+
+    def test_revocation_expires_with_the_token(self):
+        exp = int(time.time()) + 600
+        token = jwt.encode({'exp': exp}, 'secret')
+        revoke_token(token)
+        self.assertEqual(exp, RevokedToken.query.one().expires_at)
+
+    def test_sync_runs_once_per_interval_across_threads(self):
+        worker = RevocationList(refresh_interval=60)
+        worker._synced_at = time.monotonic() - 61
+        with patch('api.database.models.RevokedToken.query') as mock_query:
+            # a slow query, so the other threads queue up on the lock
+            mock_query.all.side_effect = lambda: time.sleep(0.05) or []
+            mock_query.filter.return_value.all.return_value = []
+            threads = [threading.Thread(target=worker.sync)
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(
+            1, mock_query.all.call_count +
+            mock_query.filter.return_value.all.call_count)
@@ -0,0 +1,77 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from jose import jwt
+
+from api import create_app, db
+from api.auth import auth
+from api.auth.auth import issue_service_token, token_cache, AuthError, \
+    verify_service_token
+from tests import db_drop_everything
+
+
+@patch('api.auth.auth.SERVICE_TOKEN_SECRET', 'batch-secret')
+class ServiceTokenTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        token_cache.clear()
+
+    def tearDown(self):
+        token_cache.clear()
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+    def _get(self, token):
+        return self.client.get(
+            '/auth-required',
+            headers={'Authorization': f'Bearer {token}'}
+        )
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    def test_service_token_happypath(self, mock_verify_decode_jwt):
+        token = issue_service_token(['create:roadtrips'])
+        response = self._get(token)
+        self.assertEqual(200, response.status_code)
+        mock_verify_decode_jwt.assert_not_called()
+
+    def test_service_token_missing_permission(self):
+        token = issue_service_token(['get:roadtrips'])
+        response = self._get(token)
+        self.assertEqual(403, response.status_code)
+
+    def test_service_token_wrong_secret(self):
+        now = int(time.time())
+        token = jwt.encode({
+            'iss': auth.SERVICE_TOKEN_ISSUER, 'aud': auth.API_AUDIENCE,
+            'iat': now, 'exp': now + 60, 'permissions': ['create:roadtrips']
+        }, 'not-the-secret', algorithm='HS256')
+        response = self._get(token)
+        self.assertEqual(400, response.status_code)
+
+    def test_service_token_expired(self):
+        token = issue_service_token(['create:roadtrips'], ttl=-1)
+        with self.assertRaises(AuthError) as ctx:
+            verify_service_token(token)
+        self.assertEqual('token_expired', ctx.exception.error['code'])
+
+    def test_service_token_lifetime_too_long(self):
+        now = int(time.time())
+        token = jwt.encode({
+            'iss': auth.SERVICE_TOKEN_ISSUER, 'aud': auth.API_AUDIENCE,
+            'iat': now, 'exp': now + auth.SERVICE_TOKEN_MAX_TTL + 1,
+            'permissions': ['create:roadtrips']
+        }, 'batch-secret', algorithm='HS256')
+        with self.assertRaises(AuthError):
+            verify_service_token(token)
+
+    def test_service_tokens_disabled_without_secret(self):
+        token = issue_service_token(['create:roadtrips'])
+        with patch('api.auth.auth.SERVICE_TOKEN_SECRET', None):
+            response = self._get(token)
+        self.assertEqual(401, response.status_code)
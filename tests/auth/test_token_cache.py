@@ -0,0 +1,99 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from api import create_app, db
+from api.auth.auth import token_cache
+from tests import db_drop_everything, assert_payload_field_type_value
+
+
+class TokenCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        token_cache.clear()
+
+    def tearDown(self):
+        token_cache.clear()
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    def test_repeat_token_skips_verification(self, mock_verify_decode_jwt):
+        mock_verify_decode_jwt.return_value = {
+            'exp': int(time.time()) + 60,
+            'permissions': ['create:roadtrips']
+        }
+        for _ in range(3):
+            response = self.client.get(
+                '/auth-required',
+                headers={'Authorization': 'Bearer token-abc123'}
+            )
+            self.assertEqual(200, response.status_code)
+
+        self.assertEqual(1, mock_verify_decode_jwt.call_count)
+        stats = token_cache.stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    def test_cached_payload_still_checks_permissions(
+            self, mock_verify_decode_jwt):
+        mock_verify_decode_jwt.return_value = {
+            'exp': int(time.time()) + 60,
+            'permissions': ['get:roadtrips']
+        }
+        for _ in range(2):
+            response = self.client.get(
+                '/auth-required',
+                headers={'Authorization': 'Bearer token-abc123'}
+            )
+            self.assertEqual(403, response.status_code)
+        self.assertEqual(1, mock_verify_decode_jwt.call_count)
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    def test_expired_entry_is_verified_again(self, mock_verify_decode_jwt):
+        mock_verify_decode_jwt.return_value = {
+            'exp': int(time.time()) - 1,
+            'permissions': ['create:roadtrips']
+        }
+        for _ in range(2):
+            self.client.get(
+                '/auth-required',
+                headers={'Authorization': 'Bearer token-abc123'}
+            )
+        self.assertEqual(2, mock_verify_decode_jwt.call_count)
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    def test_metrics_endpoint(self, mock_verify_decode_jwt):
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:metrics']
+        }
+        response = self.client.get(
+            '/api/metrics',
+            headers={'Authorization': 'Bearer token-abc123'}
+        )
+        self.assertEqual(200, response.status_code)
+
+        data = response.get_json()
+        assert_payload_field_type_value(self, data, 'success', bool, True)
+        self.assertIn('hit_rate', data['metrics']['verified_tokens'])
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    def test_metrics_endpoint_requires_permission(
+            self, mock_verify_decode_jwt):
+        response = self.client.get('/api/metrics')
+        self.assertEqual(401, response.status_code)
+
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+        response = self.client.get(
+            '/api/metrics',
+            headers={'Authorization': 'Bearer token-abc123'}
+        )
+        self.assertEqual(403, response.status_code)
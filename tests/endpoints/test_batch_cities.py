@@ -0,0 +1,103 @@
+import json
+import unittest
+from unittest.mock import patch, MagicMock
+
+from api import create_app, db
+from api.database.models import City
+from tests import db_drop_everything, assert_payload_field_type_value, \
+    assert_payload_field_type
+
+
+def _mapquest_batch(*latlngs):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {
+        'results': [
+            {'locations': [{'displayLatLng': {'lat': lat, 'lng': lng}}]}
+            if lat is not None else {'locations': []}
+            for lat, lng in latlngs
+        ]
+    }
+    return response
+
+
+class BatchCitiesTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.arvada = City(name='Arvada', state='CO', lat=1.23, lng=3.45)
+        self.arvada.insert()
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+
+class GuestUserTest(BatchCitiesTest):
+    def test_endpoint_badauth_batch_cities(self):
+        response = self.client.post(
+            '/api/cities/batch', json={'locations': ['Arvada, CO']}
+        )
+        self.assertEqual(401, response.status_code)
+
+
+# noinspection DuplicatedCode
+class UserTest(BatchCitiesTest):
+    @patch('api.services.location.requests.post')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_batch_cities(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_post):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips']
+        }
+        mock_post.return_value = _mapquest_batch(
+            (39.74, -104.99), (None, None))
+
+        response = self.client.post('/api/cities/batch', json={
+            'locations': ['arvada, co', 'Denver, CO', 'Nowhere, ZZ',
+                          'denver,co', 'Boulder, Colorado']
+        })
+        self.assertEqual(200, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, True)
+        assert_payload_field_type(self, data, 'results', list)
+        arvada, denver, nowhere, denver_again, boulder = data['results']
+
+        assert_payload_field_type_value(
+            self, arvada, 'id', int, self.arvada.id)
+        assert_payload_field_type_value(self, denver, 'lat', float, 39.74)
+        self.assertEqual(denver['id'], denver_again['id'])
+        assert_payload_field_type_value(
+            self, nowhere, 'success', bool, False)
+        assert_payload_field_type_value(
+            self, boulder, 'error', str, 'state length must be 2 characters')
+
+        # one upstream call for both misses, each distinct city stored once
+        self.assertEqual(1, mock_post.call_count)
+        self.assertEqual(['Denver, CO', 'Nowhere, ZZ'],
+                         mock_post.call_args[1]['json']['locations'])
+        self.assertEqual(2, City.query.count())
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_sadpath_missing_locations(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips']
+        }
+
+        response = self.client.post('/api/cities/batch', json={})
+        self.assertEqual(400, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, False)
+        assert_payload_field_type(self, data, 'errors', list)
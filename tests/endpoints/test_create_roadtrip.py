@@ -1,7 +1,7 @@
 import json
 import unittest
 from copy import deepcopy
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 from api import create_app, db
 from tests import db_drop_everything, assert_payload_field_type_value, \
@@ -252,3 +252,37 @@ class UserTest(CreateRoadtripTest):
             self, data, 'errors', list,
             ["required 'end_city' parameter is blank"]
         )
+
+    @patch('api.services.location.requests.get')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_sadpath_unknown_cities(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_get):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips', 'create:roadtrips',
+                            'update:roadtrips', 'delete:roadtrips']
+        }
+        mock_get.return_value = MagicMock(status_code=200)
+        mock_get.return_value.json.return_value = {
+            'results': [{'locations': []}]
+        }
+
+        payload = deepcopy(self.payload)
+        payload['start_city'] = 'Qwzzrt, CO'
+        payload['end_city'] = 'Zzyzxq, CO'
+        for _ in range(2):
+            response = self.client.post(
+                '/api/roadtrips', json=payload,
+                content_type='application/json'
+            )
+            self.assertEqual(400, response.status_code)
+
+            data = json.loads(response.data.decode('utf-8'))
+            assert_payload_field_type_value(
+                self, data, 'errors', list,
+                ["'start_city' location not found",
+                 "'end_city' location not found"]
+            )
+        self.assertEqual(2, mock_get.call_count)
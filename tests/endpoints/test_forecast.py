@@ -1,5 +1,6 @@
 import json
 import unittest
+from unittest.mock import patch, MagicMock
 
 from api import create_app, db
 from tests import db_drop_everything, assert_payload_field_type_value, \
@@ -45,3 +46,27 @@ class ForecastTest(unittest.TestCase):
         assert_payload_field_type_value(
             self, data, 'message', str, 'state length must be 2 characters'
         )
+
+    @patch('api.services.location.requests.get')
+    def test_forecast_sadpath_unknown_location_is_remembered(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=200)
+        mock_get.return_value.json.return_value = {
+            'results': [{'locations': []}]
+        }
+
+        for _ in range(2):
+            response = self.client.get('/api/forecast?location=Qwzzrt,CO')
+            data = json.loads(response.data.decode('utf-8'))
+
+            self.assertEqual(400, response.status_code)
+            assert_payload_field_type_value(
+                self, data, 'message', str, 'location not found'
+            )
+        self.assertEqual(1, mock_get.call_count)
+
+    def test_forecast_sadpath_malformed_location(self):
+        response = self.client.get('/api/forecast?location=nowhere')
+        data = json.loads(response.data.decode('utf-8'))
+
+        self.assertEqual(400, response.status_code)
+        assert_payload_field_type_value(self, data, 'success', bool, False)
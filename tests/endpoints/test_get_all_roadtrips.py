@@ -1,10 +1,10 @@
 import json
 import unittest
 from copy import deepcopy
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 
 from api import create_app, db
-from api.database.models import RoadTrip
+from api.database.models import City, RoadTrip
 from api.services.location import LocationService
 from tests import db_drop_everything, assert_payload_field_type_value, \
     assert_payload_field_type
@@ -131,3 +131,84 @@ class UserTest(GetRoadtripsTest):
         assert_payload_field_type_value(self, data, 'success', bool, True)
         assert_payload_field_type(self, data, 'results', list)
         self.assertEqual(0, len(data['results']))
+
+    @patch('api.services.location.requests.post')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_one_route_matrix_call(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_post):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+        mock_post.return_value = MagicMock(status_code=200)
+        mock_post.return_value.json.return_value = {
+            'info': {'statuscode': 0},
+            'time': [[0, 1200], [1260, 0]],
+            'distance': [[0, 9.8], [9.9, 0]],
+        }
+
+        arvada = City(name='Arvada', state='CO', lat=39.8, lng=-105.08)
+        arvada.insert()
+        denver = City(name='Denver', state='CO', lat=39.74, lng=-104.99)
+        denver.insert()
+        for name, start, end in [('to work', arvada, denver),
+                                 ('home', denver, arvada),
+                                 ('to work again', arvada, denver)]:
+            RoadTrip(name=name, start_city_id=start.id,
+                     end_city_id=end.id).insert()
+
+        response = self.client.get('/api/roadtrips')
+        self.assertEqual(200, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(['21 minutes', '20 minutes', '20 minutes'],
+                         [r['travel_time'] for r in data['results']])
+        self.assertEqual(1, mock_post.call_count)
+
+    @patch('api.services.location.requests')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_estimated_eta(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_requests):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+
+        denver = City(name='Denver', state='CO', lat=39.739236,
+                      lng=-104.990251)
+        denver.insert()
+        pueblo = City(name='Pueblo', state='CO', lat=38.254447,
+                      lng=-104.609141)
+        pueblo.insert()
+        RoadTrip(name='south', start_city_id=denver.id,
+                 end_city_id=pueblo.id).insert()
+        RoadTrip(name='stay', start_city_id=denver.id,
+                 end_city_id=denver.id).insert()
+
+        response = self.client.get('/api/roadtrips?eta=estimate')
+        self.assertEqual(200, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertRegex(data['results'][0]['travel_time'],
+                         r'^[12] hours?, \d+ minutes?$')
+        self.assertEqual('', data['results'][1]['travel_time'])
+        self.assertEqual([], mock_requests.method_calls)
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_sadpath_bad_eta_mode(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+
+        response = self.client.get('/api/roadtrips?eta=guess')
+        self.assertEqual(400, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, False)
@@ -0,0 +1,138 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from api import create_app, db
+from api.database.models import City
+from api.database.registry import city_registry
+from api.services.spatial import CityGrid, city_grid, estimate_drive, \
+    haversine_miles
+from tests import db_drop_everything, assert_payload_field_type_value, \
+    assert_payload_field_type
+
+
+class NearbyCitiesTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        for name, lat, lng in [('Arvada', 39.802763, -105.087484),
+                               ('Denver', 39.739236, -104.990251),
+                               ('Estes Park', 40.377202, -105.521637),
+                               ('Pueblo', 38.254447, -104.609141)]:
+            City(name=name, state='CO', lat=lat, lng=lng).insert()
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+
+class GridTest(NearbyCitiesTest):
+    def test_haversine(self):
+        miles = haversine_miles(39.739236, -104.990251,
+                                [39.802763], [-105.087484])
+        self.assertAlmostEqual(6.8, miles[0], places=1)
+
+    def test_estimate_drive(self):
+        miles, seconds = estimate_drive(
+            [39.739236, 39.739236, 39.739236], [-104.990251] * 3,
+            [39.739236, 39.802763, 38.254447],
+            [-104.990251, -105.087484, -104.609141])
+        self.assertEqual([0, 0], [miles[0], seconds[0]])
+        # 6.8 great-circle miles, slowly; 104 miles, mostly highway
+        self.assertAlmostEqual(8.5, miles[1], places=1)
+        self.assertTrue(10 * 60 < seconds[1] < 20 * 60)
+        self.assertTrue(100 * 60 < seconds[2] < 150 * 60)
+
+    def test_nearby_nearest_first(self):
+        results = city_grid.nearby(39.739236, -104.990251, 60)
+        names = [city_registry.get(i).name for i, _ in results]
+        self.assertEqual(['Denver', 'Arvada', 'Estes Park'], names)
+        self.assertEqual(0.0, results[0][1])
+
+    def test_nearby_limit(self):
+        results = city_grid.nearby(39.739236, -104.990251, 500, limit=2)
+        self.assertEqual(2, len(results))
+
+    def test_new_city_is_indexed(self):
+        city_grid.nearby(39.739236, -104.990251, 10)
+        boulder = City.upsert('Boulder', 'CO', 40.014986, -105.270546)
+        city_registry.add(boulder)
+        results = city_grid.nearby(40.014986, -105.270546, 1)
+        self.assertEqual([boulder.id], [i for i, _ in results])
+
+    def test_picks_up_cities_other_workers_stored(self):
+        grid = CityGrid(refresh_interval=0)
+        grid.load()
+        # stored by another process, this worker's registry never saw it
+        City(name='Boulder', state='CO', lat=40.014986,
+             lng=-105.270546).insert()
+        results = grid.nearby(40.014986, -105.270546, 1)
+        self.assertEqual(1, len(results))
+
+        cached = CityGrid()
+        cached.load()
+        City(name='Golden', state='CO', lat=39.755543,
+             lng=-105.221100).insert()
+        self.assertEqual([], cached.nearby(39.755543, -105.221100, 1))
+
+    def test_matches_brute_force(self):
+        grid = CityGrid(cell_deg=0.25)
+        grid.load()
+        cities = City.query.all()
+        for radius in (5, 50, 150, 400):
+            expected = sorted(
+                c.id for c in cities
+                if haversine_miles(39.0, -105.0, [c.lat], [c.lng])[0] <=
+                radius)
+            found = sorted(i for i, _ in grid.nearby(39.0, -105.0, radius,
+                                                    limit=100))
+            self.assertEqual(expected, found)
+
+
+# noinspection DuplicatedCode
+class UserTest(NearbyCitiesTest):
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_nearby(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+
+        response = self.client.get(
+            '/api/cities/nearby?lat=39.74&lng=-104.99&radius=20&limit=5')
+        self.assertEqual(200, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, True)
+        assert_payload_field_type(self, data, 'results', list)
+        self.assertEqual(['Denver, CO', 'Arvada, CO'],
+                         [r['city'] for r in data['results']])
+        assert_payload_field_type(
+            self, data['results'][1], 'distance_miles', float)
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_sadpath_bad_coordinates(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+
+        response = self.client.get('/api/cities/nearby?lat=123&lng=abc')
+        self.assertEqual(400, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, False)
+        self.assertEqual(2, len(data['errors']))
+
+    def test_endpoint_badauth_nearby(self):
+        response = self.client.get('/api/cities/nearby?lat=39.74&lng=-105')
+        self.assertEqual(401, response.status_code)
@@ -0,0 +1,161 @@
+import json
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from api import create_app, db
+from api.database.models import City, Route
+from api.services.location import LocationService
+from api.services.traveltimes import TravelTimeMatrix, travel_times
+from tests import db_drop_everything, assert_payload_field_type_value, \
+    assert_payload_field_type
+
+
+class ReachableCitiesTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.cities = {}
+        for name in ('Denver', 'Arvada', 'Boulder', 'Estes Park', 'Vail'):
+            city = City(name=name, state='CO', lat=39.7, lng=-105.0)
+            city.insert()
+            self.cities[name] = city.id
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+    def route(self, start, end, seconds):
+        Route.save(Route(self.cities[start], self.cities[end],
+                         travel_time='stored', seconds=seconds,
+                         fetched_at=int(time.time())))
+
+
+class TravelTimeMatrixTest(ReachableCitiesTest):
+    def test_loads_routes_table(self):
+        self.route('Denver', 'Arvada', 900)
+        self.route('Denver', 'Estes Park', 5400)
+        self.route('Boulder', 'Denver', 1800)
+        Route.save(Route(self.cities['Denver'], self.cities['Vail'],
+                         travel_time='impossible route',
+                         fetched_at=int(time.time())))
+
+        known, reachable = travel_times.reachable(self.cities['Denver'], 3600)
+        self.assertEqual(3, known)
+        self.assertEqual([(self.cities['Arvada'], 900.0)], reachable)
+        known, reachable = travel_times.reachable(self.cities['Denver'], 1e9)
+        self.assertEqual([self.cities['Arvada'], self.cities['Estes Park']],
+                         [city_id for city_id, _ in reachable])
+        self.assertEqual((0, []), travel_times.reachable(
+            self.cities['Vail'], 1e9))
+
+    @patch('api.services.location.requests.get')
+    def test_filled_by_route_lookups(self, mock_get):
+        travel_times.reachable(self.cities['Denver'], 3600)
+        response = MagicMock(status_code=200)
+        response.json.return_value = {'route': {
+            'formattedTime': '00:35:00', 'time': 2100, 'distance': 29.5
+        }}
+        mock_get.return_value = response
+        LocationService.route_distance_time(
+            City.query.get(self.cities['Denver']),
+            City.query.get(self.cities['Boulder']))
+
+        self.assertEqual((1, [(self.cities['Boulder'], 2100.0)]),
+                         travel_times.reachable(self.cities['Denver'], 3600))
+
+    def test_grows_and_limits(self):
+        matrix = TravelTimeMatrix(capacity=2)
+        matrix.load()
+        matrix.record({(1, n): {'string': '', 'seconds': 100 * n}
+                       for n in range(2, 40)})
+        matrix.record({(1, 3): {'string': 'impossible route'}})
+        self.assertEqual(39, len(matrix))
+        known, reachable = matrix.reachable(1, 1000, limit=3)
+        self.assertEqual(38, known)
+        self.assertEqual([(2, 200.0), (4, 400.0), (5, 500.0)], reachable)
+
+    def test_picks_up_routes_other_workers_stored(self):
+        matrix = TravelTimeMatrix(refresh_interval=0)
+        matrix.load()
+        self.route('Denver', 'Arvada', 900)
+        self.assertEqual((1, [(self.cities['Arvada'], 900.0)]),
+                         matrix.reachable(self.cities['Denver'], 3600))
+        Route.save(Route(self.cities['Denver'], self.cities['Arvada'],
+                         travel_time='20 minutes', seconds=1200,
+                         fetched_at=int(time.time())))
+        self.assertEqual((1, [(self.cities['Arvada'], 1200.0)]),
+                         matrix.reachable(self.cities['Denver'], 3600))
+
+    def test_memory_follows_known_pairs(self):
+        matrix = TravelTimeMatrix()
+        matrix.load()
+        matrix.record({(n, n + 1): {'string': '', 'seconds': 60}
+                       for n in range(50000)})
+        self.assertEqual(50001, matrix.stats()['cities'])
+        self.assertEqual(50000, matrix.stats()['pairs'])
+        # a dense float32 matrix over as many cities would take 10GB
+        self.assertLess(sum(row.ends.nbytes + row.seconds.nbytes
+                            for row in matrix._rows.values()), 2 * 10 ** 7)
+        self.assertEqual((1, [(7, 60.0)]), matrix.reachable(6, 60))
+
+
+# noinspection DuplicatedCode
+class UserTest(ReachableCitiesTest):
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_reachable(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+        self.route('Denver', 'Arvada', 900)
+        self.route('Denver', 'Boulder', 2100)
+        self.route('Denver', 'Estes Park', 5400)
+
+        response = self.client.get(
+            f"/api/cities/{self.cities['Denver']}/reachable?max_hours=1")
+        self.assertEqual(200, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, True)
+        assert_payload_field_type_value(self, data, 'city', str, 'Denver, CO')
+        assert_payload_field_type_value(
+            self, data, 'known_destinations', int, 3)
+        assert_payload_field_type(self, data, 'results', list)
+        self.assertEqual(['Arvada, CO', 'Boulder, CO'],
+                         [r['city'] for r in data['results']])
+        assert_payload_field_type_value(
+            self, data['results'][1], 'travel_time', str, '35 minutes')
+        assert_payload_field_type_value(
+            self, data['results'][1], 'seconds', int, 2100)
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_sadpath_reachable(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+
+        response = self.client.get(
+            f"/api/cities/{self.cities['Denver']}/reachable?max_hours=500")
+        self.assertEqual(400, response.status_code)
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, False)
+        self.assertEqual(1, len(data['errors']))
+
+        response = self.client.get('/api/cities/9999/reachable?max_hours=4')
+        self.assertEqual(404, response.status_code)
+
+    def test_endpoint_badauth_reachable(self):
+        response = self.client.get(
+            f"/api/cities/{self.cities['Denver']}/reachable?max_hours=4")
+        self.assertEqual(401, response.status_code)
@@ -0,0 +1,318 @@
+import json
+import time
+import unittest
+from unittest.mock import patch
+
+from api import create_app, db
+from api.database.models import City, RoadTrip, RoadTripStop, Route
+from api.services.forecast import HourlyForecast
+from api.services.location import LocationService
+from tests import db_drop_everything, assert_payload_field_type_value
+
+# cities along one road, 10 minutes apart per step
+CITIES = [('Denver', 0), ('Arvada', 1), ('Boulder', 2), ('Lyons', 3),
+          ('Estes Park', 4)]
+
+
+class RoadtripStopsTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        ids = {}
+        for name, step in CITIES:
+            city = City(name=name, state='CO', lat=39.7 + step / 10,
+                        lng=-105.0)
+            city.insert()
+            ids[name] = (city.id, step)
+        Route.save_all([
+            Route(start_id, end_id, travel_time='stored',
+                  seconds=600 * abs(start_step - end_step),
+                  fetched_at=int(time.time()))
+            for start_id, start_step in ids.values()
+            for end_id, end_step in ids.values() if start_id != end_id
+        ])
+
+        self.payload = {
+            'name': 'park tour',
+            'start_city': 'Denver, CO',
+            'end_city': 'Estes Park, CO',
+            'stops': ['Lyons, CO', 'Arvada, CO', 'Boulder, CO'],
+        }
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+
+# noinspection DuplicatedCode
+class UserTest(RoadtripStopsTest):
+    @patch('api.services.location.requests')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_create_with_stops(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_requests):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips']
+        }
+
+        response = self.client.post(
+            '/api/roadtrips', json=self.payload,
+            content_type='application/json'
+        )
+        self.assertEqual(201, response.status_code)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(self.payload['stops'], data['stops'])
+
+        trip = RoadTrip.query.get(data['id'])
+        self.assertEqual(3, RoadTripStop.query.count())
+        # Denver, Lyons, Arvada, Boulder, Estes Park
+        self.assertEqual(4800, trip.travel_seconds)
+        self.assertEqual('1 hour, 20 minutes', trip.travel_time)
+        self.assertEqual([], mock_requests.method_calls)
+
+    @patch('api.services.location.requests')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_create_optimized(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_requests):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips']
+        }
+
+        response = self.client.post(
+            '/api/roadtrips?optimize=true', json=self.payload,
+            content_type='application/json'
+        )
+        self.assertEqual(201, response.status_code)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(['Arvada, CO', 'Boulder, CO', 'Lyons, CO'],
+                         data['stops'])
+        trip = RoadTrip.query.get(data['id'])
+        self.assertEqual('40 minutes', trip.travel_time)
+        self.assertEqual([], mock_requests.method_calls)
+
+    @patch('api.resources.roadtrips.ForecastService.get_forecast')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_patch_stops(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_get_forecast):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips', 'update:roadtrips',
+                            'get:roadtrips']
+        }
+        mock_get_forecast.return_value = {
+            'hourly': HourlyForecast.from_onecall([
+                {'dt': 0, 'temp': 60,
+                 'weather': [{'description': 'clear sky'}]}
+            ])
+        }
+        response = self.client.post(
+            '/api/roadtrips', json=self.payload,
+            content_type='application/json'
+        )
+        roadtrip_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.patch(
+            f'/api/roadtrips/{roadtrip_id}?optimize=true',
+            json={'name': 'park tour'}, content_type='application/json'
+        )
+        self.assertEqual(200, response.status_code)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(['Arvada, CO', 'Boulder, CO', 'Lyons, CO'],
+                         data['stops'])
+
+        response = self.client.get(f'/api/roadtrips/{roadtrip_id}')
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(
+            self, data, 'travel_time', str, '40 minutes')
+        self.assertEqual({'temp': '60F', 'conditions': 'clear sky'},
+                         data['forecast_at_eta'])
+        self.assertEqual(3, len(data['stops']))
+
+        response = self.client.patch(
+            f'/api/roadtrips/{roadtrip_id}',
+            json={'name': 'straight there', 'stops': []},
+            content_type='application/json'
+        )
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual([], data['stops'])
+        self.assertEqual(0, RoadTripStop.query.count())
+        self.assertEqual(2400,
+                         RoadTrip.query.get(roadtrip_id).travel_seconds)
+
+    @patch('api.resources.roadtrips.ForecastService.get_forecast')
+    @patch('api.services.location.requests')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_listing_sums_stops(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_requests, mock_get_forecast):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips', 'get:roadtrips']
+        }
+        mock_get_forecast.return_value = {
+            'hourly': HourlyForecast.from_onecall([
+                {'dt': 0, 'temp': 60,
+                 'weather': [{'description': 'clear sky'}]}
+            ])
+        }
+        response = self.client.post(
+            '/api/roadtrips', json=self.payload,
+            content_type='application/json'
+        )
+        roadtrip_id = json.loads(response.data.decode('utf-8'))['id']
+        self.client.post(
+            '/api/roadtrips', json=dict(self.payload, name='straight there',
+                                        stops=[]),
+            content_type='application/json'
+        )
+        # as if written before drive times were stored
+        RoadTrip.query.update({'travel_time': None, 'travel_seconds': None})
+        db.session.commit()
+
+        response = self.client.get('/api/roadtrips')
+        data = json.loads(response.data.decode('utf-8'))
+        # the direct trip reads the routes table as it is
+        self.assertEqual(['1 hour, 20 minutes', 'stored'],
+                         [trip['travel_time'] for trip in data['results']])
+
+        for query in ('', '?eta=estimate'):
+            response = self.client.get(f'/api/roadtrips{query}')
+            listed = json.loads(response.data.decode('utf-8'))['results']
+            response = self.client.get(
+                f'/api/roadtrips/{roadtrip_id}{query}')
+            single = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(single['travel_time'], listed[0]['travel_time'])
+        self.assertEqual([], mock_requests.method_calls)
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_listing_batches_all_legs(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips', 'get:roadtrips']
+        }
+        for name in ('one', 'two', 'three'):
+            self.client.post(
+                '/api/roadtrips', json=dict(self.payload, name=name),
+                content_type='application/json'
+            )
+        RoadTrip.query.update({'travel_time': None, 'travel_seconds': None})
+        db.session.commit()
+
+        with patch.object(LocationService, 'route_distance_times',
+                          wraps=LocationService.route_distance_times) as rdt:
+            response = self.client.get('/api/roadtrips')
+        self.assertEqual(1, rdt.call_count)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(['1 hour, 20 minutes'] * 3,
+                         [trip['travel_time'] for trip in data['results']])
+
+    @patch('api.services.location.LocationService.route_distance_times')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_listing_leaves_incomplete_route_empty(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_route_distance_times):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips', 'get:roadtrips']
+        }
+        # a leg MapQuest left out of the batch
+        mock_route_distance_times.return_value = {}
+        self.client.post(
+            '/api/roadtrips', json=self.payload,
+            content_type='application/json'
+        )
+        self.assertIsNone(RoadTrip.query.one().travel_time)
+
+        response = self.client.get('/api/roadtrips')
+        self.assertEqual(200, response.status_code)
+        data = json.loads(response.data.decode('utf-8'))
+        self.assertIsNone(data['results'][0]['travel_time'])
+
+    @patch('api.resources.roadtrips.ForecastService.get_forecast')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_get_impossible_route_has_no_forecast(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_get_forecast):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+        denver = City.query.filter_by(name='Denver').one()
+        estes = City.query.filter_by(name='Estes Park').one()
+        roadtrip = RoadTrip(name='washed out', start_city_id=denver.id,
+                            end_city_id=estes.id)
+        roadtrip.travel_time = 'impossible route'
+        roadtrip.insert()
+
+        response = self.client.get(f'/api/roadtrips/{roadtrip.id}')
+        self.assertEqual(200, response.status_code)
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(
+            self, data, 'travel_time', str, 'impossible route'
+        )
+        assert_payload_field_type_value(
+            self, data, 'forecast_at_eta', dict, {}
+        )
+        mock_get_forecast.assert_not_called()
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_sadpath_bad_stops(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips']
+        }
+
+        for stops, query, message in [
+            ('Lyons, CO', '', "'stops' must be a list of 'City, ST' "
+                              "strings"),
+            (['Lyons, CO'] * 24, '', "'stops' may hold at most 23 cities"),
+            (['Lyons'], '', "'stops[0]' must look like 'City, ST'"),
+            (['Lyons, CO'], '?optimize=maybe',
+             "'optimize' parameter must be 'true' or 'false'"),
+        ]:
+            payload = dict(self.payload, stops=stops)
+            response = self.client.post(
+                f'/api/roadtrips{query}', json=payload,
+                content_type='application/json'
+            )
+            self.assertEqual(400, response.status_code)
+            data = json.loads(response.data.decode('utf-8'))
+            self.assertEqual([message], data['errors'])
+        self.assertEqual(0, RoadTrip.query.count())
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_delete_removes_stops(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips', 'delete:roadtrips']
+        }
+        response = self.client.post(
+            '/api/roadtrips', json=self.payload,
+            content_type='application/json'
+        )
+        roadtrip_id = json.loads(response.data.decode('utf-8'))['id']
+
+        response = self.client.delete(f'/api/roadtrips/{roadtrip_id}')
+        self.assertEqual(204, response.status_code)
+        self.assertEqual(0, RoadTripStop.query.count())
@@ -0,0 +1,162 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from api import create_app, db
+from api.database.models import City, RoadTrip
+from api.database.registry import city_registry
+from api.services.suggest import CitySuggester, city_suggester, \
+    normalize_prefix
+from tests import db_drop_everything, assert_payload_field_type_value, \
+    assert_payload_field_type
+
+
+class SuggestCitiesTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.cities = {}
+        for name, state in [('Arvada', 'CO'), ('Arlington', 'TX'),
+                            ('Arlington', 'VA'), ('Aurora', 'CO'),
+                            ('Denver', 'CO')]:
+            city = City(name=name, state=state, lat=39.0, lng=-105.0)
+            city.insert()
+            self.cities[f'{name}, {state}'] = city.id
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+    def trip(self, start, end):
+        trip = RoadTrip(name=f'{start} to {end}',
+                        start_city_id=self.cities[start],
+                        end_city_id=self.cities[end])
+        trip.insert()
+        return trip
+
+
+class SuggesterTest(SuggestCitiesTest):
+    def test_normalize_prefix(self):
+        self.assertEqual('arvada', normalize_prefix('  Arvada '))
+        self.assertEqual('fort collins', normalize_prefix('Fort   Collins'))
+        self.assertEqual('arlington,v', normalize_prefix('Arlington ,  V'))
+
+    def test_alphabetical_without_trips(self):
+        names = [c for _, c, _ in city_suggester.suggest('ar')]
+        self.assertEqual(['Arlington, TX', 'Arlington, VA', 'Arvada, CO'],
+                         names)
+
+    def test_ranked_by_trips(self):
+        self.trip('Arvada, CO', 'Denver, CO')
+        self.trip('Denver, CO', 'Arvada, CO')
+        self.trip('Arlington, VA', 'Denver, CO')
+        results = city_suggester.suggest('ar')
+        self.assertEqual([('Arvada, CO', 2), ('Arlington, VA', 1),
+                          ('Arlington, TX', 0)],
+                         [(c, n) for _, c, n in results])
+
+    def test_state_prefix_and_limit(self):
+        names = [c for _, c, _ in city_suggester.suggest('arlington, v')]
+        self.assertEqual(['Arlington, VA'], names)
+        self.assertEqual(1, len(city_suggester.suggest('a', limit=1)))
+        self.assertEqual([], city_suggester.suggest('zz'))
+
+    def test_counts_follow_trip_changes(self):
+        city_suggester.suggest('ar')
+        trip = self.trip('Arlington, TX', 'Denver, CO')
+        self.assertEqual('Arlington, TX', city_suggester.suggest('ar')[0][1])
+
+        trip.start_city_id = self.cities['Aurora, CO']
+        trip.update()
+        self.assertEqual(('Aurora, CO', 1), city_suggester.suggest('a')[0][1:])
+        self.assertEqual(0, city_suggester.suggest('arlington, t')[0][2])
+
+        trip.delete()
+        self.assertEqual(0, city_suggester.suggest('a')[0][2])
+
+    def test_rolled_back_trip_is_not_counted(self):
+        city_suggester.suggest('ar')
+        trip = RoadTrip(name='never', start_city_id=self.cities['Aurora, CO'],
+                        end_city_id=self.cities['Denver, CO'])
+        db.session.add(trip)
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(0, city_suggester.suggest('aurora')[0][2])
+
+    def test_picks_up_other_workers_changes(self):
+        suggester = CitySuggester(refresh_interval=0)
+        suggester.suggest('ar')
+        # only the module-level suggester hears about this worker's writes,
+        # so to this one they might as well come from another process
+        self.trip('Aurora, CO', 'Denver, CO')
+        boulder = City(name='Boulder', state='CO', lat=40.0, lng=-105.3)
+        boulder.insert()
+        self.assertEqual(('Aurora, CO', 1), suggester.suggest('a')[0][1:])
+        self.assertEqual([boulder.id],
+                         [i for i, _, _ in suggester.suggest('bou')])
+
+    def test_new_city_is_suggested(self):
+        city_suggester.suggest('b')
+        boulder = City.upsert('Boulder', 'CO', 40.014986, -105.270546)
+        city_registry.add(boulder)
+        self.assertEqual([boulder.id],
+                         [i for i, _, _ in city_suggester.suggest('bou')])
+
+    def test_load_from_rows(self):
+        suggester = CitySuggester()
+        suggester.load(rows=[(1, 'Boise', 'ID'), (2, 'Boston', 'MA'),
+                             (3, 'Bozeman', 'MT')],
+                       counts={3: 4})
+        self.assertEqual([3, 1, 2],
+                         [i for i, _, _ in suggester.suggest('bo')])
+
+
+# noinspection DuplicatedCode
+class UserTest(SuggestCitiesTest):
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_happypath_suggest(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+        self.trip('Aurora, CO', 'Denver, CO')
+
+        response = self.client.get('/api/cities/suggest?q=a&limit=2')
+        self.assertEqual(200, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, True)
+        assert_payload_field_type(self, data, 'results', list)
+        self.assertEqual(['Aurora, CO', 'Arlington, TX'],
+                         [r['city'] for r in data['results']])
+        assert_payload_field_type_value(
+            self, data['results'][0], 'id', int, self.cities['Aurora, CO'])
+        assert_payload_field_type_value(
+            self, data['results'][0], 'trips', int, 1)
+
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_endpoint_sadpath_missing_query(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+
+        response = self.client.get('/api/cities/suggest?q=%20&limit=500')
+        self.assertEqual(400, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(self, data, 'success', bool, False)
+        self.assertEqual(2, len(data['errors']))
+
+    def test_endpoint_badauth_suggest(self):
+        response = self.client.get('/api/cities/suggest?q=arv')
+        self.assertEqual(401, response.status_code)
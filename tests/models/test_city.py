@@ -101,3 +101,27 @@ class AppTest(unittest.TestCase):
         city.insert()
 
         self.assertEqual('Arvada, CO', city.city_state())
+
+    def test_city_model_key(self):
+        city = City(name=' estes  park ', state='co', lat=1.23, lng=3.45)
+        city.insert()
+
+        self.assertEqual('estes park,co', city.key)
+
+    def test_city_model_duplicate_key(self):
+        City(name='Arvada', state='CO', lat=1.23, lng=3.45).insert()
+        try:
+            City(name='arvada', state='co', lat=1.23, lng=3.45).insert()
+        except IntegrityError:
+            self.assertTrue(True)
+        else:
+            # we should not end up in here
+            self.assertTrue(False)  # pragma: no cover
+
+    def test_city_model_upsert(self):
+        first = City.upsert(name='Arvada', state='CO', lat=1.23, lng=3.45)
+        second = City.upsert(name='arvada', state='co', lat=9.87, lng=6.54)
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(1.23, second.lat)
+        self.assertEqual(1, City.query.count())
@@ -0,0 +1,69 @@
+import unittest
+
+from flask_sqlalchemy import get_debug_queries
+
+from api import create_app, db
+from api.database.models import City, RoadTrip
+from api.database.registry import CityRegistry, CityRecord, city_key, \
+    city_registry
+
+
+class CityRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.arvada = City(name='Arvada', state='CO', lat=1.23, lng=3.45)
+        self.arvada.insert()
+        self.denver = City(name='Denver', state='CO', lat=2.34, lng=4.56)
+        self.denver.insert()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_city_key(self):
+        self.assertEqual('arvada,co', city_key(' Arvada ', 'CO '))
+        self.assertEqual('estes park,co', city_key('estes  PARK', 'co'))
+
+    def test_get_by_id(self):
+        record = city_registry.get(self.arvada.id)
+        self.assertIsInstance(record, CityRecord)
+        self.assertEqual('Arvada, CO', record.city_state())
+        self.assertEqual(1.23, record.lat)
+        self.assertIsNone(city_registry.get(9999))
+
+    def test_find_ignores_case(self):
+        record = city_registry.find('arvada', 'co')
+        self.assertEqual(self.arvada.id, record.id)
+        self.assertIsNone(city_registry.find('Boulder', 'CO'))
+
+    def test_second_lookup_makes_no_query(self):
+        city_registry.get(self.arvada.id)
+        queries = len(get_debug_queries())
+        city_registry.get(self.arvada.id)
+        city_registry.find('ARVADA', 'co')
+        self.assertEqual(queries, len(get_debug_queries()))
+
+    def test_roadtrip_cities_come_from_registry(self):
+        trip = RoadTrip(name='commute', start_city_id=self.arvada.id,
+                        end_city_id=self.denver.id)
+        trip.insert()
+        trip.start_city(), trip.end_city()
+        queries = len(get_debug_queries())
+        self.assertEqual('Arvada, CO', trip.start_city().city_state())
+        self.assertEqual('Denver, CO', trip.end_city().city_state())
+        self.assertEqual(queries, len(get_debug_queries()))
+
+    def test_bounded(self):
+        registry = CityRegistry(maxsize=1)
+        registry.add(self.arvada)
+        registry.add(self.denver)
+        self.assertEqual(1, len(registry))
+        self.assertIsNone(registry._by_key.get('arvada,co'))
+        # evicted records are filled from the database again
+        self.assertEqual(self.arvada.id, registry.get(self.arvada.id).id)
@@ -0,0 +1,142 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from api import create_app, db
+from api.services.forecast import Forecast, ForecastCache, \
+    ForecastService, HourlyForecast, conditions, forecast_cache
+
+
+def _onecall(temp, hours=None):
+    return {
+        'current': {'temp': temp, 'weather': [{'description': 'clear sky'}]},
+        'hourly': hours or [{'temp': temp, 'weather': []}],
+    }
+
+
+class ForecastCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.fetched = []
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def fetch(self, lat, lng):
+        self.fetched.append((lat, lng))
+        return _onecall(len(self.fetched))
+
+    def test_snaps_to_grid(self):
+        cache = ForecastCache(self.fetch, grid_deg=0.1)
+        self.assertEqual(
+            1, cache.get(39.801122, -105.081451)['current']['temp'])
+        self.assertEqual(1, cache.get(39.78, -105.11)['current']['temp'])
+        self.assertEqual(2, cache.get(39.86, -105.08)['current']['temp'])
+        self.assertEqual([(39.8, -105.1), (39.9, -105.1)], self.fetched)
+        self.assertEqual({'hits': 1, 'misses': 2},
+                         {k: cache.stats()[k] for k in ('hits', 'misses')})
+
+    def test_current_and_hourly_ttls(self):
+        cache = ForecastCache(self.fetch, current_ttl=600, hourly_ttl=3600)
+        cache.get(39.8, -105.1)
+        with patch('api.services.forecast.time.time',
+                   return_value=time.time() + 900):
+            cache.get(39.8, -105.1, hourly=True)
+            self.assertEqual(0, cache.stats()['stale'])
+            cache._refresh_in_background = MagicMock()
+            cache.get(39.8, -105.1)
+        self.assertEqual(1, cache.stats()['stale'])
+        self.assertAlmostEqual(300, cache.stats()['max_stale_seconds'],
+                               delta=5)
+        cache._refresh_in_background.assert_called_once()
+
+    def test_serves_stale_during_one_refresh(self):
+        release = threading.Event()
+
+        def slow_fetch(lat, lng):
+            if self.fetched:
+                release.wait(5)
+            return self.fetch(lat, lng)
+
+        cache = ForecastCache(slow_fetch, current_ttl=0)
+        cache.get(39.8, -105.1)
+        for _ in range(5):
+            self.assertEqual(1, cache.get(39.8, -105.1)['current']['temp'])
+        self.assertEqual(1, cache.stats()['refreshing'])
+        release.set()
+        for _ in range(50):
+            if cache.stats()['refreshes']:
+                break
+            time.sleep(0.01)
+        self.assertEqual(2, len(self.fetched))
+        self.assertEqual(2, cache.get(39.8, -105.1)['current']['temp'])
+        self.assertEqual(6, cache.stats()['stale'])
+
+    def test_expired_entry_is_a_miss(self):
+        cache = ForecastCache(self.fetch, stale_ttl=60)
+        cache.get(39.8, -105.1)
+        with patch('api.services.forecast.time.time',
+                   return_value=time.time() + 120):
+            self.assertEqual(2, cache.get(39.8, -105.1)['current']['temp'])
+        self.assertEqual(2, cache.stats()['misses'])
+
+    @patch('api.services.forecast.requests.get')
+    def test_get_forecast_uses_cache(self, mock_get):
+        now = int(time.time())
+        response = MagicMock(status_code=200)
+        response.json.return_value = _onecall(71.5, [
+            {'dt': now - 7200, 'temp': 60},
+            {'dt': now - 1800, 'temp': 65},
+            {'dt': now + 1800, 'temp': 70},
+        ])
+        mock_get.return_value = response
+        latlng = {'success': True, 'lat': 39.801122, 'lng': -105.081451}
+
+        forecast = ForecastService.get_forecast(latlng, hourly=True)
+        ForecastService.get_forecast(latlng)
+        self.assertEqual('71.5F', forecast['current_temp'])
+        self.assertEqual('clear sky', forecast['conditions'])
+        # hours already gone are dropped
+        self.assertEqual([65, 70], forecast['hourly'].temps.tolist())
+        self.assertEqual(1, mock_get.call_count)
+        self.assertEqual(1, forecast_cache.stats()['hits'])
+
+
+class HourlyForecastTest(unittest.TestCase):
+    HOURS = [
+        {'dt': 3600 * h, 'temp': 50 + h,
+         'weather': [{'description': 'light rain' if h % 2 else 'clear sky'}]}
+        for h in range(48)
+    ]
+
+    def test_parallel_arrays(self):
+        hourly = HourlyForecast.from_onecall(self.HOURS)
+        self.assertEqual(48, len(hourly))
+        self.assertEqual('53F', hourly.temp(3))
+        self.assertEqual('light rain', hourly.conditions(3))
+        self.assertEqual('clear sky', hourly.conditions(4))
+        self.assertEqual(hourly.codes[0], hourly.codes[2])
+        self.assertEqual(conditions.code('clear sky'), hourly.codes[0])
+
+    def test_since(self):
+        hourly = HourlyForecast.from_onecall(self.HOURS)
+        self.assertEqual(48, len(hourly.since(1800)))
+        later = hourly.since(3600 * 10 + 60)
+        self.assertEqual('60F', later.temp(0))
+        self.assertEqual(1, len(hourly.since(3600 * 100)))
+
+    def test_forecast_from_onecall(self):
+        forecast = Forecast.from_onecall(
+            {'current': {'temp': 48.2,
+                         'weather': [{'description': 'overcast clouds'}]},
+             'hourly': self.HOURS})
+        self.assertEqual(48.2, forecast.current_temp)
+        self.assertEqual('overcast clouds',
+                         conditions.description(forecast.current_code))
+        self.assertEqual(48, len(forecast.hourly))
@@ -0,0 +1,176 @@
+import unittest
+from unittest.mock import patch
+
+from api import create_app, db
+from api.database.models import City
+from api.services.fuzzy import (
+    TrigramIndex, city_trigrams, edit_distance, trigrams)
+from api.services.location import LocationService
+from tests import assert_payload_field_type_value
+
+
+def _location(place):
+    if place is None:
+        return {'geocodeQuality': 'STATE',
+                'displayLatLng': {'lat': 39.0, 'lng': -105.5}}
+    location = {'geocodeQuality': 'CITY',
+                'displayLatLng': {'lat': place[0], 'lng': place[1]}}
+    if len(place) > 2:
+        location['adminArea5'] = place[2]
+    return location
+
+
+def mapquest_finds(*places):
+    """
+    MapQuest geocoding responses, a city-level result per (lat, lng) or
+    (lat, lng, city name) and a state-level one (nothing useful) per None
+    """
+    responses = []
+    for place in places:
+        response = unittest.mock.Mock(status_code=200)
+        response.json.return_value = {
+            'results': [{'locations': [_location(place)]}]}
+        responses.append(response)
+    return responses
+
+
+class TrigramIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.fort_collins = City(name='Fort Collins', state='CO',
+                                 lat=1.23, lng=3.45)
+        self.fort_collins.insert()
+        City(name='Aurora', state='CO', lat=2.34, lng=4.56).insert()
+        City(name='Fort Collins', state='WY', lat=5.67, lng=6.78).insert()
+        # real cities whose neighbours by name are different real cities
+        City(name='Bristol', state='VA', lat=36.6, lng=-82.2).insert()
+        City(name='Lansing', state='MI', lat=42.7, lng=-84.6).insert()
+        City(name='San Mateo', state='CA', lat=37.6, lng=-122.3).insert()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_trigrams(self):
+        self.assertEqual({'  a', ' ar', 'arv', 'rvd', 'vda', 'da '},
+                         trigrams('Arvda'))
+
+    def test_edit_distance(self):
+        self.assertEqual(0, edit_distance('Fort  Collins', 'fort collins'))
+        self.assertEqual(1, edit_distance('Fort Colins', 'Fort Collins'))
+        self.assertEqual(5, edit_distance('East Lansing', 'Lansing'))
+
+    def test_match_typo_within_state(self):
+        city_id, score = city_trigrams.match('Fort Colins', 'co')
+        self.assertEqual(self.fort_collins.id, city_id)
+        self.assertGreaterEqual(score, city_trigrams.threshold)
+
+    def test_no_match_below_threshold(self):
+        self.assertIsNone(city_trigrams.match('Denver', 'CO'))
+        self.assertIsNone(city_trigrams.match('Fort Colins', 'UT'))
+
+    def test_no_match_for_other_real_cities(self):
+        self.assertIsNone(city_trigrams.match('Bristow', 'VA'))
+        self.assertIsNone(city_trigrams.match('East Lansing', 'MI'))
+        self.assertIsNone(city_trigrams.match('San Marcos', 'CA'))
+
+    def test_no_match_beyond_max_edits(self):
+        index = TrigramIndex(threshold=0.5, max_edits=2)
+        index.load(rows=[])
+        index.add(1, 'Lansing', 'MI')
+        self.assertIsNone(index.match('East Lansing', 'MI'))
+
+    def test_disabled(self):
+        index = TrigramIndex(threshold=0)
+        self.assertIsNone(index.match('Arvada', 'CO'))
+
+    def test_incremental_add(self):
+        index = TrigramIndex()
+        index.load(rows=[])
+        index.add(42, 'Colorado Springs', 'CO')
+        self.assertEqual(42, index.match('Coloradoo Springs', 'CO')[0])
+
+    def test_picks_up_cities_other_workers_stored(self):
+        index = TrigramIndex(refresh_interval=0)
+        self.assertIsNone(index.match('Colorado Sprngs', 'CO'))
+        springs = City(name='Colorado Springs', state='CO', lat=38.8,
+                       lng=-104.8)
+        springs.insert()
+        self.assertEqual(springs.id, index.match('Coloradoo Springs',
+                                                 'CO')[0])
+
+    @patch('api.services.location.requests.get')
+    def test_get_latlng_matches_typo_without_network(self, mock_get):
+        latlng = LocationService.get_latlng('Fort Colins', 'CO')
+
+        mock_get.assert_not_called()
+        assert_payload_field_type_value(
+            self, latlng, 'id', int, self.fort_collins.id)
+        assert_payload_field_type_value(self, latlng, 'lat', float, 1.23)
+        self.assertEqual(6, City.query.count())
+
+    @patch('api.services.location.requests.get')
+    def test_get_latlng_returns_known_city_mapquest_names(self, mock_get):
+        arvada = City(name='Arvada', state='CO', lat=39.8, lng=-105.1)
+        arvada.insert()
+        mock_get.side_effect = mapquest_finds((39.8, -105.1, 'Arvada'))
+
+        latlng = LocationService.get_latlng('Arvda', 'CO')
+
+        self.assertEqual(1, mock_get.call_count)
+        assert_payload_field_type_value(self, latlng, 'id', int, arvada.id)
+        self.assertEqual(7, City.query.count())
+        self.assertIsNone(City.query.filter_by(key='arvda,co').one_or_none())
+
+    @patch('api.services.location.requests.get')
+    def test_get_latlng_stores_mapquest_spelling(self, mock_get):
+        mock_get.side_effect = mapquest_finds((39.8, -105.1, 'Arvada'))
+
+        latlng = LocationService.get_latlng('Arvda', 'CO')
+
+        self.assertTrue(latlng['success'])
+        self.assertEqual(
+            'Arvada', City.query.get(latlng['id']).name)
+        self.assertIsNone(City.query.filter_by(key='arvda,co').one_or_none())
+
+    @patch('api.services.location.requests.get')
+    def test_get_latlng_stores_real_city_near_known_name(self, mock_get):
+        mock_get.side_effect = mapquest_finds((38.7, -77.5), (42.7, -84.5))
+
+        bristow = LocationService.get_latlng('Bristow', 'VA')
+        east_lansing = LocationService.get_latlng('East Lansing', 'MI')
+
+        self.assertEqual(2, mock_get.call_count)
+        self.assertTrue(bristow['success'])
+        self.assertEqual(38.7, bristow['lat'])
+        self.assertEqual(42.7, east_lansing['lat'])
+        self.assertEqual(8, City.query.count())
+        self.assertIsNotNone(
+            City.query.filter_by(name='Bristow', state='VA').one_or_none())
+
+    @patch('api.services.location.requests.post')
+    def test_batch_matches_typos_and_mapquest_spelling(self, mock_post):
+        response = unittest.mock.Mock(status_code=200)
+        response.json.return_value = {'results': [
+            {'locations': [_location((33.1, -117.2, 'San Marcos'))]},
+            {'locations': [_location((37.6, -122.3, 'San Mateo'))]},
+        ]}
+        mock_post.return_value = response
+
+        typo, real, renamed = LocationService.get_latlng_batch(
+            ['Fort Colins, CO', 'San Marcos, CA', 'San Maeto, CA'])
+
+        self.assertEqual(1, mock_post.call_count)
+        self.assertEqual(['San Marcos, CA', 'San Maeto, CA'],
+                         mock_post.call_args[1]['json']['locations'])
+        self.assertEqual(self.fort_collins.id, typo['id'])
+        self.assertEqual(33.1, real['lat'])
+        self.assertNotEqual(0, real['id'])
+        san_mateo = City.query.filter_by(key='san mateo,ca').one()
+        self.assertEqual(san_mateo.id, renamed['id'])
+        self.assertEqual(7, City.query.count())
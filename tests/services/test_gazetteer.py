@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from api import create_app, db
+from api.database.models import City
+from api.services import gazetteer as gazetteer_module
+from api.services.gazetteer import Gazetteer, build, place_name
+from api.services.location import LocationService
+from tests import assert_payload_field_type_value
+
+PLACES = (
+    'USPS\tGEOID\tANSICODE\tNAME\tLSAD\tFUNCSTAT\tALAND\tAWATER\t'
+    'ALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG          \n'
+    'CO\t0803455\t02409757\tArvada city\t25\tA\t1\t1\t1\t1\t'
+    '39.832113\t-105.151067\n'
+    'CO\t0803400\t02409758\tArvada CDP\t57\tS\t1\t1\t1\t1\t1.0\t1.0\n'
+    'CO\t0825390\t02410449\tEstes Park town\t43\tA\t1\t1\t1\t1\t'
+    '40.376352\t-105.524989\n'
+    'TN\t4752006\t02405092\tNashville-Davidson metropolitan government '
+    '(balance)\t00\tF\t1\t1\t1\t1\t36.171800\t-86.785002\n'
+)
+
+
+class GazetteerTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.workdir, 'places.txt')
+        self.index = os.path.join(self.workdir, 'places.idx')
+        with open(self.source, 'w') as f:
+            f.write(PLACES)
+        build(self.source, self.index)
+
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for name in os.listdir(self.workdir):
+            os.remove(os.path.join(self.workdir, name))
+        os.rmdir(self.workdir)
+
+    def test_place_name(self):
+        self.assertEqual('Arvada', place_name('Arvada city'))
+        self.assertEqual('Aspen Park', place_name('Aspen Park CDP'))
+        self.assertEqual('Nashville-Davidson', place_name(
+            'Nashville-Davidson metropolitan government (balance)'))
+
+    def test_lookup(self):
+        index = Gazetteer(self.index)
+        self.assertEqual(3, len(index))
+        self.assertEqual((39.832113, -105.151067), index.lookup('arvada,co'))
+        self.assertEqual((40.376352, -105.524989),
+                         index.lookup('estes park,co'))
+        self.assertEqual((36.1718, -86.785002),
+                         index.lookup('nashville-davidson,tn'))
+        self.assertIsNone(index.lookup('aurora,co'))
+        self.assertIsNone(index.lookup('aaa,aa'))
+        self.assertIsNone(index.lookup('zzz,zz'))
+
+    @patch('api.services.location.requests.get')
+    def test_get_latlng_uses_gazetteer_before_mapquest(self, mock_get):
+        offline = gazetteer_module._LazyGazetteer(self.index)
+        with patch('api.services.location.gazetteer', offline):
+            latlng = LocationService.get_latlng('Estes Park', 'CO')
+
+        mock_get.assert_not_called()
+        assert_payload_field_type_value(self, latlng, 'success', bool, True)
+        assert_payload_field_type_value(self, latlng, 'lat', float, 40.376352)
+        self.assertEqual(latlng['id'], City.query.one().id)
+        self.assertEqual(1, offline.stats()['hits'])
@@ -33,6 +33,18 @@ class LocationServiceTest(unittest.TestCase):
         assert_payload_field_type(self, latlng, 'id', int)
         self.assertGreater(latlng['id'], 0)
 
+    def test_get_latlng_happypath_with_dblookup_any_case(self):
+        city = City(
+            name='Arvada', state='CO',
+            lat=1.23, lng=3.45,
+        )
+        city.insert()
+
+        latlng = LocationService.get_latlng('arvada', 'co')
+        assert_payload_field_type_value(self, latlng, 'success', bool, True)
+        assert_payload_field_type_value(self, latlng, 'id', int, city.id)
+        self.assertEqual(1, City.query.count())
+
     def test_get_latlng_happypath_with_apilookup(self):
         latlng = LocationService.get_latlng('Ottawa', 'ON')
         assert_payload_field_type_value(self, latlng, 'success', bool, True)
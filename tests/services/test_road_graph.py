@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import requests
+
+from api import create_app, db
+from api.database.models import City, Route
+from api.services import roadgraph as roadgraph_module
+from api.services.location import LocationService
+from api.services.roadgraph import RoadGraph, build
+from tests import db_drop_everything
+
+PLACES = (
+    'name,state,lat,lng\n'
+    'Arvada,CO,39.832113,-105.151067\n'
+    'Denver,CO,39.739236,-104.990251\n'
+    'Golden,CO,39.755543,-105.221100\n'
+    'Boulder,CO,40.014986,-105.270546\n'
+    'Estes Park,CO,40.376352,-105.524989\n'
+    'Nashville,TN,36.171800,-86.785002\n'
+    'Memphis,TN,35.149534,-90.048980\n'
+)
+ROADS = (
+    'from,to,miles,seconds\n'
+    '"Arvada, CO","Denver, CO",10,900\n'
+    '"Denver, CO","Boulder, CO",30,1800\n'
+    '"Arvada, CO","Golden, CO",8,700\n'
+    '"Golden, CO","Boulder, CO",25,2400\n'
+    '"Boulder, CO","Estes Park, CO",35,2700\n'
+    '"Arvada, CO","Estes Park, CO",60,6000\n'
+    '"Nashville, TN","Memphis, TN",210,11000\n'
+    '"Denver, CO","Aurora, CO",12,1000\n'
+)
+
+
+class RoadGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        places = os.path.join(self.workdir, 'places.csv')
+        roads = os.path.join(self.workdir, 'roads.csv')
+        self.path = os.path.join(self.workdir, 'roads.graph')
+        with open(places, 'w') as f:
+            f.write(PLACES)
+        with open(roads, 'w') as f:
+            f.write(ROADS)
+        self.built = build(places, roads, self.path)
+
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+        for name in os.listdir(self.workdir):
+            os.remove(os.path.join(self.workdir, name))
+        os.rmdir(self.workdir)
+
+    def city(self, name, state):
+        city = City(name=name, state=state, lat=39.0, lng=-105.0)
+        city.insert()
+        return city
+
+    def test_build_skips_unknown_places(self):
+        # Aurora is not in the places file, so its road is dropped
+        self.assertEqual((7, 14), self.built)
+        graph = RoadGraph(self.path)
+        self.assertIsNotNone(graph.node('Estes  Park', 'co'))
+        self.assertIsNone(graph.node('Aurora', 'CO'))
+
+    def test_fastest_route(self):
+        graph = RoadGraph(self.path)
+        arvada = graph.node('Arvada', 'CO')
+        seconds, miles = graph.fastest(arvada, graph.node('Estes Park', 'CO'))
+        # through Denver and Boulder beats the direct road and Golden
+        self.assertAlmostEqual(5400, seconds)
+        self.assertAlmostEqual(75, miles)
+        self.assertEqual((700, 8), graph.fastest(
+            graph.node('Golden', 'CO'), arvada))
+        self.assertEqual((0, 0), graph.fastest(arvada, arvada))
+
+    def test_memoized_per_source(self):
+        graph = RoadGraph(self.path)
+        arvada = graph.node('Arvada', 'CO')
+        graph.fastest(arvada, graph.node('Estes Park', 'CO'))
+        self.assertEqual((900, 10),
+                         graph.fastest(arvada, graph.node('Denver', 'CO')))
+        self.assertEqual(1, graph.stats()['searches'])
+
+        # unreachable: one search settles everything reachable, then the
+        # memo answers
+        nashville = graph.node('Nashville', 'TN')
+        self.assertIsNone(graph.fastest(arvada, nashville))
+        self.assertIsNone(graph.fastest(arvada, graph.node('Memphis', 'TN')))
+        self.assertEqual(2, graph.stats()['searches'])
+
+    @patch('api.services.location.requests.get')
+    def test_fallback_when_mapquest_fails(self, mock_get):
+        mock_get.side_effect = requests.ConnectionError()
+        arvada = self.city('Arvada', 'CO')
+        estes = self.city('Estes Park', 'CO')
+        local = roadgraph_module._LazyRoadGraph(self.path)
+        with patch('api.services.location.road_graph', local):
+            eta = LocationService.route_distance_time(arvada, estes)
+            self.assertEqual({'string': '1 hour, 30 minutes',
+                              'seconds': 5400, 'distance': 75.0}, eta)
+            self.assertEqual(0, Route.query.count())
+
+            aurora = self.city('Aurora', 'CO')
+            with self.assertRaises(requests.ConnectionError):
+                LocationService.route_distance_time(arvada, aurora)
+        self.assertEqual({'hits': 1, 'misses': 1},
+                         {k: local.stats()[k] for k in ('hits', 'misses')})
+
+    @patch('api.services.location.requests')
+    def test_local_mode_skips_mapquest(self, mock_requests):
+        arvada = self.city('Arvada', 'CO')
+        denver = self.city('Denver', 'CO')
+        golden = self.city('Golden', 'CO')
+        local = roadgraph_module._LazyRoadGraph(self.path)
+        with patch('api.services.location.road_graph', local), \
+                patch('api.services.location.ROUTING_MODE', 'local'):
+            etas = LocationService.route_distance_times(
+                [(arvada, denver), (golden, denver)])
+        self.assertEqual(900, etas[(arvada.id, denver.id)]['seconds'])
+        self.assertEqual(1600, etas[(golden.id, denver.id)]['seconds'])
+        self.assertEqual([], mock_requests.method_calls)
+
+    def test_without_graph(self):
+        missing = roadgraph_module._LazyRoadGraph(
+            os.path.join(self.workdir, 'nothing.graph'))
+        self.assertFalse(missing.available())
+        self.assertIsNone(missing.route(self.city('Arvada', 'CO'),
+                                        self.city('Denver', 'CO')))
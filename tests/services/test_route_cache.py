@@ -0,0 +1,167 @@
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from api import create_app, db
+from api.database.models import City, Route
+from api.services.location import LocationService, ROUTE_TTL, \
+    format_seconds, format_travel_time
+from tests import db_drop_everything, assert_payload_field_type_value
+
+
+def _mapquest_matrix(times, distances, status_code=200):
+    response = MagicMock(status_code=status_code)
+    response.json.return_value = {
+        'info': {'statuscode': 0}, 'time': times, 'distance': distances
+    }
+    return response
+
+
+def _mapquest_route(formatted='01:23:00', seconds=4980, distance=71.3):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {'route': {
+        'formattedTime': formatted, 'time': seconds, 'distance': distance
+    }} if formatted else {'route': {'routeError': {'errorCode': 2}}}
+    return response
+
+
+class RoutesTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.denver = City(name='Denver', state='CO', lat=39.74, lng=-104.99)
+        self.denver.insert()
+        self.estes = City(name='Estes Park', state='CO', lat=40.38,
+                          lng=-105.52)
+        self.estes.insert()
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+
+class RouteCacheTest(RoutesTest):
+    def test_format_travel_time(self):
+        self.assertEqual('1 hour, 23 minutes', format_travel_time('01:23:00'))
+        self.assertEqual('2 hours', format_travel_time('02:00:59'))
+        self.assertEqual('5 minutes', format_travel_time('00:05:00'))
+
+    def test_format_seconds(self):
+        self.assertEqual('1 hour, 23 minutes', format_seconds(4980))
+        self.assertEqual('', format_seconds(0))
+
+    @patch('api.services.location.requests.get')
+    def test_miss_writes_through(self, mock_get):
+        mock_get.return_value = _mapquest_route()
+
+        for _ in range(3):
+            eta = LocationService.route_distance_time(self.denver, self.estes)
+            assert_payload_field_type_value(
+                self, eta, 'string', str, '1 hour, 23 minutes')
+            assert_payload_field_type_value(self, eta, 'seconds', int, 4980)
+            assert_payload_field_type_value(self, eta, 'distance', float, 71.3)
+
+        self.assertEqual(1, mock_get.call_count)
+        route = Route.query.get((self.denver.id, self.estes.id))
+        self.assertEqual(4980, route.seconds)
+        self.assertIsNone(Route.query.get((self.estes.id, self.denver.id)))
+
+    @patch('api.services.location.requests.get')
+    def test_stale_route_is_refetched(self, mock_get):
+        Route.save(Route(self.denver.id, self.estes.id,
+                         travel_time='2 hours', seconds=7200, distance=70.0,
+                         fetched_at=int(time.time()) - ROUTE_TTL - 1))
+        mock_get.return_value = _mapquest_route()
+
+        eta = LocationService.route_distance_time(self.denver, self.estes)
+        self.assertEqual('1 hour, 23 minutes', eta['string'])
+        self.assertEqual(1, mock_get.call_count)
+        db.session.expire_all()
+        route = Route.query.get((self.denver.id, self.estes.id))
+        self.assertEqual(4980, route.seconds)
+        self.assertEqual(1, Route.query.count())
+
+    @patch('api.services.location.requests.get')
+    def test_impossible_route_is_stored(self, mock_get):
+        mock_get.return_value = _mapquest_route(formatted=None)
+
+        for _ in range(2):
+            eta = LocationService.route_distance_time(self.denver, self.estes)
+            self.assertEqual({'string': 'impossible route'}, eta)
+        self.assertEqual(1, mock_get.call_count)
+
+
+class RouteMatrixTest(RoutesTest):
+    def add_cities(self, count):
+        cities = []
+        for i in range(count):
+            city = City(name=f'Town {i}', state='CO', lat=39.0, lng=-105.0)
+            city.insert()
+            cities.append(city)
+        return cities
+
+    @patch('api.services.location.requests.post')
+    def test_one_all_to_all_call(self, mock_post):
+        golden = self.add_cities(1)[0]
+        # sorted by id: denver, estes, golden
+        mock_post.return_value = _mapquest_matrix(
+            [[0, 4980, 1500], [4980, 0, 0], [1500, 6000, 0]],
+            [[0, 71.3, 15.0], [71.3, 0, 0], [15.0, 80.2, 0]])
+        Route.save(Route(self.estes.id, self.denver.id,
+                         travel_time='1 hour, 20 minutes', seconds=4800,
+                         fetched_at=int(time.time())))
+        pairs = [(self.denver, self.estes), (self.estes, self.denver),
+                 (golden, self.denver), (self.estes, golden),
+                 (self.denver, self.estes)]
+
+        etas = LocationService.route_distance_times(pairs)
+
+        self.assertEqual(1, mock_post.call_count)
+        sent = mock_post.call_args[1]['json']
+        self.assertEqual(['Denver, CO', 'Estes Park, CO', 'Town 0, CO'],
+                         sent['locations'])
+        self.assertTrue(sent['options']['allToAll'])
+        self.assertEqual('1 hour, 23 minutes',
+                         etas[(self.denver.id, self.estes.id)]['string'])
+        self.assertEqual('1 hour, 20 minutes',
+                         etas[(self.estes.id, self.denver.id)]['string'])
+        self.assertEqual(1500, etas[(golden.id, self.denver.id)]['seconds'])
+        self.assertEqual({'string': 'impossible route'},
+                         etas[(self.estes.id, golden.id)])
+        self.assertEqual(4, Route.query.count())
+
+        LocationService.route_distance_times(pairs)
+        self.assertEqual(1, mock_post.call_count)
+
+    @patch('api.services.location.requests.post')
+    def test_many_cities_one_call_per_start(self, mock_post):
+        towns = self.add_cities(30)
+        mock_post.side_effect = lambda url, json: _mapquest_matrix(
+            [0] + [600] * (len(json['locations']) - 1),
+            [0] + [10.0] * (len(json['locations']) - 1))
+        pairs = [(self.denver, town) for town in towns] + \
+            [(self.estes, town) for town in towns[:5]]
+
+        etas = LocationService.route_distance_times(pairs)
+
+        self.assertEqual(2, mock_post.call_count)
+        self.assertFalse(mock_post.call_args[1]['json']['options']['allToAll'])
+        self.assertEqual(35, len(etas))
+        self.assertEqual('10 minutes',
+                         etas[(self.estes.id, towns[4].id)]['string'])
+
+    @patch('api.services.location.requests.get')
+    @patch('api.services.location.requests.post')
+    def test_falls_back_to_single_routes(self, mock_post, mock_get):
+        mock_post.return_value = _mapquest_matrix([], [], status_code=500)
+        mock_get.return_value = _mapquest_route()
+
+        etas = LocationService.route_distance_times(
+            [(self.denver, self.estes)])
+        self.assertEqual('1 hour, 23 minutes',
+                         etas[(self.denver.id, self.estes.id)]['string'])
+        self.assertEqual(1, mock_get.call_count)
@@ -0,0 +1,96 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from api.services.location import LocationNotFound
+from api.services.singleflight import SingleFlight, advisory_lock
+
+
+class SingleFlightTest(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight('test')
+        self.upstream_calls = 0
+
+    def _slow_fetch(self, value):
+        def fetch():
+            self.upstream_calls += 1
+            time.sleep(0.1)
+            return value
+        return fetch
+
+    def _run_concurrently(self, count, key, fn):
+        results, errors = [], []
+
+        def worker():
+            try:
+                results.append(self.flight.do(key, fn))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results, errors
+
+    def test_concurrent_calls_share_one_fetch(self):
+        results, errors = self._run_concurrently(
+            8, 'arvada,co', self._slow_fetch(42))
+
+        self.assertEqual([42] * 8, results)
+        self.assertEqual([], errors)
+        self.assertEqual(1, self.upstream_calls)
+        self.assertEqual(1, self.flight.stats()['calls'])
+        self.assertEqual(7, self.flight.stats()['coalesced'])
+        self.assertEqual(0, self.flight.stats()['in_flight'])
+
+    def test_errors_are_shared(self):
+        def fail():
+            time.sleep(0.1)
+            raise ValueError('upstream down')
+
+        results, errors = self._run_concurrently(4, 'key', fail)
+        self.assertEqual([], results)
+        self.assertEqual(4, len(errors))
+
+    def test_sequential_calls_fetch_again(self):
+        self.flight.do('key', self._slow_fetch(1))
+        self.flight.do('key', self._slow_fetch(2))
+        self.assertEqual(2, self.upstream_calls)
+        self.assertEqual(0, self.flight.stats()['coalesced'])
+
+
+@patch('api.services.singleflight.ADVISORY_LOCKS', True)
+@patch('api.services.singleflight.db')
+class AdvisoryLockTest(unittest.TestCase):
+    def _statements(self, mock_db):
+        conn = mock_db.engine.connect.return_value.__enter__.return_value
+        return [str(call[0][0]) for call in conn.execute.call_args_list]
+
+    def test_released_when_the_block_exits(self, mock_db):
+        mock_db.engine.dialect.name = 'postgresql'
+        with advisory_lock('arvada,co') as locked:
+            self.assertTrue(locked)
+            self.assertEqual(['SELECT pg_advisory_lock(:id)'],
+                             self._statements(mock_db))
+        self.assertEqual(['SELECT pg_advisory_lock(:id)',
+                          'SELECT pg_advisory_unlock(:id)'],
+                         self._statements(mock_db))
+        mock_db.session.execute.assert_not_called()
+
+    def test_not_found_leaves_the_session_alone(self, mock_db):
+        mock_db.engine.dialect.name = 'postgresql'
+        with self.assertRaises(LocationNotFound):
+            with advisory_lock('arvda,co'):
+                raise LocationNotFound('arvda,co')
+        self.assertEqual('SELECT pg_advisory_unlock(:id)',
+                         self._statements(mock_db)[-1])
+        mock_db.session.rollback.assert_not_called()
+
+    def test_off_for_other_databases(self, mock_db):
+        mock_db.engine.dialect.name = 'sqlite'
+        with advisory_lock('arvada,co') as locked:
+            self.assertFalse(locked)
+        mock_db.engine.connect.assert_not_called()
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+import numpy as np
+
+from api.services.tour import nearest_neighbour, optimize_stops, \
+    tour_seconds, two_opt
+
+
+def _line(positions):
+    points = np.array(positions, dtype=np.float64)
+    return np.abs(points[:, None] - points[None, :]) * 600
+
+
+class TourTest(unittest.TestCase):
+    def test_nearest_neighbour(self):
+        seconds = _line([0, 3, 1, 2, 4])
+        self.assertEqual([0, 2, 3, 1, 4], nearest_neighbour(seconds))
+
+    def test_two_opt_untangles(self):
+        seconds = _line([0, 3, 2, 1, 4])
+        order = two_opt([0, 1, 2, 3, 4], seconds)
+        self.assertEqual([0, 3, 2, 1, 4], order)
+        self.assertEqual(2400, tour_seconds(order, seconds))
+
+    def test_two_opt_prices_reverse_legs(self):
+        # a one-way shortcut: 1 -> 2 is quick, 2 -> 1 is slow
+        seconds = np.array([[0, 10, 10, 50],
+                            [10, 0, 1, 10],
+                            [10, 100, 0, 10],
+                            [50, 10, 10, 0]], dtype=np.float64)
+        self.assertEqual([0, 1, 2, 3], two_opt([0, 2, 1, 3], seconds))
+
+    def test_never_slower_than_given(self):
+        rng = np.random.default_rng(3)
+        for _ in range(20):
+            seconds = rng.uniform(60, 7200, size=(8, 8))
+            np.fill_diagonal(seconds, 0)
+            order = optimize_stops(seconds)
+            self.assertEqual(0, order[0])
+            self.assertEqual(7, order[-1])
+            self.assertEqual(list(range(8)), sorted(order))
+            self.assertLessEqual(tour_seconds(order, seconds),
+                                 tour_seconds(list(range(8)), seconds))
+
+    def test_avoids_missing_roads(self):
+        seconds = _line([0, 1, 2, 3])
+        seconds[0, 1] = np.inf
+        self.assertEqual([0, 2, 1, 3], optimize_stops(seconds))
+
+    def test_25_stops_under_budget(self):
+        rng = np.random.default_rng(1)
+        points = rng.uniform(0, 500, size=(27, 2))
+        seconds = np.linalg.norm(
+            points[:, None] - points[None, :], axis=2) * 60
+        start = time.perf_counter()
+        order = optimize_stops(seconds)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertLess(tour_seconds(order, seconds),
+                        tour_seconds(list(range(27)), seconds))
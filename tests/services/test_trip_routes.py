@@ -0,0 +1,178 @@
+import json
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from api import create_app, db
+from api.database.models import City, RoadTrip, Route
+from api.services.location import LocationService
+from tests import db_drop_everything, assert_payload_field_type_value
+
+
+def _mapquest_route(formatted='01:23:00', seconds=4980):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {'route': {
+        'formattedTime': formatted, 'time': seconds, 'distance': 71.3
+    }}
+    return response
+
+
+class TripRoutesTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        self.cities = []
+        for name in ('Arvada', 'Denver', 'Estes Park'):
+            city = City(name=name, state='CO', lat=39.8, lng=-105.0)
+            city.insert()
+            self.cities.append(city.id)
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+    def trip(self, name, start, end, updated_at=None):
+        trip = RoadTrip(name=name, start_city_id=self.cities[start],
+                        end_city_id=self.cities[end])
+        if updated_at is not None:
+            trip.travel_time = '2 hours'
+            trip.travel_seconds = 7200
+            trip.route_updated_at = updated_at
+        trip.insert()
+        return trip
+
+
+class StoredRouteTest(TripRoutesTest):
+    @patch('api.services.location.requests.get')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_route_stored_on_create_and_patch(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_get):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips', 'update:roadtrips']
+        }
+        mock_get.return_value = _mapquest_route()
+
+        response = self.client.post('/api/roadtrips', json={
+            'name': 'getaway', 'start_city': 'Denver, CO',
+            'end_city': 'Estes Park, CO'
+        }, content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        trip = RoadTrip.query.get(
+            json.loads(response.data.decode('utf-8'))['id'])
+        self.assertEqual('1 hour, 23 minutes', trip.travel_time)
+        self.assertEqual(4980, trip.travel_seconds)
+
+        mock_get.return_value = _mapquest_route('00:15:00', 900)
+        response = self.client.patch(f'/api/roadtrips/{trip.id}', json={
+            'name': 'getaway', 'start_city': 'Arvada, CO'
+        }, content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        db.session.expire_all()
+        trip = RoadTrip.query.get(trip.id)
+        self.assertEqual(900, trip.travel_seconds)
+        self.assertEqual(2, mock_get.call_count)
+
+    @patch('api.services.location.requests.get')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_patch_clears_route_it_cannot_look_up(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_get):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['update:roadtrips']
+        }
+        mock_get.side_effect = requests.RequestException
+        trip = self.trip('getaway', 1, 2, updated_at=int(time.time()))
+
+        response = self.client.patch(f'/api/roadtrips/{trip.id}', json={
+            'name': 'getaway', 'start_city': 'Arvada, CO'
+        }, content_type='application/json')
+        self.assertEqual(200, response.status_code)
+        db.session.expire_all()
+        trip = RoadTrip.query.get(trip.id)
+        self.assertIsNone(trip.travel_time)
+        self.assertIsNone(trip.travel_seconds)
+        self.assertIsNone(trip.route_updated_at)
+
+    @patch('api.services.location.requests')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_listing_reads_stored_route(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_requests):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['get:roadtrips']
+        }
+        self.trip('getaway', 1, 2, updated_at=int(time.time()))
+
+        response = self.client.get('/api/roadtrips')
+        data = json.loads(response.data.decode('utf-8'))
+        assert_payload_field_type_value(
+            self, data['results'][0], 'travel_time', str, '2 hours')
+        self.assertEqual([], mock_requests.method_calls)
+
+
+class RecomputeRoutesTest(TripRoutesTest):
+    @patch('api.services.location.requests.get')
+    def test_refreshes_stale_trips_only(self, mock_get):
+        mock_get.return_value = _mapquest_route()
+        now = int(time.time())
+        fresh = self.trip('fresh', 0, 1, updated_at=now)
+        old = self.trip('old', 1, 2, updated_at=now - 10 * 24 * 3600)
+        missing = self.trip('missing', 2, 0)
+        same_pair = self.trip('missing too', 2, 0)
+
+        updated = LocationService.recompute_trip_routes(
+            concurrency=4, max_age=24 * 3600)
+
+        self.assertEqual(3, updated)
+        self.assertEqual(2, mock_get.call_count)
+        db.session.expire_all()
+        self.assertEqual('2 hours', RoadTrip.query.get(fresh.id).travel_time)
+        for trip in (old, missing, same_pair):
+            trip = RoadTrip.query.get(trip.id)
+            self.assertEqual('1 hour, 23 minutes', trip.travel_time)
+            self.assertGreaterEqual(trip.route_updated_at, now)
+        self.assertEqual(2, Route.query.count())
+
+    @patch('api.services.location.requests.get')
+    def test_reuses_stored_routes(self, mock_get):
+        Route.save(Route(self.cities[2], self.cities[0],
+                         travel_time='1 hour', seconds=3600,
+                         fetched_at=int(time.time())))
+        trip = self.trip('missing', 2, 0)
+
+        self.assertEqual(1, LocationService.recompute_trip_routes())
+        self.assertEqual(0, mock_get.call_count)
+        db.session.expire_all()
+        self.assertEqual(3600, RoadTrip.query.get(trip.id).travel_seconds)
+
+    @patch('api.services.location.requests')
+    def test_trips_with_stops_sum_their_legs(self, mock_requests):
+        now = int(time.time())
+        for start, end, seconds in ((0, 2, 1000), (2, 1, 800), (0, 1, 600)):
+            Route.save(Route(self.cities[start], self.cities[end],
+                             travel_time='stored', seconds=seconds,
+                             fetched_at=now))
+        direct = self.trip('direct', 0, 1)
+        detour = self.trip('detour', 0, 1)
+        detour.set_stops([self.cities[2]])
+        detour.update()
+
+        self.assertEqual(2, LocationService.recompute_trip_routes())
+        self.assertEqual([], mock_requests.method_calls)
+        db.session.expire_all()
+        self.assertEqual(600, RoadTrip.query.get(direct.id).travel_seconds)
+        self.assertEqual(1800, RoadTrip.query.get(detour.id).travel_seconds)
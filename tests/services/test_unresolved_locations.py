@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+from api import create_app, db, metrics
+from api.database.models import City
+from api.database.registry import city_registry
+from api.services.location import LocationService, unresolved
+from tests import db_drop_everything, assert_payload_field_type_value
+
+
+def _mapquest_address(quality, lat=39.78373, lng=-100.445882):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {
+        'results': [{'locations': [{
+            'geocodeQuality': quality,
+            'displayLatLng': {'lat': lat, 'lng': lng},
+        }]}]
+    }
+    return response
+
+
+class UnresolvedLocationTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+    @patch('api.services.location.requests.get')
+    def test_vague_result_is_not_found_and_remembered(self, mock_get):
+        mock_get.return_value = _mapquest_address('COUNTRY')
+
+        for _ in range(3):
+            latlng = LocationService.get_latlng('Qwzzrt', 'CO')
+            assert_payload_field_type_value(
+                self, latlng, 'success', bool, False)
+            assert_payload_field_type_value(
+                self, latlng, 'error', str, 'location not found')
+
+        self.assertEqual(1, mock_get.call_count)
+        self.assertEqual(0, City.query.count())
+        self.assertEqual(2, metrics.snapshot()['unresolved_locations']['hits'])
+
+    @patch('api.services.location.requests.get')
+    def test_rejected_input_is_remembered(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=400)
+
+        LocationService.get_latlng('%%%', 'CO')
+        latlng = LocationService.get_latlng('%%%', 'co')
+        assert_payload_field_type_value(self, latlng, 'success', bool, False)
+        self.assertEqual(1, mock_get.call_count)
+
+    @patch('api.services.location.requests.get')
+    def test_city_result_is_stored(self, mock_get):
+        mock_get.return_value = _mapquest_address('CITY', 39.8, -105.08)
+
+        latlng = LocationService.get_latlng('Arvada', 'CO')
+        assert_payload_field_type_value(self, latlng, 'success', bool, True)
+        self.assertEqual(0, len(unresolved))
+
+    @patch('api.services.location.requests.get')
+    def test_stored_city_clears_entry(self, mock_get):
+        mock_get.return_value = _mapquest_address('STATE')
+        LocationService.get_latlng('Arvada', 'CO')
+        self.assertEqual(1, len(unresolved))
+
+        city_registry.add(City.upsert('Arvada', 'CO', 39.8, -105.08))
+        self.assertEqual(0, len(unresolved))
+        latlng = LocationService.get_latlng('Arvada', 'CO')
+        assert_payload_field_type_value(self, latlng, 'success', bool, True)
+        self.assertEqual(1, mock_get.call_count)
@@ -0,0 +1,144 @@
+import json
+import itertools
+import unittest
+from unittest.mock import patch, MagicMock
+
+from api import create_app, db
+from api.database.models import City, RoadTrip
+from api.database.registry import city_registry
+from api.services.location import LocationService
+from api.services.writebehind import CityWriteBehind
+from tests import db_drop_everything, assert_payload_field_type_value
+
+
+class _TestWriteBehind(CityWriteBehind):
+    """
+    hands out ids from a counter so SQLite can stand in for PostgreSQL
+    """
+    def __init__(self, **kwargs):
+        super().__init__(enabled=True, interval=0, **kwargs)
+        self._counter = itertools.count(1000)
+
+    def active(self):
+        return True
+
+    def _reserve_ids(self, count):
+        return [next(self._counter) for _ in range(count)]
+
+
+def _mapquest_city(lat, lng):
+    response = MagicMock(status_code=200)
+    response.json.return_value = {
+        'results': [{'locations': [{
+            'geocodeQuality': 'CITY',
+            'displayLatLng': {'lat': lat, 'lng': lng},
+        }]}]
+    }
+    return response
+
+
+class WriteBehindTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.writer = _TestWriteBehind(batch_size=2)
+
+    def tearDown(self):
+        db.session.remove()
+        db_drop_everything(db)
+        self.app_context.pop()
+
+    def test_staged_city_is_served_before_insert(self):
+        record = self.writer.stage('arvada', 'co', 39.8, -105.08)
+        self.assertEqual((1000, 'Arvada', 'CO'), record[:3])
+        self.assertEqual(0, City.query.count())
+        self.assertEqual(record, city_registry.find('Arvada', 'CO'))
+        self.assertEqual(record,
+                         self.writer.stage('Arvada', 'CO', 39.8, -105.08))
+
+    def test_flush_inserts_in_batches_with_staged_ids(self):
+        for name in ('Arvada', 'Denver', 'Golden'):
+            self.writer.stage(name, 'CO', 39.8, -105.1)
+        self.assertEqual(3, self.writer.flush())
+        self.assertEqual(2, self.writer.batches)
+        self.assertEqual(['Arvada', 'Denver', 'Golden'],
+                         [City.query.get(i).name for i in (1000, 1001, 1002)])
+        self.assertEqual(0, self.writer.stats()['pending'])
+
+    def test_persist_flushes_pending_city(self):
+        record = self.writer.stage('Arvada', 'CO', 39.8, -105.08)
+        self.assertEqual(record.id, self.writer.persist(record.id))
+        self.assertIsNotNone(City.query.get(record.id))
+        self.assertEqual(1, self.writer.batches)
+        self.writer.persist(record.id)
+        self.assertEqual(1, self.writer.batches)
+
+    def test_city_stored_elsewhere_first_is_remapped(self):
+        record = self.writer.stage('Arvada', 'CO', 39.8, -105.08)
+        stored = City(name='Arvada', state='CO', lat=39.8, lng=-105.08)
+        stored.insert()
+
+        self.assertEqual(stored.id, self.writer.persist(record.id))
+        self.assertEqual(1, self.writer.conflicts)
+        self.assertEqual(1, City.query.count())
+        self.assertEqual(stored.id, city_registry.find('Arvada', 'CO').id)
+
+    @patch('api.services.location.requests.get')
+    def test_get_latlng_does_not_write(self, mock_get):
+        mock_get.return_value = _mapquest_city(39.8, -105.08)
+        with patch('api.services.location.city_writer', self.writer):
+            latlng = LocationService.get_latlng('Arvada', 'CO')
+
+        assert_payload_field_type_value(self, latlng, 'success', bool, True)
+        assert_payload_field_type_value(self, latlng, 'id', int, 1000)
+        self.assertEqual(0, City.query.count())
+
+    @patch('api.services.location.requests.get')
+    def test_get_latlng_writes_while_holding_advisory_lock(self, mock_get):
+        mock_get.return_value = _mapquest_city(39.8, -105.08)
+        with patch('api.services.location.city_writer', self.writer), \
+                patch('api.services.location.advisory_lock') as mock_lock:
+            mock_lock.return_value.__enter__.return_value = True
+            latlng = LocationService.get_latlng('Arvada', 'CO')
+
+        # workers waiting on the lock look for the row in the table
+        self.assertEqual(1, City.query.count())
+        self.assertEqual(latlng['id'], City.query.one().id)
+
+    @patch('api.services.location.requests.get')
+    @patch('api.auth.auth.verify_decode_jwt')
+    @patch('api.auth.auth.get_token_auth_header')
+    def test_roadtrip_keeps_staged_ids(
+            self, mock_get_token_auth_header, mock_verify_decode_jwt,
+            mock_get):
+        mock_get_token_auth_header.return_value = 'tripper-token'
+        mock_verify_decode_jwt.return_value = {
+            'permissions': ['create:roadtrips']
+        }
+        route = MagicMock(status_code=200)
+        route.json.return_value = {'route': {
+            'formattedTime': '00:20:00', 'time': 1200, 'distance': 9.2
+        }}
+        mock_get.side_effect = [_mapquest_city(39.8, -105.08),
+                                _mapquest_city(39.74, -104.99), route]
+
+        with patch('api.services.location.city_writer', self.writer), \
+                patch('api.resources.roadtrips.city_writer', self.writer):
+            arvada = LocationService.get_latlng('Arvada', 'CO')
+            response = self.client.post(
+                '/api/roadtrips', json={
+                    'name': 'commute',
+                    'start_city': 'Arvada, CO',
+                    'end_city': 'Denver, CO',
+                }, content_type='application/json'
+            )
+        self.assertEqual(201, response.status_code)
+
+        data = json.loads(response.data.decode('utf-8'))
+        trip = RoadTrip.query.get(data['id'])
+        self.assertEqual(arvada['id'], trip.start_city_id)
+        self.assertEqual(1001, trip.end_city_id)
+        self.assertEqual(2, City.query.count())